@@ -1,25 +1,51 @@
 import sys
 import time
-import serial
-import csv
-import random
 from PyQt5 import QtWidgets, QtCore, QtGui
 from PyQt5.QtWidgets import QPushButton, QLineEdit, QGridLayout
 
 import pyqtgraph as pg
 from PyQt5.QtCore import QThread, pyqtSignal
-import os.path
+import numpy as np
+
+from acquisition import open_stream
+from cues import REST, CueEngine, cue_text, cycle_protocol
+from history_view import HistoryView, channel_color
+from instrumentation import Stats
+from recorder import SessionRecorder, new_session_path
+from ringbuffer import RingBuffer
+from session import Session
+
+# 'auto' picks the first USB serial port that looks like the board, or give
+# a device ('/dev/cu.SLAB_USBtoUART', 'COM3'), 'synthetic://?rate=100&channels=3'
+# or 'replay://saves/<session>.emg' (see transport.py)
+SERIAL_PORT = 'auto'
+BAUDRATE = 9600
+SERIAL_PROTOCOL = 'ascii'  # 'binary' for boards sending framed packets (see protocol.py)
+SAMPLE_RATE = 100  # Hz
+# Everything below (live plots, recorder, history) follows these, e.g. 8
+# for the ADS1299 wristband. Names default to ch1..chN
+N_CHANNELS = 3
+CHANNEL_NAMES = None
+LIVE_COLUMNS = 4  # live plots are tiled this many to a row
+
+DISPLAY_SECONDS = 2
+PLOT_FPS = 60
+CUE_POLL_MS = 20
+SAVE_DIR = './saves'
 
 
 class DataGenerator(QThread):
-    # 3 source data 
-    new_data = pyqtSignal(int, int, int)
+    # (n_samples, n_channels) blocks, the GUI redraws on its own timer
+    new_data = pyqtSignal(object)
     
-    def __init__(self, dummy_mode=True):
+    def __init__(self, dummy_mode=True, stats=None, n_channels=N_CHANNELS):
         super().__init__()
+        self.n_channels = n_channels
         self.recordingStarted = False
-        self.recordedData = []
+        self.recorder = None
         self.dummy_mode = dummy_mode
+        self.stats = Stats() if stats is None else stats
+        self.reader = None
         self._running = True
 
     def run(self):
@@ -29,48 +55,47 @@ class DataGenerator(QThread):
             self.read_serial_data()
 
     def generate_dummy_data(self):
+        # Rest around 50 * channel, bursts around 1000 + 500 * channel, one
+        # row for all channels at a time
+        offsets = np.arange(self.n_channels)
         while self._running:
-            start_time = time.time()
-            while time.time() - start_time < 5 and self._running:
-                v1 = random.randint(0, 100)
-                v2 = random.randint(50, 150)
-                v3 = random.randint(100, 200)
-                self.new_data.emit(v1, v2, v3)
-                if self.recordingStarted:
-                    self.recordedData.append([v1, v2, v3])
-                time.sleep(0.01)
-            
-            start_time = time.time()
-            while time.time() - start_time < 2.5 and self._running:
-                v1 = random.randint(1000, 2000)
-                v2 = random.randint(1500, 2500)
-                v3 = random.randint(2000, 3000)
-                self.new_data.emit(v1, v2, v3)
-                if self.recordingStarted:
-                    self.recordedData.append([v1, v2, v3])
-                time.sleep(0.01)
+            for seconds, low, spread in ((5, 50 * offsets, 100), (2.5, 1000 + 500 * offsets, 1000)):
+                start_time = time.time()
+                while time.time() - start_time < seconds and self._running:
+                    samples = np.random.randint(low, low + spread)[None]
+                    self.new_data.emit(samples)
+                    self.record(samples)
+                    time.sleep(0.01)
 
     def read_serial_data(self):
-        #! PATH currently for MacOS Silicon
-        #! PATH might need to be changed for Windows machines.
-
-        try:
-            ser = serial.Serial('/dev/cu.SLAB_USBtoUART', 9600, timeout=1)
-        except Exception as e:
-            print(f"Serial port not available: {e}. Using dummy data.")
+        # The port lives in its own process so plotting can't stall reads
+        acq, reader = open_stream(SERIAL_PORT, BAUDRATE, n_channels=self.n_channels, sample_rate=SAMPLE_RATE,
+                                  protocol=SERIAL_PROTOCOL)
+        if reader is None:
+            print("Serial port not available. Using dummy data.")
             self.generate_dummy_data()
             return
+        self.reader = reader
         while self._running:
-            if ser.in_waiting:
-                line = ser.readline().decode().strip()
-                try:
-                    values = list(map(int, line.split(',')))
-                    if len(values) == 3:
-                        self.new_data.emit(*values)
-                        if self.recordingStarted:
-                            self.recordedData.append(values)
-                except Exception as e:
-                    print(f"Error: {e}")
+            with self.stats.time('read'):
+                samples = reader.read()
+            if len(samples) == 0:
+                time.sleep(0.005)
+                continue
+            self.new_data.emit(samples)
+            # Stamped with when the acquisition process received them, not when we got here
+            self.record(samples, reader.times(reader.last_start, len(samples)))
+        self.reader = None
+        reader.close()
+        if acq is not None:
+            acq.stop()
+
+    def record(self, samples, timestamps=None):
+        # Streamed straight to disk, the recorder ignores writes once closed
+        recorder = self.recorder
+        if self.recordingStarted and recorder is not None:
+            with self.stats.time('record'):
+                recorder.write(samples, timestamps)
 
     def stop(self):
         self._running = False
@@ -152,33 +177,41 @@ class LiveGraph(QtWidgets.QMainWindow):
         self.fps_label = QtWidgets.QLabel()
         self.fps_label.setStyleSheet("color: red; font-size: 20px;")
         control_layout.addWidget(self.fps_label)
+
+        # Stage latencies (p50/p99) and acquisition counters, once a second
+        self.stats_label = QtWidgets.QLabel()
+        self.stats_label.setWordWrap(True)
+        self.stats_label.setStyleSheet("font-size: 11px;")
+        control_layout.addWidget(self.stats_label)
         
-        # Graph Layout
-        graphs_layout = QtWidgets.QHBoxLayout()
-        left_layout.addLayout(graphs_layout)
+        # Graph Layout, one tile per channel in a single widget so a frame
+        # is one repaint however many channels there are
+        self.channel_names = list(CHANNEL_NAMES or [f"ch{i + 1}" for i in range(N_CHANNELS)])
+        self.graphs = pg.GraphicsLayoutWidget()
+        self.graphs.setBackground('w')
+        left_layout.addWidget(self.graphs)
         
-        self.plot_widgets = []
-        for i, color in enumerate(['b', 'r', 'g']):
-            pw = pg.PlotWidget()
-            pw.setBackground('w')
-            pw.setYRange(-10, 3000)
-            pw.plotItem.showGrid(True, True, 0.2)
-            self.plot_widgets.append(pw)
-            graphs_layout.addWidget(pw)
-            pw.plot(pen=pg.mkPen(color=color, width=2))
+        self.curves = []
+        for i, name in enumerate(self.channel_names):
+            plot = self.graphs.addPlot(row=i // LIVE_COLUMNS, col=i % LIVE_COLUMNS, title=name)
+            plot.setYRange(-10, 3000)
+            plot.showGrid(True, True, 0.2)
+            # Min/max decimation down to the pixel width, only the visible range
+            plot.setDownsampling(auto=True, mode='peak')
+            plot.setClipToView(True)
+            if self.curves:
+                plot.setXLink(self.graphs.getItem(0, 0))
+            self.curves.append(plot.plot(pen=pg.mkPen(color=channel_color(i), width=2), skipFiniteCheck=True))
 
         # Real-time Graphs
         realtime_graphs = QtWidgets.QHBoxLayout()
         main_layout.addLayout(realtime_graphs)
 
-        # History Graph
-        self.history_plot = pg.PlotWidget()
-        self.history_plot.setBackground('w')
-        self.history_plot.setYRange(-10, 3000)
-        self.history_plot.plotItem.showGrid(True, True, 0.2)
+        # History Graph, the whole recording so far at screen resolution,
+        # scroll to zoom and drag to pan
+        self.history_plot = HistoryView()
         self.history_plot.setMinimumHeight(250)
         left_layout.addWidget(self.history_plot)
-        self.history_plot_segments = 0
         
         # Right side: Command Panel
         self.command_panel = QtWidgets.QWidget()
@@ -240,14 +273,26 @@ class LiveGraph(QtWidgets.QMainWindow):
         self.show_overlay.connect(self.overlay_widget.show)
         self.hide_overlay.connect(self.overlay_widget.hide)
         
-        self.data = [[0]*200 for _ in range(3)]
-        self.data_generator = DataGenerator(dummy_mode=True)
-        self.data_generator.new_data.connect(self.update_plots)
+        # The live data model: the newest DISPLAY_SECONDS of every channel
+        n_channels = len(self.channel_names)
+        self.data = RingBuffer(DISPLAY_SECONDS * SAMPLE_RATE, n_channels)
+        self.data.extend(np.zeros((self.data.capacity, n_channels)))
+        self.stats = Stats()
+        self.data_generator = DataGenerator(dummy_mode=True, stats=self.stats, n_channels=n_channels)
+        self.data_generator.new_data.connect(self.add_samples)
         self.data_generator.start()
         
         self.frame_count = 0
+        self.sample_count = 0
+        self.plots_dirty = False
         self.cur_time = time.time()
+        self.plot_timer = QtCore.QTimer(self)
+        self.plot_timer.timeout.connect(self.update_plots)
+        self.plot_timer.start(1000 // PLOT_FPS)
         self.countdown_running = False
+        self.cue_engine = None
+        self.cue_timer = QtCore.QTimer(self)
+        self.cue_timer.timeout.connect(lambda: self.cue_engine.poll())
 
     def resizeEvent(self, event):
         self.overlay_widget.setGeometry(0, 0, self.width(), self.height())
@@ -255,14 +300,8 @@ class LiveGraph(QtWidgets.QMainWindow):
 
     def start_muscles(self):
         if self.countdown_running:
-            # Stop the countdown
-            self.countdown_running = False
-            self.update_button.emit("Start Muscles")
-            self.update_instruction.emit("Instructions:\n- Raise your hand\n- Lower your hand")
-            try:
-                self.hide_overlay.emit()
-            except RuntimeError:
-                pass
+            # Stop the countdown, on_cue tidies up
+            self.cue_engine.stop()
         else:
             # Start the countdown
             mode = self.mode_dropdown.currentText()
@@ -277,69 +316,32 @@ class LiveGraph(QtWidgets.QMainWindow):
             
             self.countdown_running = True
             self.update_button.emit("Stop Muscles")
-            
-            # Start the countdown in a separate thread
-            import threading
-            threading.Thread(target=self.run_countdown, args=(mode, cycle_duration, num_cycles, num_sets, rest_time), daemon=True).start()
-
-    def run_countdown(self, mode, cycle_duration, num_cycles, num_sets, rest_time):
-        try:
             self.show_overlay.emit()
-        except RuntimeError:
-            return
-        
-        # Define texts based on mode
-        if mode == "Finger Extension/Flexion":
-            open_text = "Open palm"
-            close_text = "Close palm"
-        elif mode == "Supination/Pronation":
-            open_text = "Supinate"
-            close_text = "Pronate"
+
+            # Scheduled up front and polled from a timer, so the acquisition
+            # thread never waits on the cues
+            self.cue_engine = CueEngine(cycle_protocol(mode, cycle_duration, num_cycles, num_sets, rest_time))
+            self.cue_engine.listeners.append(self.on_cue)
+            self.cue_engine.start()
+            self.cue_timer.start(CUE_POLL_MS)
+
+    def on_cue(self, event):
+        # Runs on the GUI thread from the cue timer
+        recorder = self.data_generator.recorder
+        if event.kind == 'phase':
+            if recorder is not None:
+                recorder.set_label(event.phase.label, event.phase.name, at=event.t)
+            self.overlay_label.setText(cue_text(event))
+        elif event.kind == 'tick':
+            self.overlay_label.setText(cue_text(event))
         else:
-            open_text = "Action 1"
-            close_text = "Action 2"
-        
-        for set_num in range(num_sets):
-            for cycle in range(num_cycles):
-                if not self.countdown_running:
-                    break
-
-                for i in range(cycle_duration, 0, -1):
-                    if not self.countdown_running:
-                        break
-                    try:
-                        self.overlay_label.setText(f"{open_text} {i}")
-                    except RuntimeError:
-                        return
-                    time.sleep(1)
-                if not self.countdown_running:
-                    break
-
-                for i in range(cycle_duration, 0, -1):
-                    if not self.countdown_running:
-                        break
-                    try:
-                        self.overlay_label.setText(f"{close_text} {i}")
-                    except RuntimeError:
-                        return
-                    time.sleep(1)
-            if set_num < num_sets - 1 and self.countdown_running:
-                # Rest phase between sets
-                for i in range(rest_time, 0, -1):
-                    if not self.countdown_running:
-                        break
-                    try:
-                        self.overlay_label.setText(f"Rest {i}")
-                    except RuntimeError:
-                        return
-                    time.sleep(1)
-        try:
+            if recorder is not None:
+                recorder.set_label(REST, 'rest', at=event.t)
+            self.cue_timer.stop()
             self.hide_overlay.emit()
             self.update_instruction.emit("Instructions:\n- Raise your hand\n- Lower your hand")
             self.update_button.emit("Start Muscles")
-        except RuntimeError:
-            pass
-        self.countdown_running = False
+            self.countdown_running = False
 
     def toggle_data_source(self):
         was_recording = self.data_generator.recordingStarted
@@ -348,8 +350,10 @@ class LiveGraph(QtWidgets.QMainWindow):
         
         self.data_generator.stop()
         new_mode = not self.data_generator.dummy_mode
-        self.data_generator = DataGenerator(dummy_mode=new_mode)
-        self.data_generator.new_data.connect(self.update_plots)
+        recorder = self.data_generator.recorder
+        self.data_generator = DataGenerator(dummy_mode=new_mode, stats=self.stats, n_channels=self.data.n_channels)
+        self.data_generator.recorder = recorder
+        self.data_generator.new_data.connect(self.add_samples)
         self.data_generator.start()
         
         if was_recording:
@@ -361,6 +365,13 @@ class LiveGraph(QtWidgets.QMainWindow):
         self.toggle_source_btn.setText(btn_text)
 
     def toggle_recording(self):
+        if self.data_generator.recorder is None:
+            recorder = SessionRecorder(new_session_path(SAVE_DIR), SAMPLE_RATE, self.channel_names)
+            engine = self.cue_engine
+            if engine is not None and engine.running and engine.current is not None:
+                # Cues already running, pick up the current phase
+                recorder.set_label(engine.current.label, engine.current.name, at=engine.phase_start)
+            self.data_generator.recorder = recorder
         self.data_generator.recordingStarted = not self.data_generator.recordingStarted
         if self.data_generator.recordingStarted:
             self.record_btn.setText("Stop Recording")
@@ -372,58 +383,51 @@ class LiveGraph(QtWidgets.QMainWindow):
             self.status_label.setText("Not Recording")
             self.status_label.setStyleSheet("color: red;")
             
-            hist_data = self.data_generator.recordedData.copy()
-            self.plot_history_data(hist_data)
+            recorder = self.data_generator.recorder
+            recorder.flush()
+            self.history_plot.set_session(Session(recorder.path))
 
     def save_data(self):
         if self.data_generator.recordingStarted:
             self.toggle_recording()
 
-        # Save current recording
-        save_path = './saves'
-        filename = time.strftime("%Y-%m-%d_%H-%M-%S.csv")
-        complete_path = os.path.join(save_path, filename)
-        saved_data = self.data_generator.recordedData.copy()
-        
-        with open(complete_path, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerows(saved_data)
+        # Samples are already on disk, just finish the session file
+        recorder = self.data_generator.recorder
+        self.data_generator.recorder = None
+        if recorder is not None:
+            recorder.close()
+            print(f"Saved {recorder.n_samples} samples to {recorder.path}")
         
         # Clear temporary data
-        self.history_plot_segments = 0
-        self.data_generator.recordedData = []
-        self.history_plot.clear()
-
-    def update_plots(self, v1, v2, v3):
-        for i, value in enumerate([v1, v2, v3]):
-            self.data[i] = self.data[i][1:] + [value]
-            self.plot_widgets[i].plotItem.listDataItems()[0].setData(self.data[i])
-        
-        self.frame_count += 1
+        self.history_plot.clear_data()
+
+    def add_samples(self, samples):
+        self.data.extend(samples)
+        self.sample_count += len(samples)
+        self.plots_dirty = True
+
+    def update_plots(self):
+        if self.plots_dirty:
+            with self.stats.time('redraw'):
+                data = self.data.latest()
+                for i, curve in enumerate(self.curves):
+                    curve.setData(data[:, i])
+            self.plots_dirty = False
+            self.frame_count += 1
+
         update_time = time.time()
         if update_time - self.cur_time >= 1.0:
             fps = self.frame_count / (update_time - self.cur_time)
-            self.fps_label.setText(f"FPS: {int(fps)}")
+            rate = self.sample_count / (update_time - self.cur_time)
+            self.fps_label.setText(f"FPS: {int(fps)}  {int(rate)} Hz")
+            reader = self.data_generator.reader
+            if reader is not None:
+                reader.update_stats(self.stats)
+            self.stats_label.setText(self.stats.summary().replace("  ", "\n"))
+            self.stats.reset()
             self.cur_time = update_time
             self.frame_count = 0
-
-    def plot_history_data(self, data):
-        if not data:
-            return
-        
-        # Split data into channels
-        x = list(range(len(data)))
-        ch1 = [d[0] for d in data]
-        ch2 = [d[1] for d in data]
-        ch3 = [d[2] for d in data]
-        
-        # Plot all three channels
-        self.history_plot.plot(x, ch1, pen='b')
-        self.history_plot.plot(x, ch2, pen='r')
-        self.history_plot.plot(x, ch3, pen='g')
-
-        self.history_plot.addLegend()
-        self.history_plot_segments+=1
+            self.sample_count = 0
 
     def keyPressEvent(self, event):
         if event.key() == QtCore.Qt.Key_1:
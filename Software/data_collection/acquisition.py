@@ -0,0 +1,372 @@
+"""
+Acquisition worker that owns the serial port in its own process.
+
+Samples are published into a RingBuffer that lives in a
+multiprocessing.shared_memory block, so the GUI, the inference loop and the
+recorder can all read the stream without sharing a GIL with the port.
+
+Block layout: a header of int64 slots (see below) followed by the mirrored
+(2 * capacity, n_channels) float32 sample array.
+
+There is no lock. The writer bumps PENDING before it starts writing a block
+and COUNT once the block is in place, readers copy what they need and then
+check PENDING to find out if the writer lapped them during the copy.
+"""
+import multiprocessing as mp
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from instrumentation import Stats, StatsLogger
+from ringbuffer import RingBuffer
+
+RING_NAME = 'emg_fabric_ring'
+
+# Header slots
+COUNT = 0
+PENDING = 1
+CAPACITY = 2
+N_CHANNELS = 3
+SAMPLE_RATE = 4
+BAD_FRAMES = 5
+SEQ_GAPS = 6
+RUNNING = 7  # 0 starting, 1 running, -1 stopped or failed
+FRAMES = 8
+SKIPPED_BYTES = 9
+READ_P99_US = 10
+DECODE_P99_US = 11
+START_NS = 12  # host time of sample 0, ns since the epoch
+DRIFT_PPB = 13  # largest clock drift between nodes
+ALIGN_GAPS = 14
+HEADER_SLOTS = 16
+HEADER_SIZE = HEADER_SLOTS * 8
+
+SAMPLE_DTYPE = np.float32
+
+
+def _attach(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    # Otherwise this process' resource tracker unlinks the block when we
+    # exit, pulling it out from under the acquisition process
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def _views(shm):
+    header = np.ndarray((HEADER_SLOTS,), dtype=np.int64, buffer=shm.buf)
+    capacity = int(header[CAPACITY])
+    n_channels = int(header[N_CHANNELS])
+    data = np.ndarray((2 * capacity, n_channels), dtype=SAMPLE_DTYPE, buffer=shm.buf, offset=HEADER_SIZE)
+    return header, data
+
+
+class SharedRing(RingBuffer):
+    """Writer side. Only the acquisition process should create one of these."""
+    def __init__(self, shm):
+        self.shm = shm
+        self.header, data = _views(shm)
+        super().__init__(int(self.header[CAPACITY]), int(self.header[N_CHANNELS]), data=data)
+
+    @property
+    def count(self):
+        return int(self.header[COUNT])
+
+    @count.setter
+    def count(self, value):
+        self.header[COUNT] = value
+
+    def append(self, sample):
+        self.extend(np.reshape(sample, (1, self.n_channels)))
+
+    def extend(self, block):
+        block = np.reshape(block, (-1, self.n_channels))
+        self.header[PENDING] = self.count + len(block)
+        super().extend(block)
+
+
+class RingReader:
+    """
+    Reader side, any number of these can be attached. Each one keeps its own
+    read position, read() returns copies so the writer can keep going.
+    """
+    def __init__(self, name=RING_NAME, shm=None):
+        self._owns_shm = shm is None
+        self.shm = _attach(name) if shm is None else shm
+        self.header, self.data = _views(self.shm)
+        self.capacity = int(self.header[CAPACITY])
+        self.n_channels = int(self.header[N_CHANNELS])
+        self.sample_rate = int(self.header[SAMPLE_RATE])
+        self.read_pos = self.count
+        self.last_start = self.read_pos
+        self.dropped = 0
+
+    @property
+    def count(self):
+        return int(self.header[COUNT])
+
+    @property
+    def start_time(self):
+        return self.header[START_NS] / 1e9
+
+    def times(self, start, n):
+        """Host timestamps (seconds) of samples start .. start + n, e.g. times(reader.last_start, len(block))."""
+        return self.start_time + (start + np.arange(n)) / self.sample_rate
+
+    @property
+    def running(self):
+        return bool(self.header[RUNNING] == 1)
+
+    def _copy(self, start, stop):
+        end = stop % self.capacity + self.capacity
+        block = self.data[end - (stop - start):end].copy()
+        # Anything the writer may have touched while we were copying is stale
+        clobbered = int(self.header[PENDING]) - self.capacity - start
+        if clobbered > 0:
+            block = block[clobbered:]
+        return block
+
+    def read(self):
+        """All samples written since the last read, as an (n, n_channels) copy."""
+        count = self.count
+        if count < self.read_pos:
+            # Writer was restarted
+            self.read_pos = 0
+        start = max(self.read_pos, count - self.capacity)
+        block = self._copy(start, count)
+        self.dropped += count - self.read_pos - len(block)
+        self.last_start = count - len(block)
+        self.read_pos = count
+        return block
+
+    def update_stats(self, stats):
+        """Copy the acquisition process' counters into a Stats as gauges."""
+        stats.set('dropped_samples', self.dropped)
+        stats.set('frames', int(self.header[FRAMES]))
+        stats.set('bad_frames', int(self.header[BAD_FRAMES]))
+        stats.set('seq_gaps', int(self.header[SEQ_GAPS]))
+        stats.set('skipped_bytes', int(self.header[SKIPPED_BYTES]))
+        stats.set('acq_read_p99_ms', self.header[READ_P99_US] / 1000)
+        stats.set('acq_decode_p99_ms', self.header[DECODE_P99_US] / 1000)
+        stats.set('align_gaps', int(self.header[ALIGN_GAPS]))
+        stats.set('drift_ppm', self.header[DRIFT_PPB] / 1000)
+
+    def latest(self, n):
+        """Copy of the newest n samples, doesn't move the read position."""
+        count = self.count
+        n = min(n, count, self.capacity)
+        return self._copy(count - n, count)
+
+    def close(self):
+        if self._owns_shm:
+            self.shm.close()
+
+
+def ring_running(name=RING_NAME):
+    """True if some acquisition process is already publishing under `name`."""
+    try:
+        shm = _attach(name)
+    except FileNotFoundError:
+        return False
+    running = np.ndarray((HEADER_SLOTS,), dtype=np.int64, buffer=shm.buf)[RUNNING] == 1
+    shm.close()
+    return bool(running)
+
+
+def _publish_stats(header, decoder, stats):
+    header[FRAMES] = decoder.frames
+    header[BAD_FRAMES] = decoder.bad_frames
+    header[SEQ_GAPS] = decoder.seq_gaps
+    header[SKIPPED_BYTES] = decoder.skipped_bytes
+    header[READ_P99_US] = int(stats.stages['read'].percentile(99) * 1e6)
+    header[DECODE_P99_US] = int(stats.stages['decode'].percentile(99) * 1e6)
+
+
+class _AlignedStream:
+    """Feeds timestamped frames from several nodes through a StreamAligner."""
+    def __init__(self, aligner, decoder):
+        self.aligner = aligner
+        self.decoder = decoder
+
+    def process(self, samples):
+        now = time.time()
+        nodes = self.decoder.nodes
+        for node in self.aligner.nodes:
+            mask = nodes == node
+            if mask.any():
+                self.aligner.push(node, samples[mask], now, timestamps=self.decoder.timestamps[mask])
+        times, block = self.aligner.pull()
+        return (times[0] if len(times) else None), block
+
+
+def make_decoder(protocol, n_channels, sample_rate, nodes=None):
+    """
+    (decoder, aligned) for a protocol. aligned is None except for
+    'timestamped', where its process(samples) turns the decoded frames of
+    all nodes into (host time of the first sample, aligned block).
+    """
+    from protocol import AsciiLineDecoder, FrameDecoder
+
+    if protocol == 'timestamped':
+        from alignment import StreamAligner
+
+        nodes = nodes or [0]
+        per_node = n_channels // len(nodes)
+        decoder = FrameDecoder(per_node, timestamped=True)
+        aligner = StreamAligner(sample_rate, {node: per_node for node in nodes})
+        return decoder, _AlignedStream(aligner, decoder)
+    if protocol == 'binary':
+        return FrameDecoder(n_channels), None
+    return AsciiLineDecoder(n_channels), None
+
+
+def _acquire(name, port, baudrate, n_channels, protocol, stats_path=None, nodes=None):
+    # Imported here so readers don't pay for pyserial
+    from protocol import FrameReader
+    from transport import open_transport
+
+    shm = shared_memory.SharedMemory(name=name)
+    ring = SharedRing(shm)
+    try:
+        ser = open_transport(port, baudrate, timeout=0.05, n_channels=n_channels, protocol=protocol)
+    except Exception as e:
+        print(f"Error connecting to serial port: {e}")
+        ring.header[RUNNING] = -1
+        shm.close()
+        return
+
+    decoder, aligned = make_decoder(protocol, n_channels, int(ring.header[SAMPLE_RATE]), nodes)
+    stats = Stats()
+    logger = StatsLogger(stats, stats_path) if stats_path else None
+    reader = FrameReader(ser, decoder, stats)
+    ring.header[RUNNING] = 1
+    last_publish = time.time()
+    try:
+        while ring.header[RUNNING] == 1:
+            samples, seq = reader.read()
+            if aligned is not None and len(samples):
+                with stats.time('align'):
+                    first, samples = aligned.process(samples)
+                if first is not None and ring.header[START_NS] == 0:
+                    ring.header[START_NS] = int(first * 1e9)
+            elif len(samples) and ring.header[START_NS] == 0:
+                # No device clock, sample 0 is as old as the block says
+                ring.header[START_NS] = time.time_ns() - int(len(samples) / ring.header[SAMPLE_RATE] * 1e9)
+            if len(samples):
+                with stats.time('publish'):
+                    ring.extend(samples)
+            if time.time() - last_publish >= 0.5:
+                _publish_stats(ring.header, decoder, stats)
+                if aligned is not None:
+                    ring.header[DRIFT_PPB] = int(aligned.aligner.relative_drift_ppm() * 1000)
+                    ring.header[ALIGN_GAPS] = aligned.aligner.gaps
+                last_publish = time.time()
+                if logger is not None:
+                    logger.maybe_write()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.header[RUNNING] = -1
+        ser.close()
+        del ring
+        try:
+            shm.close()
+        except BufferError:
+            pass
+
+
+class AcquisitionProcess:
+    """
+    Starts the acquisition worker and owns the shared memory block.
+
+        acq = AcquisitionProcess('/dev/ttyUSB0', 115200, n_channels=8)
+        if acq.start():
+            reader = acq.reader()   # or RingReader() from another process
+
+    port is anything transport.open_transport() takes, e.g. 'auto' or
+    'synthetic://?rate=4000&channels=8' to run without a board.
+
+    protocol='timestamped' reads timestamped frames from the sender node
+    ids in `nodes`, each with n_channels // len(nodes) channels, and
+    publishes them aligned onto one timeline at sample_rate (alignment.py).
+    """
+    def __init__(self, port, baudrate=115200, n_channels=1, sample_rate=1000,
+                 capacity=1 << 16, protocol='binary', name=RING_NAME, stats_path=None, nodes=None):
+        self.name = name
+        size = HEADER_SIZE + 2 * capacity * n_channels * np.dtype(SAMPLE_DTYPE).itemsize
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            if ring_running(name):
+                raise FileExistsError(f"ring {name!r} belongs to a running acquisition process, "
+                                      "attach with RingReader or open_stream() instead") from None
+            # Left behind by a process that didn't shut down cleanly
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        header = np.ndarray((HEADER_SLOTS,), dtype=np.int64, buffer=self.shm.buf)
+        header[:] = 0
+        header[CAPACITY] = capacity
+        header[N_CHANNELS] = n_channels
+        header[SAMPLE_RATE] = sample_rate
+        self.header = header
+
+        self.process = mp.Process(target=_acquire, daemon=True,
+                                  args=(name, port, baudrate, n_channels, protocol, stats_path, nodes))
+
+    def start(self, timeout=5.0):
+        """Returns True once the worker has the port open."""
+        self.process.start()
+        start = time.time()
+        while self.header[RUNNING] == 0 and time.time() - start < timeout:
+            if not self.process.is_alive():
+                break
+            time.sleep(0.01)
+        return bool(self.header[RUNNING] == 1)
+
+    def reader(self):
+        return RingReader(self.name, shm=self.shm)
+
+    def stop(self):
+        if self.header[RUNNING] == 1:
+            self.header[RUNNING] = -1
+        if self.process.is_alive():
+            self.process.join(timeout=2.0)
+        del self.header
+        try:
+            # Fails if a reader in this process still holds views, the
+            # mapping goes away with the process anyway
+            self.shm.close()
+        except BufferError:
+            pass
+        if sys.version_info < (3, 13):
+            # A RingReader attached by name in this process unregistered the
+            # block, put it back so unlink() doesn't upset the tracker
+            resource_tracker.register(self.shm._name, 'shared_memory')
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def open_stream(port, baudrate=115200, n_channels=1, sample_rate=1000, protocol='binary', name=RING_NAME,
+                stats_path=None, nodes=None):
+    """
+    Attach to an acquisition process that is already running, or start one.
+    Returns (process, reader). process is None when attached to someone
+    else's, reader is None if the port couldn't be opened.
+    """
+    if ring_running(name):
+        print("Attaching to running acquisition process")
+        return None, RingReader(name)
+    acq = AcquisitionProcess(port, baudrate, n_channels, sample_rate, protocol=protocol, name=name,
+                             stats_path=stats_path, nodes=nodes)
+    if not acq.start():
+        acq.stop()
+        return None, None
+    return acq, acq.reader()
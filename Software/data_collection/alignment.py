@@ -0,0 +1,228 @@
+"""
+Putting several sensor nodes onto one timeline.
+
+Each ESP-NOW sender stamps its samples with its own microsecond clock. The
+clocks start at different times, run at slightly different rates and reach
+the receiver with varying radio delay. For every node NodeClock fits
+
+    host_time = offset + (1 + skew) * node_time
+
+through the earliest arrivals (the delay is never negative, so the
+smallest host - node difference in each interval is the best estimate of
+the true offset). skew is the node's drift against the host, negative when
+the node's clock runs fast; in ppm it is what drift_ppm reports.
+
+StreamAligner takes blocks from any node in any order, maps them to host
+time and linearly resamples every node onto one common grid at the target
+sample rate. pull() returns the grid points every node has data for, so the
+output is (n, total channels) with the same row meaning the same instant.
+A node that falls more than max_gap behind the newest one (silent, dead
+or never started) stops holding the others back: its channels repeat its
+last value (0 before it sent anything) until it catches up again.
+Frames without device timestamps can still be aligned, their clock is the
+unwrapped sequence number times the nominal sample period.
+"""
+import numpy as np
+
+from protocol import SEQ_MODULO, TIMESTAMP_MODULO
+
+
+class Unwrapper:
+    """Turns a wrapping counter (uint16 sequence, uint32 microseconds) into a monotonic int64."""
+    def __init__(self, modulo):
+        self.modulo = modulo
+        self.last = None
+        self.laps = 0
+
+    def unwrap(self, values):
+        values = np.asarray(values, dtype=np.int64)
+        if len(values) == 0:
+            return values
+        prev = np.concatenate(([values[0] if self.last is None else self.last], values[:-1]))
+        # A big step backwards is the counter wrapping, a small one is reordering
+        wraps = np.cumsum(values - prev < -self.modulo // 2)
+        out = values + (self.laps + wraps) * self.modulo
+        self.laps += int(wraps[-1])
+        self.last = int(values[-1])
+        return out
+
+
+class NodeClock:
+    """
+    Streaming fit of host time against one node's clock, over the minimum
+    offset of each `interval` seconds of node time, keeping `history`
+    intervals.
+    """
+    def __init__(self, interval=1.0, history=120):
+        self.interval = interval
+        self.history = history
+        self.bucket_time = []
+        self.bucket_offset = []
+        self.current = None  # (bucket index, node time, min offset)
+        self.offset = None
+        self.skew = 0.0
+        self.origin = None
+
+    def update(self, node_time, host_time):
+        node_time = np.asarray(node_time, dtype=np.float64)
+        offsets = np.asarray(host_time, dtype=np.float64) - node_time
+        if self.origin is None:
+            self.origin = float(node_time[0])
+            self.offset = float(offsets.min())
+        buckets = ((node_time - self.origin) // self.interval).astype(np.int64)
+        for bucket in np.unique(buckets):
+            mask = buckets == bucket
+            i = int(np.argmin(np.where(mask, offsets, np.inf)))
+            if self.current is not None and self.current[0] == bucket:
+                if offsets[i] < self.current[2]:
+                    self.current = (bucket, node_time[i], offsets[i])
+                continue
+            if self.current is not None:
+                self._close(self.current)
+            self.current = (bucket, node_time[i], offsets[i])
+
+    def _close(self, bucket):
+        self.bucket_time.append(bucket[1] - self.origin)
+        self.bucket_offset.append(bucket[2])
+        del self.bucket_time[:-self.history]
+        del self.bucket_offset[:-self.history]
+        if len(self.bucket_time) >= 3:
+            self.skew, self.offset = np.polyfit(self.bucket_time, self.bucket_offset, 1)
+        else:
+            self.offset = min(self.bucket_offset) - self.skew * self.bucket_time[-1]
+
+    def to_host(self, node_time):
+        return np.asarray(node_time, dtype=np.float64) + self.offset + self.skew * (
+            np.asarray(node_time, dtype=np.float64) - self.origin)
+
+    @property
+    def drift_ppm(self):
+        return self.skew * 1e6
+
+
+class _Node:
+    def __init__(self, n_channels, sample_rate, clock_interval):
+        self.n_channels = n_channels
+        self.sample_rate = sample_rate
+        self.clock = NodeClock(clock_interval)
+        self.stamps = Unwrapper(TIMESTAMP_MODULO)
+        self.seqs = Unwrapper(SEQ_MODULO)
+        # Samples not yet resampled, starting with the last one already used
+        self.times = np.zeros(0)
+        self.samples = np.zeros((0, n_channels))
+        self.gaps = 0
+        self.stale = False
+
+    @property
+    def latest(self):
+        return self.times[-1] if len(self.times) else -np.inf
+
+
+class StreamAligner:
+    """
+        aligner = StreamAligner(1000, {1: 4, 2: 4})   # node id -> channels
+        aligner.push(node, samples, host_time, timestamps=decoder.timestamps[mask])
+        times, block = aligner.pull()                 # (n,), (n, 8)
+
+    host_time is when the block arrived (one value or one per sample).
+    Node times that jump by more than max_gap seconds are counted as gaps,
+    the samples in between are interpolated like any others. A node more
+    than max_gap behind the newest is left out of the wait and held at its
+    last value, each time that happens counts as a gap too. At most
+    max_backlog seconds of samples are kept per node.
+    """
+    def __init__(self, sample_rate, nodes, max_gap=0.05, clock_interval=1.0, max_backlog=2.0):
+        self.sample_rate = sample_rate
+        self.period = 1.0 / sample_rate
+        self.max_gap = max_gap
+        self.max_backlog = max(2, int(max_backlog * sample_rate))
+        self.nodes = {node: _Node(n, sample_rate, clock_interval) for node, n in nodes.items()}
+        self.n_channels = sum(n for n in nodes.values())
+        self.next_time = None
+        self.first_time = None
+
+    def push(self, node, samples, host_time, timestamps=None, seq=None):
+        """
+        timestamps: node clock in microseconds as sent (wrapping uint32).
+        Without them, seq (wrapping uint16) at the nominal rate is the clock.
+        """
+        state = self.nodes[node]
+        samples = np.asarray(samples, dtype=np.float64).reshape(-1, state.n_channels)
+        if len(samples) == 0:
+            return
+        if timestamps is not None:
+            node_time = state.stamps.unwrap(timestamps) * 1e-6
+        else:
+            node_time = state.seqs.unwrap(seq) / state.sample_rate
+        host_time = np.broadcast_to(np.asarray(host_time, dtype=np.float64), node_time.shape)
+
+        state.clock.update(node_time, host_time)
+        times = state.clock.to_host(node_time)
+        order = np.argsort(times, kind='stable')
+        times, samples = times[order], samples[order]
+        # The fit moves a little as it learns, never let that step backwards
+        times = np.maximum.accumulate(np.concatenate((state.times[-1:], times)))[-len(times):]
+
+        steps = np.diff(np.concatenate((state.times[-1:], times)))
+        state.gaps += int(np.count_nonzero(steps > self.max_gap))
+        state.times = np.concatenate((state.times, times))[-self.max_backlog:]
+        state.samples = np.concatenate((state.samples, samples))[-self.max_backlog:]
+
+    def _update_stale(self):
+        """Mark the nodes more than max_gap behind the newest one."""
+        seen = [state for state in self.nodes.values() if len(state.times)]
+        if not seen:
+            return
+        newest = max(state.latest for state in seen)
+        if self.first_time is None:
+            self.first_time = min(state.times[0] for state in seen)
+        for state in self.nodes.values():
+            # A node that never sent anything counts from where the others started
+            latest = state.latest if len(state.times) else self.first_time
+            stale = newest - latest > self.max_gap
+            if stale and not state.stale:
+                state.gaps += 1
+            state.stale = stale
+
+    def pull(self):
+        """(times, block) for every grid point all live nodes have reached."""
+        self._update_stale()
+        live = [state for state in self.nodes.values() if not state.stale]
+        ready = min(state.latest for state in live)
+        if not np.isfinite(ready):
+            return np.zeros(0), np.zeros((0, self.n_channels))
+        if self.next_time is None:
+            # Start where every live node has data
+            self.next_time = max(state.times[0] for state in live)
+        n = int(np.floor((ready - self.next_time) / self.period)) + 1
+        if n <= 0:
+            return np.zeros(0), np.zeros((0, self.n_channels))
+
+        grid = self.next_time + np.arange(n) * self.period
+        columns = []
+        for state in self.nodes.values():
+            if len(state.times) == 0:
+                columns += [np.zeros(n)] * state.n_channels
+                continue
+            for c in range(state.n_channels):
+                # Past a stale node's last sample interp holds that value
+                columns.append(np.interp(grid, state.times, state.samples[:, c]))
+            # Keep the samples around the next grid point for interpolating it
+            keep = max(np.searchsorted(state.times, grid[-1], side='right') - 1, 0)
+            state.times = state.times[keep:]
+            state.samples = state.samples[keep:]
+        self.next_time = grid[-1] + self.period
+        return grid, np.column_stack(columns)
+
+    @property
+    def gaps(self):
+        return sum(state.gaps for state in self.nodes.values())
+
+    def drift_ppm(self):
+        """Each node's drift against the host clock."""
+        return {node: state.clock.drift_ppm for node, state in self.nodes.items()}
+
+    def relative_drift_ppm(self):
+        """Largest drift between any two nodes, what desynchronises the channels."""
+        drifts = list(self.drift_ppm().values())
+        return max(drifts) - min(drifts) if drifts else 0.0
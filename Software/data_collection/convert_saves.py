@@ -0,0 +1,228 @@
+"""
+Converts the legacy CSV saves to session files and keeps a catalogue of
+every session in a folder.
+
+Legacy layouts (detected from the first line, not the file name):
+    main.py         "value; label" rows, labels 0 = relax, 1 = contract
+    3graphGUI.py    "a,b,c" rows, no labels
+    graphGUI.py     one value per row, no labels
+
+Files without labels get recorder.UNLABELED (-1, named 'unlabeled') for
+every sample rather than 0, which would read as a whole session of rest.
+
+The subject is the first folder under the saves folder when it is split
+up by subject (saves/<subject>/...). Otherwise it is the file name for
+graphGUI saves, which are named by whoever recorded them, and unknown
+(None) for the timestamped names main.py and 3graphGUI.py generate.
+
+Usage:
+    python convert_saves.py saves --sample-rate 100
+    python convert_saves.py saves --index-only
+
+The index (index.json in the output folder) has one entry per session with
+subject, date, channels, sample count and label spans. Entries are reused
+while the file's size and mtime haven't changed.
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from recorder import SESSION_EXT, UNLABELED, SessionRecorder
+from session import Session
+
+DATE_PATTERN = re.compile(r'(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})')
+MAIN_LABELS = {0: 'relax', 1: 'contract'}
+# graphGUI's file name when none was typed in
+GRAPHGUI_DEFAULT_NAME = 'recorded_data'
+INDEX_NAME = 'index.json'
+
+
+def detect_layout(path):
+    """Returns (layout, delimiter), layout is 'main', 'multichannel' or 'single'."""
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                break
+        else:
+            return None, None
+    if ';' in line:
+        return 'main', ';'
+    if ',' in line:
+        return 'multichannel', ','
+    return 'single', None
+
+
+def start_time(path):
+    """Recording start from the timestamp in the file name, otherwise its mtime."""
+    match = DATE_PATTERN.search(os.path.basename(path))
+    if match:
+        return datetime.datetime.strptime(match.group(1), "%Y-%m-%d_%H-%M-%S").timestamp()
+    return os.path.getmtime(path)
+
+
+def guess_subject(rel):
+    """Subject for a save at `rel` (relative to the saves folder), see the module docstring."""
+    if os.sep in rel:
+        return rel.split(os.sep)[0]
+    stem = os.path.splitext(os.path.basename(rel))[0]
+    if DATE_PATTERN.search(stem) or stem == GRAPHGUI_DEFAULT_NAME:
+        return None
+    return stem
+
+
+def convert(path, out_path, sample_rate, subject=None):
+    layout, delimiter = detect_layout(path)
+    if layout is None:
+        return None
+    data = np.loadtxt(path, delimiter=delimiter, ndmin=2)
+
+    if layout == 'main':
+        samples, labels, names = data[:, :1], data[:, 1].astype(np.int16), MAIN_LABELS
+    else:
+        samples, labels, names = data, UNLABELED, None
+
+    t0 = start_time(path)
+    timestamps = t0 + np.arange(len(samples)) / sample_rate
+    metadata = {
+        'source': os.path.basename(path),
+        'legacy_layout': layout,
+        'subject': subject,
+        'labelled': layout == 'main',
+        'created': datetime.datetime.fromtimestamp(t0).isoformat(timespec='seconds'),
+    }
+    with SessionRecorder(out_path, sample_rate, samples.shape[1], labels=names, metadata=metadata) as rec:
+        rec.write(samples, timestamps=timestamps, labels=labels)
+    return out_path
+
+
+def _convert_job(job):
+    path, out_path, sample_rate, subject = job
+    try:
+        return path, convert(path, out_path, sample_rate, subject), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def index_entry(path):
+    session = Session(path)
+    meta = session.meta
+    label_spans = session.label_spans()
+    spans = [[start, stop, session.label_names.get(label, label)] for start, stop, label in label_spans]
+    entry = {
+        'path': path,
+        'subject': meta.get('subject'),
+        # Recordings made without cues are UNLABELED throughout too
+        'labelled': meta.get('labelled', any(label != UNLABELED for _, _, label in label_spans)),
+        'date': meta.get('created'),
+        'source': meta.get('source'),
+        'sample_rate': session.sample_rate,
+        'channels': session.channels,
+        'n_samples': len(session),
+        'label_spans': spans,
+        'size': os.path.getsize(path),
+        'mtime': os.path.getmtime(path),
+    }
+    session.close()
+    return entry
+
+
+def _index_job(path):
+    try:
+        return index_entry(path)
+    except Exception as e:
+        print(f"Skipping {path}: {e}")
+        return None
+
+
+def _find(folder, ext):
+    for root, dirs, files in os.walk(folder):
+        for name in sorted(files):
+            if name.lower().endswith(ext):
+                yield os.path.join(root, name)
+
+
+def build_index(folder, jobs=None, index_path=None):
+    index_path = index_path or os.path.join(folder, INDEX_NAME)
+    old = {}
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            old = {entry['path']: entry for entry in json.load(f)['sessions']}
+
+    entries, stale = [], []
+    for path in _find(folder, SESSION_EXT):
+        entry = old.get(path)
+        if entry and entry['size'] == os.path.getsize(path) and entry['mtime'] == os.path.getmtime(path):
+            entries.append(entry)
+        else:
+            stale.append(path)
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        entries += [entry for entry in pool.map(_index_job, stale) if entry is not None]
+
+    entries.sort(key=lambda entry: entry['path'])
+    with open(index_path, 'w') as f:
+        json.dump({'sessions': entries}, f, indent=1)
+    print(f"Indexed {len(entries)} sessions ({len(stale)} rescanned) -> {index_path}")
+    return entries
+
+
+def load_index(folder):
+    with open(os.path.join(folder, INDEX_NAME)) as f:
+        return json.load(f)['sessions']
+
+
+def find_sessions(entries, subject=None, channels=None, label=None, min_samples=0):
+    """Filter index entries without touching the session files."""
+    found = []
+    for entry in entries:
+        if subject is not None and entry['subject'] != subject:
+            continue
+        if channels is not None and len(entry['channels']) < channels:
+            continue
+        if label is not None and not any(span[2] == label for span in entry['label_spans']):
+            continue
+        if entry['n_samples'] < min_samples:
+            continue
+        found.append(entry)
+    return found
+
+
+def convert_folder(folder, out_dir=None, sample_rate=100, jobs=None, force=False):
+    out_dir = out_dir or folder
+    work = []
+    for path in _find(folder, '.csv'):
+        rel = os.path.relpath(path, folder)
+        out_path = os.path.join(out_dir, os.path.splitext(rel)[0] + SESSION_EXT)
+        if not force and os.path.exists(out_path) and os.path.getmtime(out_path) >= os.path.getmtime(path):
+            continue
+        work.append((path, out_path, sample_rate, guess_subject(rel)))
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for path, out_path, error in pool.map(_convert_job, work):
+            if error:
+                print(f"Failed {path}: {error}")
+            elif out_path:
+                print(f"{path} -> {out_path}")
+    return out_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert legacy CSV saves and index session files")
+    parser.add_argument('folder', nargs='?', default='saves')
+    parser.add_argument('--out', help="output folder (default: next to the CSVs)")
+    parser.add_argument('--sample-rate', type=float, default=100, help="rate the legacy files were recorded at")
+    parser.add_argument('--jobs', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--force', action='store_true', help="reconvert files that are already up to date")
+    parser.add_argument('--index-only', action='store_true')
+    args = parser.parse_args()
+
+    out_dir = args.out or args.folder
+    if not args.index_only:
+        convert_folder(args.folder, out_dir, args.sample_rate, args.jobs, args.force)
+    build_index(out_dir, args.jobs)
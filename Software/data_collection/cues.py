@@ -0,0 +1,154 @@
+"""
+Timed cue protocols for recording sessions.
+
+A protocol is a list of phases (relax, open palm, pronate, rest ...), each
+with a class label and a duration. CueEngine lays them out on an absolute
+schedule when it starts and poll() reports the phase changes and countdown
+ticks that have come due since the last call. Nothing sleeps, so it can be
+polled from a Qt or Tk timer while acquisition runs untouched in its own
+thread or process.
+
+Every event carries the time it was scheduled for, not the time it was
+polled, so passing it on as
+
+    recorder.set_label(event.phase.label, event.phase.name, at=event.t)
+
+labels the recording to the sample however late the timer fired, as long
+as it fires within the recorder's flush_interval.
+"""
+import math
+import time
+from collections import namedtuple
+
+# text is formatted with the whole seconds left in the phase
+Phase = namedtuple('Phase', 'name label duration text')
+# kind is 'phase' (a new phase started), 'tick' (a countdown second went
+# by), 'done' (protocol finished) or 'stopped'
+CueEvent = namedtuple('CueEvent', 't kind phase remaining')
+
+REST = 0
+
+# Motion pairs per GUI mode: (name, label, prompt). Every motion has its
+# own label code, one session can switch modes and the codes have to stay
+# unambiguous
+MODES = {
+    "Finger Extension/Flexion": (('open', 1, "Open palm"), ('close', 2, "Close palm")),
+    "Supination/Pronation": (('supinate', 3, "Supinate"), ('pronate', 4, "Pronate")),
+}
+DEFAULT_MOTIONS = (('action_1', 5, "Action 1"), ('action_2', 6, "Action 2"))
+
+
+def cycle_protocol(mode, cycle_duration, num_cycles, num_sets, rest_time, lead_in=3):
+    """Phases for the 3-graph GUI: sets of motion cycles with a rest between sets."""
+    first, second = MODES.get(mode, DEFAULT_MOTIONS)
+    phases = []
+    if lead_in:
+        phases.append(Phase('lead_in', REST, lead_in, "Get ready {}"))
+    for set_num in range(num_sets):
+        for _ in range(num_cycles):
+            for name, label, prompt in (first, second):
+                phases.append(Phase(name, label, cycle_duration, prompt + " {}"))
+        if set_num < num_sets - 1 and rest_time:
+            phases.append(Phase('rest', REST, rest_time, "Rest {}"))
+    return phases
+
+
+def labels_for(phases):
+    """{label: name} for SessionRecorder(labels=...)."""
+    return {phase.label: phase.name if phase.label != REST else 'rest' for phase in phases}
+
+
+class CueEngine:
+    """
+        engine = CueEngine(phases)
+        engine.listeners.append(on_cue)
+        engine.start()
+        ...
+        engine.poll()   # from a timer, every 10-50 ms
+
+    With loop=True the phases repeat until stop(), `lead_in` (a Phase) runs
+    once before them.
+    """
+    def __init__(self, phases, lead_in=None, loop=False, clock=time.time):
+        self.phases = list(phases)
+        self.lead_in = lead_in
+        self.loop = loop
+        self.clock = clock
+        self.listeners = []
+        self.running = False
+        self.index = -1
+        self.current = None
+        self.phase_start = None
+        self.started = None
+        self._last_tick = None
+
+    def _phase(self, index):
+        if self.lead_in is not None:
+            if index == 0:
+                return self.lead_in
+            index -= 1
+        if self.loop and self.phases:
+            return self.phases[index % len(self.phases)]
+        return self.phases[index] if index < len(self.phases) else None
+
+    def start(self, now=None):
+        self.started = self.clock() if now is None else now
+        self.running = True
+        self.index = -1
+        self.current = None
+        self.phase_start = None
+        self._last_tick = None
+        return self.poll(self.started)
+
+    def stop(self, now=None):
+        if not self.running:
+            return []
+        self.running = False
+        now = self.clock() if now is None else now
+        return self._emit([CueEvent(now, 'stopped', self.current, 0)])
+
+    @property
+    def label(self):
+        """Label of the phase running now, rest when idle."""
+        return self.current.label if self.running and self.current is not None else REST
+
+    def poll(self, now=None):
+        """Events that came due since the last poll, oldest first. Listeners get them too."""
+        if not self.running:
+            return []
+        now = self.clock() if now is None else now
+        events = []
+        while True:
+            next_start = self.started if self.current is None else self.phase_start + self.current.duration
+            if next_start > now:
+                break
+            phase = self._phase(self.index + 1)
+            if phase is None:
+                self.running = False
+                events.append(CueEvent(next_start, 'done', self.current, 0))
+                return self._emit(events)
+            self.index += 1
+            self.current = phase
+            self.phase_start = next_start
+            self._last_tick = math.ceil(phase.duration)
+            events.append(CueEvent(next_start, 'phase', phase, self._last_tick))
+
+        end = self.phase_start + self.current.duration
+        remaining = math.ceil(end - now)
+        if remaining < self._last_tick:
+            self._last_tick = remaining
+            events.append(CueEvent(end - remaining, 'tick', self.current, remaining))
+        return self._emit(events)
+
+    def _emit(self, events):
+        for event in events:
+            for listener in self.listeners:
+                listener(event)
+        return events
+
+
+def cue_text(event):
+    """Prompt for the overlay, e.g. 'Open palm 3'."""
+    if event.phase is None or event.kind in ('done', 'stopped'):
+        return ""
+    return event.phase.text.format(event.remaining)
@@ -1,18 +1,24 @@
 import sys
 import random
 import time
-import csv
+import os
+import numpy as np
 from PyQt5 import QtWidgets, QtCore
 import pyqtgraph as pg
 from PyQt5.QtCore import QThread, pyqtSignal
 
+from recorder import SESSION_EXT, SessionRecorder, new_session_path
+
+SAMPLE_RATE = 100  # Hz
+SAVE_DIR = './saves'
+
 class DataGenerator(QThread):
     new_data = pyqtSignal(int)
     
     def __init__(self):
         super().__init__()
         self.recordingStarted = False
-        self.recordedData = []
+        self.recorder = None
     
     def run(self):
         # Send fake data with random pockets of EMG
@@ -22,16 +28,19 @@ class DataGenerator(QThread):
                 decoded = random.randint(0, 100)
                 time.sleep(0.01)
                 self.new_data.emit(decoded)
-                if self.recordingStarted:
-                    self.recordedData.append(decoded)
+                self.record(decoded)
             
             start_time = time.time()
             while time.time() - start_time < 2.5:
                 decoded = random.randint(1000, 2000)
                 time.sleep(0.01)
                 self.new_data.emit(decoded)
-                if self.recordingStarted:
-                    self.recordedData.append(decoded)
+                self.record(decoded)
+
+    def record(self, value):
+        recorder = self.recorder
+        if self.recordingStarted and recorder is not None:
+            recorder.write(np.array([value]))
 
 class LiveGraph(QtWidgets.QMainWindow):
     def __init__(self):
@@ -89,6 +98,9 @@ class LiveGraph(QtWidgets.QMainWindow):
             self.save_data()
 
     def toggle_recording(self):
+        if self.data_generator.recorder is None:
+            # Streams to a timestamped file until it's saved under its real name
+            self.data_generator.recorder = SessionRecorder(new_session_path(SAVE_DIR), SAMPLE_RATE, 1)
         self.data_generator.recordingStarted = not self.data_generator.recordingStarted
         if self.data_generator.recordingStarted:
             self.record_button.setText("Stop Recording")
@@ -100,14 +112,20 @@ class LiveGraph(QtWidgets.QMainWindow):
             self.recording_status.setStyleSheet("QLabel { color : red; font-size: 16px; }")
 
     def save_data(self):
+        if self.data_generator.recordingStarted:
+            self.toggle_recording()
+
         filename = self.filename_entry.text().strip() or "recorded_data"
-        filename = filename if filename.endswith('.csv') else filename + '.csv'
-        
-        with open(filename, 'w', newline='') as f:
-            writer = csv.writer(f)
-            for data in self.data_generator.recordedData:
-                writer.writerow([data])
-        self.data_generator.recordedData = []  
+        filename = filename if filename.endswith(SESSION_EXT) else filename + SESSION_EXT
+        # Next to the timestamped file, not wherever the GUI was started from
+        filename = os.path.join(SAVE_DIR, filename)
+
+        recorder = self.data_generator.recorder
+        self.data_generator.recorder = None
+        if recorder is not None:
+            recorder.close()
+            os.replace(recorder.path, filename)
+            print(f"Saved {recorder.n_samples} samples to {filename}")
  
     def update_label(self, decoded):
         self.data = self.data[1:] + [decoded]
@@ -0,0 +1,218 @@
+"""
+Zoomable history plot for whole recordings.
+
+MinMaxPyramid precomputes the minimum and maximum of every block of
+factor, factor^2, factor^3 ... samples per channel, so any range can be
+drawn from the coarsest level that still has a block per pixel. A view of
+an hour-long session touches a few thousand values whatever the zoom,
+instead of every sample.
+
+    pyramid = MinMaxPyramid(session.samples)
+    x, y = pyramid.query(0, len(session), 1200)   # sample positions, (n, n_channels)
+    pyramid.extend(session.samples)               # after more samples were appended
+
+extend() only reduces the new samples and the last, partial block of each
+level, so a recording that keeps growing never has to be scanned again.
+
+HistoryView is a pg.PlotWidget that keeps one curve per channel and
+redraws only the visible range at its pixel width whenever the view is
+zoomed or panned (mouse wheel / drag, like any pyqtgraph plot). x is in
+seconds.
+"""
+import numpy as np
+import pyqtgraph as pg
+from pyqtgraph.Qt import QtCore
+
+# Samples reduced per numpy call when building the first level from a
+# memory-mapped session, keeps memory flat for long recordings
+BUILD_CHUNK = 1 << 20
+COLORS = ['b', 'r', 'g', 'c', 'm', (255, 128, 0), 'k', (128, 0, 255)]
+
+
+class MinMaxPyramid:
+    def __init__(self, samples, factor=8):
+        self.factor = factor
+        self.n_samples = 0
+        # levels[k] = (mins, maxs), blocks of factor ** (k + 1) samples
+        self.levels = []
+        self.extend(samples)
+
+    @staticmethod
+    def _as_2d(samples):
+        # A memory-mapped session stays mapped, nothing is copied
+        samples = np.asarray(samples)
+        return samples[:, None] if samples.ndim == 1 else samples
+
+    def extend(self, samples):
+        """
+        Take `samples`, the same recording with more samples appended (e.g.
+        the session reopened), and reduce only what is new. Blocks that
+        were complete before are kept, each level redoes its last one.
+        """
+        samples = self._as_2d(samples)
+        old = self.n_samples
+        if len(samples) < old:
+            raise ValueError("extend() needs the same recording with samples added, not fewer")
+        self.samples = samples
+        self.n_samples, self.n_channels = samples.shape
+
+        level = 0
+        while self.n_samples:
+            # Blocks before `done` covered only samples that were there already
+            done = old // self.block_size(level)
+            if level == 0:
+                tail = self._reduce_chunked(samples, done * self.factor)
+            else:
+                below_mins, below_maxs = self.levels[level - 1]
+                start = done * self.factor
+                tail = (self._reduce(below_mins[start:], np.minimum), self._reduce(below_maxs[start:], np.maximum))
+            if level < len(self.levels):
+                mins, maxs = self.levels[level]
+                self.levels[level] = (np.concatenate((mins[:done], tail[0])), np.concatenate((maxs[:done], tail[1])))
+            else:
+                self.levels.append(tail)
+            if len(self.levels[level][0]) <= 1:
+                break
+            level += 1
+
+    def _reduce(self, values, op):
+        """Blocks of `factor` rows, a short last block included."""
+        n = len(values)
+        full = n // self.factor * self.factor
+        out = op.reduce(values[:full].reshape(-1, self.factor, self.n_channels), axis=1)
+        if full < n:
+            out = np.concatenate((out, op.reduce(values[full:], axis=0, keepdims=True)))
+        return out
+
+    def _reduce_chunked(self, samples, first=0):
+        """Level 0 blocks from sample `first` (a block boundary) on."""
+        chunk = BUILD_CHUNK // self.factor * self.factor
+        mins, maxs = [], []
+        for start in range(first, self.n_samples, chunk):
+            block = np.asarray(samples[start:start + chunk], dtype=np.float32)
+            mins.append(self._reduce(block, np.minimum))
+            maxs.append(self._reduce(block, np.maximum))
+        return np.concatenate(mins), np.concatenate(maxs)
+
+    def block_size(self, level):
+        """Samples per block at `level`, level -1 is the raw samples."""
+        return self.factor ** (level + 1)
+
+    def query(self, start, stop, n_pixels):
+        """
+        (x, y) to draw samples [start, stop) about n_pixels wide. x is the
+        sample position, y (n, n_channels). Zoomed out each block becomes
+        a min and a max point, so the curve keeps every spike's height.
+        """
+        start = max(0, int(start))
+        stop = min(self.n_samples, int(np.ceil(stop)))
+        if stop <= start:
+            return np.zeros(0), np.zeros((0, self.n_channels))
+        per_pixel = (stop - start) / max(n_pixels, 1)
+
+        level = -1
+        while level + 1 < len(self.levels) and self.block_size(level + 1) <= per_pixel:
+            level += 1
+        if level < 0:
+            return np.arange(start, stop, dtype=np.float64), np.asarray(self.samples[start:stop], dtype=np.float32)
+
+        size = self.block_size(level)
+        first, last = start // size, -(-stop // size)
+        mins, maxs = self.levels[level]
+        y = np.empty((2 * (last - first), self.n_channels), dtype=mins.dtype)
+        y[0::2] = mins[first:last]
+        y[1::2] = maxs[first:last]
+        x = np.repeat(np.arange(first, last, dtype=np.float64) * size, 2)
+        # Spread each min/max pair over its block so the outline has width
+        x[1::2] += size / 2
+        return x, y
+
+    @property
+    def memory(self):
+        """Bytes used by the precomputed levels (the samples themselves are not copied)."""
+        return sum(mins.nbytes + maxs.nbytes for mins, maxs in self.levels)
+
+
+def channel_color(i):
+    """Same colour for a channel in the live and history plots."""
+    return COLORS[i] if i < len(COLORS) else pg.intColor(i, hues=16)
+
+
+class HistoryView(pg.PlotWidget):
+    """One curve per channel, redrawn from the pyramid for the visible range."""
+
+    def __init__(self, parent=None, factor=8):
+        super().__init__(parent)
+        self.factor = factor
+        self.setBackground('w')
+        self.plotItem.showGrid(True, True, 0.2)
+        self.setLabel('bottom', 'Time', units='s')
+        self.legend = self.plotItem.addLegend()
+        self.curves = []
+        self.pyramid = None
+        self.session = None
+        self.sample_rate = 1.0
+        # Range changes arrive in bursts while dragging, redraw once per event loop pass
+        self._refresh_timer = QtCore.QTimer(self)
+        self._refresh_timer.setSingleShot(True)
+        self._refresh_timer.timeout.connect(self.refresh)
+        self.plotItem.getViewBox().sigXRangeChanged.connect(lambda *_: self._refresh_timer.start(0))
+
+    def _ensure_curves(self, names):
+        if [curve.name() for curve in self.curves] == list(names):
+            return
+        for curve in self.curves:
+            self.removeItem(curve)
+        self.legend.clear()
+        self.curves = [self.plot(pen=pg.mkPen(channel_color(i)), name=name,
+                                 skipFiniteCheck=True)
+                       for i, name in enumerate(names)]
+
+    def set_samples(self, samples, sample_rate, names=None):
+        """Show a whole (n_samples, n_channels) array, e.g. a memmap."""
+        self.pyramid = MinMaxPyramid(samples, self.factor)
+        self._show(sample_rate, names)
+
+    def _show(self, sample_rate, names=None):
+        self.sample_rate = sample_rate
+        names = names or [f"ch{i + 1}" for i in range(self.pyramid.n_channels)]
+        self._ensure_curves(names)
+        duration = max(self.pyramid.n_samples, 1) / sample_rate
+        self.plotItem.getViewBox().setLimits(xMin=0, xMax=duration)
+        self.setXRange(0, duration, padding=0)
+        self.refresh()
+
+    def set_session(self, session):
+        """
+        Show a session.Session, it stays open (memory-mapped) while shown.
+        The same file again (reopened after recording more) only has its
+        new samples added to the pyramid.
+        """
+        previous = self.session
+        if previous is not None and previous is not session:
+            previous.close()
+        self.session = session
+        if (previous is not None and self.pyramid is not None and previous.path == session.path
+                and len(session) >= self.pyramid.n_samples):
+            self.pyramid.extend(session.samples)
+            self._show(session.sample_rate, session.channels)
+        else:
+            self.set_samples(session.samples, session.sample_rate, session.channels)
+
+    def clear_data(self):
+        if self.session is not None:
+            self.session.close()
+        self.session = None
+        self.pyramid = None
+        for curve in self.curves:
+            curve.setData([], [])
+
+    def refresh(self):
+        if self.pyramid is None:
+            return
+        (x0, x1), _ = self.plotItem.getViewBox().viewRange()
+        width = max(int(self.plotItem.getViewBox().width()), 100)
+        x, y = self.pyramid.query(x0 * self.sample_rate, x1 * self.sample_rate, width)
+        x = x / self.sample_rate
+        for i, curve in enumerate(self.curves):
+            curve.setData(x, y[:, i])
@@ -0,0 +1,186 @@
+"""
+Lightweight timing and counters for the acquisition / control loop.
+
+    stats = Stats()
+    with stats.time('filter'):
+        ...
+    stats.count('dropped_samples', n)
+    print(stats.summary())
+
+Stage timings go into fixed-size log-spaced histograms (20 buckets per
+decade from 100 ns to 10 s, ~12% resolution), so memory stays flat over
+long runs and p50/p95/p99 are cheap to read. Percentiles report the upper
+edge of their bucket, i.e. they err on the slow side.
+
+Stats can be shared between threads (e.g. the GUI's data thread times
+'read' while the GUI thread reads and resets it), every access takes its
+lock. A stage should still only be timed from one thread at a time.
+
+StatsLogger appends a snapshot as one JSON line per interval for offline
+analysis of long runs.
+"""
+import json
+import math
+import threading
+import time
+
+import numpy as np
+
+BUCKETS_PER_DECADE = 20
+MIN_EXP = -7  # 100 ns
+MAX_EXP = 1  # 10 s
+N_BUCKETS = (MAX_EXP - MIN_EXP) * BUCKETS_PER_DECADE + 1
+BUCKET_EDGES = 10.0 ** (MIN_EXP + np.arange(1, N_BUCKETS + 1) / BUCKETS_PER_DECADE)
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = np.zeros(N_BUCKETS, dtype=np.int64)
+        self.total = 0.0
+        self.max = 0.0
+        self.n = 0
+
+    def record(self, seconds):
+        if seconds <= 0:
+            idx = 0
+        else:
+            idx = int((math.log10(seconds) - MIN_EXP) * BUCKETS_PER_DECADE)
+            idx = min(max(idx, 0), N_BUCKETS - 1)
+        self.counts[idx] += 1
+        self.total += seconds
+        self.n += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """Seconds below which p percent of the recorded durations fall."""
+        if self.n == 0:
+            return 0.0
+        idx = int(np.searchsorted(np.cumsum(self.counts), p / 100 * self.n))
+        return min(float(BUCKET_EDGES[min(idx, N_BUCKETS - 1)]), self.max)
+
+    def snapshot(self):
+        ms = 1000.0
+        return {
+            'count': self.n,
+            'mean_ms': self.total / self.n * ms if self.n else 0.0,
+            'p50_ms': self.percentile(50) * ms,
+            'p95_ms': self.percentile(95) * ms,
+            'p99_ms': self.percentile(99) * ms,
+            'max_ms': self.max * ms,
+        }
+
+
+class _Timer:
+    # One per stage and reused, so timing a stage doesn't allocate
+    __slots__ = ('hist', 'lock', 'start')
+
+    def __init__(self, hist, lock):
+        self.hist = hist
+        self.lock = lock
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        with self.lock:
+            self.hist.record(elapsed)
+
+
+class Stats:
+    """
+    Stage histograms plus counters (added up) and gauges (last value).
+
+    reset() starts a new interval: histograms and counters start again
+    from zero, gauges keep their last value. The decoder and ring counters
+    that update_stats() copies in (frames, bad_frames, dropped_samples...)
+    are gauges, totals since the stream started.
+    """
+    def __init__(self):
+        self.stages = {}
+        self.timers = {}
+        self.counters = {}
+        self.gauges = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def _hist(self, stage):
+        # Called with the lock held
+        hist = self.stages.get(stage)
+        if hist is None:
+            hist = self.stages[stage] = LatencyHistogram()
+            self.timers[stage] = _Timer(hist, self._lock)
+        return hist
+
+    def time(self, stage):
+        """Context manager timing one pass through `stage`. Not reentrant per stage."""
+        timer = self.timers.get(stage)
+        if timer is None:
+            with self._lock:
+                self._hist(stage)
+            timer = self.timers[stage]
+        return timer
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._hist(stage).record(seconds)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'time': time.time(),
+                'uptime': time.time() - self.started,
+                'stages': {stage: hist.snapshot() for stage, hist in self.stages.items()},
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+            }
+
+    def reset(self):
+        with self._lock:
+            for hist in self.stages.values():
+                hist.__init__()
+            self.counters.clear()
+
+    def summary(self, stages=None):
+        """One line for the console or a Qt label."""
+        with self._lock:
+            parts = []
+            for stage in stages or list(self.stages):
+                if stage not in self.stages:
+                    continue
+                snap = self.stages[stage].snapshot()
+                parts.append(f"{stage} {snap['p50_ms']:.2f}/{snap['p99_ms']:.2f}ms")
+            parts += [f"{name} {value}" for name, value in {**self.counters, **self.gauges}.items()]
+        return "  ".join(parts)
+
+
+class StatsLogger:
+    """Appends Stats.snapshot() to a JSON lines file every `interval` seconds."""
+    def __init__(self, stats, path, interval=1.0):
+        self.stats = stats
+        self.path = path
+        self.interval = interval
+        self.last = time.time()
+
+    def maybe_write(self):
+        now = time.time()
+        if now - self.last < self.interval:
+            return False
+        self.write()
+        return True
+
+    def write(self):
+        self.last = time.time()
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(self.stats.snapshot()) + '\n')
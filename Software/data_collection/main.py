@@ -1,12 +1,8 @@
-import serial   # pip install pyserial, not serial
 import threading
 import tkinter as tk
-import datetime
 import numpy as np
-import os
 import random
 import time
-from time import sleep
 import matplotlib
 matplotlib.use('TkAgg') 
 import matplotlib.pyplot as plt
@@ -14,112 +10,120 @@ from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.animation as animation
 import matplotlib.colors as mccolor
 
+from cues import CueEngine, Phase, cue_text
+from recorder import SessionRecorder, new_session_path
+from ringbuffer import RingBuffer
+from transport import open_transport
+
 # Constants
 # TODO: probably make this in a class so we can do OOP
-print("Hello World")
 recordingStarted = False
-recordingInitial = False
-recordedData = []
+SERIAL_PORT = 'auto'  # or a device path / 'synthetic://...' (see transport.py)
+BAUDRATE = 9600
+SAMPLE_RATE = 100  # Hz
+PLOT_SAMPLES = 3000
+AVERAGE_SAMPLES = 100
+PLOT_INTERVAL_MS = 100
+RELAX, CONTRACT = 0, 1
+LABELS = {RELAX: 'relax', CONTRACT: 'contract'}
+CUE_SECONDS = 5
+CUE_POLL_MS = 20
+recorder = None
+
+
+class PlotBuffer:
+    """
+    The last `capacity` values for the plot in a preallocated RingBuffer,
+    plus the mean of the newest `average` of them, kept as a running sum
+    that is updated per sample instead of summed again every frame.
+    """
+    def __init__(self, capacity, average=100):
+        self.ring = RingBuffer(capacity, dtype=np.float64)
+        self.average = average
+        self.total = 0.0
+
+    def __len__(self):
+        return len(self.ring)
+
+    def append(self, value):
+        if self.ring.count >= self.average:
+            # The value about to drop out of the average
+            self.total -= self.ring.latest(self.average)[0, 0]
+        self.ring.append(value)
+        self.total += value
+
+    def mean(self):
+        return self.total / min(self.ring.count, self.average) if self.ring.count else 0.0
+
+    def values(self):
+        """View of the held values, oldest first."""
+        return self.ring.latest()[:, 0]
+
+    def clear(self):
+        self.ring.clear()
+        self.total = 0.0
+
+
+# Recordings stream to disk through the recorder, this only feeds the plot
+recordedData = PlotBuffer(PLOT_SAMPLES, AVERAGE_SAMPLES)
 
 
 def read_serial():
-    print("Test")
-    global recordingStarted
-    global recordedData
-    global recordingInitial
     try:
-        with serial.Serial('/dev/cu.SLAB_USBtoUART', 9600, timeout=2) as ser:
+        with open_transport(SERIAL_PORT, BAUDRATE, timeout=2, protocol='ascii') as ser:
             while ser.is_open:
-                line = ser.readline() # will need to be decoded
-                decoded = line.decode('utf-8')
-                update_label(decoded)
-                # sleep(0.0050)
-                if recordingStarted:
-                    if recordingInitial:
-                        update_cd("Begin Recording in 3")
-                        time.sleep(1)
-                        update_cd("Begin Recording in 2")
-                        time.sleep(1)
-                        update_cd("Begin Recording in 1")
-                        time.sleep(1)
-                        recordingInitial = not recordingInitial
-                    x = 5
-                    time_begin = time.time()
-                    while time.time() - time_begin < 5:
-                        if not recordingStarted:
-                            break
-                        start_time = time.time()
-                        update_cd("Relax Arm. Contract in " + str(x))
-                        x-=1
-                        while time.time()-start_time <1:
-                            decoded = decoded[:-2]
-                            time.sleep(0.01)
-                            update_label(decoded)
-                            if recordingStarted:
-                                recordedData.append([decoded,0])
-                    x = 5
-                    time_begin = time.time()
-                    while time.time()-time_begin < 5:
-                        if not recordingStarted:
-                            break
-                        start_time = time.time()
-                        update_cd("Contract Arm. Relax in " + str(x))
-                        x-=1
-                        while time.time()-start_time < 1:
-                            decoded = decoded[:-2]
-                            time.sleep(0.01)
-                            update_label(decoded)
-                            if recordingStarted:
-                                recordedData.append([decoded,1])
-                if not recordingStarted:
-                    update_cd("Recording Stopped")
+                line = ser.readline()
+                decoded = line.decode('utf-8', errors='ignore').strip()
+                if decoded:
+                    update_label(decoded)
+                    record(decoded)
 
     # When you don't have esp32 connected but just work on the GUI itself
     except Exception as e:
         print("Currently at offline mode, generating random data")
-        # Send fake data with random pockets of EMG
+        # Fake EMG that follows the cues, bursts while told to contract
         while True:
-            if recordingStarted:
-                if recordingInitial:
-                    update_cd("Begin Recording in 3")
-                    time.sleep(1)
-                    update_cd("Begin Recording in 2")
-                    time.sleep(1)
-                    update_cd("Begin Recording in 1")
-                    time.sleep(1)
-                    recordingInitial = not recordingInitial
-                x = 5
-                time_begin = time.time()
-                while time.time()-time_begin < 5:
-                    if not recordingStarted:
-                        break
-                    start_time = time.time()
-                    update_cd("Relax Arm. Contract in " + str(x))
-                    x-=1
-                    while time.time()-start_time < 1:
-                        decoded = random.randint(0, 100)
-                        time.sleep(0.01)
-                        update_label(decoded)
-                        if recordingStarted:
-                            recordedData.append([decoded,0])
-                x = 5
-                time_begin = time.time()
-                while time.time()-time_begin < 5:
-                    if not recordingStarted:
-                        break
-                    start_time = time.time()
-                    update_cd("Contract Arm. Relax in " + str(x))
-                    x-=1
-                    while time.time()-start_time < 1:
-                        decoded = random.randint(1000, 2000)
-                        time.sleep(0.01)
-                        update_label(decoded)
-                        if recordingStarted:
-                            recordedData.append([decoded,1])
-            if not recordingStarted:
-                update_cd("Recording Stopped")
+            if cues.label == CONTRACT:
+                value = random.randint(1000, 2000)
+            else:
+                value = random.randint(0, 100)
+            update_label(value)
+            record(value)
+            time.sleep(1 / SAMPLE_RATE)
+
+
+def record(value):
+    try:
+        value = int(value)
+    except ValueError:
+        return
+    rec = recorder
+    if rec is not None:
+        # Labelled by the recorder from the cue timeline
+        rec.write([value])
+        recordedData.append(value)
+
+
+def on_cue(event):
+    rec = recorder
+    if event.kind == 'phase' and rec is not None:
+        rec.set_label(event.phase.label, event.phase.name, at=event.t)
+    if event.kind in ('phase', 'tick'):
+        update_cd(cue_text(event))
 
 
+def poll_cues():
+    # Tk timer, the read thread never waits on the countdown
+    cues.poll()
+    root.after(CUE_POLL_MS, poll_cues)
+
+
+# "Begin Recording in 3/2/1", then relax / contract until stopped
+cues = CueEngine([Phase('relax', RELAX, CUE_SECONDS, "Relax Arm. Contract in {}"),
+                  Phase('contract', CONTRACT, CUE_SECONDS, "Contract Arm. Relax in {}")],
+                 lead_in=Phase('relax', RELAX, 3, "Begin Recording in {}"), loop=True)
+cues.listeners.append(on_cue)
+
 def update_label(data):
     root.after(0, lambda: lbl.config(text=str(data)))
 
@@ -128,23 +132,22 @@ def update_cd(data):
 
 def toggleRecord():
     global recordingStarted
-    global recordedData
-    global recordingInitial
+    global recorder
     if (not recordingStarted): 
         rec_btn.config(text="Stop")
-        recordingInitial = True
+        recorder = SessionRecorder(new_session_path("saves", "_Trail_0"), SAMPLE_RATE, 1, labels=LABELS)
+        cues.start()
         print("RECORDING [STARTED]\n")
     else: 
         rec_btn.config(text="Start")
+        cues.stop()
+        update_cd("Recording Stopped")
         print("RECORDING [STOPPED]\n")
-        saveData = np.array(recordedData, dtype=np.int16)
-        print(saveData)
-        print(saveData.shape)
-        if not os.path.exists("saves/"):
-            os.makedirs("saves")
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        np.savetxt(f"saves/{timestamp}_Trail_0.csv", saveData, fmt="%d", delimiter ='; ')
-        recordedData = []
+        rec = recorder
+        recorder = None
+        rec.close()
+        print(f"Saved {rec.n_samples} samples to {rec.path}")
+        reset_plot()
     recordingStarted = not recordingStarted
 
 root = tk.Tk()
@@ -156,21 +159,58 @@ fig, ax = plt.subplots()
 canvas = FigureCanvasTkAgg(fig, master=root)
 canvas.get_tk_widget().grid(row=4, column=0, columnspan=3, pady=20)
 
-def update_plot(data):
-    ax.clear()
-    ax.plot(data, color='blue', label = 'Data Values')
-    recent_data = data[-100:]
-    avg = np.mean(recent_data)
-    ax.scatter(len(data)-1, avg, color='red', label='Point Average')
-    ax.annotate(f'{avg:.2f}', xy=(len(data)-1, avg), xytext=(len(data)-1, avg+0.5),
-                arrowprops=dict(facecolor='red', shrink=0.005),
-                bbox=dict(boxstyle="round,pad=0.3", edgecolor='red', facecolor='white'))
-    ax.legend(loc='upper right')
+# The artists are made once and only their data changes. They are animated,
+# so a frame blits them over the saved background instead of redrawing the
+# whole figure; the axes are only redrawn when the y range has to grow.
+plot_x = np.arange(PLOT_SAMPLES)
+ax.set_xlim(0, PLOT_SAMPLES - 1)
+ax.set_ylim(0, 1)
+data_line, = ax.plot([], [], color='blue', label='Data Values', animated=True)
+avg_point, = ax.plot([], [], 'o', color='red', label='Point Average', animated=True)
+avg_note = ax.annotate('', xy=(0, 0), xytext=(0, 0.5), animated=True,
+                       arrowprops=dict(facecolor='red', shrink=0.005),
+                       bbox=dict(boxstyle="round,pad=0.3", edgecolor='red', facecolor='white'))
+ax.legend(loc='upper right')
+plot_artists = (data_line, avg_point, avg_note)
+
+
+def fit_ylim(data):
+    """Widen the y axis to fit the data, True if it changed."""
+    low, high = ax.get_ylim()
+    data_low, data_high = float(data.min()), float(data.max())
+    if data_low >= low and data_high <= high:
+        return False
+    margin = 0.1 * max(data_high - data_low, 1.0)
+    ax.set_ylim(min(low, data_low - margin), max(high, data_high + margin))
+    return True
+
+
+def reset_plot():
+    recordedData.clear()
+    data_line.set_data([], [])
+    avg_point.set_data([], [])
+    avg_note.set_text('')
+    ax.set_ylim(0, 1)
     canvas.draw()
 
+
+def update_plot(data, avg):
+    x = len(data) - 1
+    if fit_ylim(data):
+        # New tick labels, this frame redraws the axes and the blit
+        # background is taken again
+        canvas.draw()
+    data_line.set_data(plot_x[:len(data)], data)
+    avg_point.set_data([x], [avg])
+    avg_note.xy = (x, avg)
+    avg_note.set_position((x, avg + 0.5))
+    avg_note.set_text(f'{avg:.2f}')
+
+
 def animate(i):
-    if recordedData and recordingStarted:
-        update_plot([row[0] for row in recordedData])
+    if len(recordedData) and recordingStarted:
+        update_plot(recordedData.values().copy(), recordedData.mean())
+    return plot_artists
 
 def close():
     print("closing")
@@ -178,7 +218,7 @@ def close():
     root.destroy()
 
 
-ani = animation.FuncAnimation(fig, animate, interval=1000)
+ani = animation.FuncAnimation(fig, animate, interval=PLOT_INTERVAL_MS, blit=True, cache_frame_data=False)
 
 lbl = tk.Label(root, text="Waiting for data...", font=("Helvetica", 16))
 lbl.grid(row=0, column=0, columnspan=3, pady=20)
@@ -205,6 +245,6 @@ root.grid_columnconfigure(1, weight=1)
 root.grid_columnconfigure(2, weight=1)
 
 # =============================================================================
-sleep(1)
-thread = threading.Thread(target=read_serial).start()
+thread = threading.Thread(target=read_serial, daemon=True).start()
+poll_cues()
 root.mainloop()
@@ -0,0 +1,276 @@
+"""
+Serial protocol for the EMG boards.
+
+Binary frame layout (little endian):
+
+    offset  size  field
+    0       2     sync bytes 0xA5 0x5A
+    2       2     sequence number (uint16, wraps around)
+    4       1     channel count
+    5       4*n   samples, int32 (ADS1299 24-bit values sign extended)
+    5+4*n   1     checksum: sum of bytes 2 .. 5+4*n-1, mod 256
+
+Timestamped frames, for boards that forward several ESP-NOW sender nodes,
+set the top bit of the channel count and insert the sending node and its
+clock after it:
+
+    4       1     channel count | 0x80
+    5       1     node id
+    6       4     node timestamp, microseconds (uint32, wraps after ~71 min)
+    10      4*n   samples
+    10+4*n  1     checksum: sum of bytes 2 .. 10+4*n-1, mod 256
+
+Sequence numbers then count per node. See alignment.py for putting several
+nodes onto one timeline.
+
+The decoders take whatever bytes the port has and return every complete
+sample in one (n_samples, n_channels) block. Corrupt frames are skipped and
+the decoder resyncs on the next sync header.
+"""
+import numpy as np
+
+SYNC = b'\xa5\x5a'
+HEADER_SIZE = 5
+TIMESTAMP_FLAG = 0x80
+TIMESTAMPED_HEADER_SIZE = 10
+TIMESTAMP_MODULO = 1 << 32
+SAMPLE_DTYPE = np.dtype('<i4')
+SEQ_MODULO = 1 << 16
+
+
+def frame_size(n_channels, timestamped=False):
+    header = TIMESTAMPED_HEADER_SIZE if timestamped else HEADER_SIZE
+    return header + n_channels * SAMPLE_DTYPE.itemsize + 1
+
+
+def encode_frames(samples, seq_start=0, timestamps=None, node=0):
+    """
+    Pack an (n_samples, n_channels) block into binary frames. Passing
+    timestamps (microseconds, one per sample) makes timestamped frames.
+    """
+    samples = np.asarray(samples)
+    if samples.ndim == 1:
+        samples = samples.reshape(-1, 1)
+    n, n_channels = samples.shape
+    timestamped = timestamps is not None
+    header = TIMESTAMPED_HEADER_SIZE if timestamped else HEADER_SIZE
+    size = frame_size(n_channels, timestamped)
+
+    frames = np.empty((n, size), dtype=np.uint8)
+    frames[:, 0] = SYNC[0]
+    frames[:, 1] = SYNC[1]
+    seq = (np.arange(n) + seq_start) % SEQ_MODULO
+    frames[:, 2] = seq & 0xFF
+    frames[:, 3] = seq >> 8
+    frames[:, 4] = n_channels
+    if timestamped:
+        frames[:, 4] |= TIMESTAMP_FLAG
+        frames[:, 5] = node
+        stamps = (np.asarray(timestamps, dtype=np.int64) % TIMESTAMP_MODULO).astype('<u4')
+        frames[:, 6:10] = stamps.view(np.uint8).reshape(n, 4)
+    frames[:, header:-1] = samples.astype(SAMPLE_DTYPE).view(np.uint8).reshape(n, -1)
+    frames[:, -1] = frames[:, 2:-1].sum(axis=1, dtype=np.uint32) & 0xFF
+    return frames.tobytes()
+
+
+def encode_lines(samples):
+    """Format an (n_samples, n_channels) block as legacy "a,b,c\\n" lines."""
+    samples = np.asarray(samples)
+    if samples.ndim == 1:
+        samples = samples.reshape(-1, 1)
+    rows = np.round(samples).astype(np.int64).astype(str)
+    return ''.join(','.join(row) + '\n' for row in rows).encode()
+
+
+class FrameDecoder:
+    """
+    With timestamped=True it expects timestamped frames, and after each
+    feed() `nodes` and `timestamps` hold the node id and node clock of the
+    samples it returned.
+    """
+    def __init__(self, n_channels, timestamped=False):
+        self.n_channels = n_channels
+        self.timestamped = timestamped
+        self.header_size = TIMESTAMPED_HEADER_SIZE if timestamped else HEADER_SIZE
+        self.channel_byte = n_channels | TIMESTAMP_FLAG if timestamped else n_channels
+        self.frame_size = frame_size(n_channels, timestamped)
+        self._pending = b''
+        self._offsets = np.arange(self.frame_size)
+        self.nodes = np.zeros(0, dtype=np.uint8)
+        self.timestamps = np.zeros(0, dtype=np.uint32)
+
+        # Stats
+        self.frames = 0
+        self.bad_frames = 0
+        self.skipped_bytes = 0
+        self.seq_gaps = 0
+        self.last_seq = None
+        self._last_seq_by_node = {}
+
+    def feed(self, data):
+        """
+        Decode as many frames as possible from the bytes seen so far.
+        Returns (samples, seq): an (n, n_channels) int32 block and the
+        matching uint16 sequence numbers.
+        """
+        buf = np.frombuffer(self._pending + bytes(data), dtype=np.uint8)
+        size = self.frame_size
+        if len(buf) < size:
+            self._pending = buf.tobytes()
+            return self._empty()
+
+        starts = np.flatnonzero((buf[:-1] == SYNC[0]) & (buf[1:] == SYNC[1]))
+        complete = starts[starts + size <= len(buf)]
+
+        frames = buf[complete[:, None] + self._offsets]
+        checksum = frames[:, 2:-1].sum(axis=1, dtype=np.uint32) & 0xFF
+        valid = (frames[:, 4] == self.channel_byte) & (checksum == frames[:, -1])
+
+        pos = complete[valid]
+        frames = frames[valid]
+        keep = self._non_overlapping(pos)
+        if keep is not None:
+            pos = pos[keep]
+            frames = frames[keep]
+        self.bad_frames += self._count_bad(complete[~valid], pos)
+
+        # Keep a trailing partial frame (or a lone first sync byte) for next time
+        end = int(pos[-1]) + size if len(pos) else 0
+        partial = starts[(starts + size > len(buf)) & (starts >= end)]
+        if len(partial):
+            tail = int(partial[0])
+        elif buf[-1] == SYNC[0]:
+            tail = len(buf) - 1
+        else:
+            tail = len(buf)
+        tail = max(tail, end)
+        self._pending = buf[tail:].tobytes()
+        self.skipped_bytes += tail - len(pos) * size
+
+        return self._unpack(frames)
+
+    def _non_overlapping(self, pos):
+        # A sync pattern inside a payload can pass the checksum by chance,
+        # drop anything that starts inside the previous accepted frame
+        if len(pos) < 2 or np.all(np.diff(pos) >= self.frame_size):
+            return None
+        keep = np.zeros(len(pos), dtype=bool)
+        end = -1
+        for i, p in enumerate(pos):
+            if p >= end:
+                keep[i] = True
+                end = p + self.frame_size
+        return keep
+
+    def _count_bad(self, rejected, pos):
+        """Rejected candidates that aren't just sync bytes inside an accepted frame."""
+        if len(rejected) == 0 or len(pos) == 0:
+            return len(rejected)
+        before = np.searchsorted(pos, rejected, side='right') - 1
+        inside = (before >= 0) & (rejected < pos[np.maximum(before, 0)] + self.frame_size)
+        return int(np.count_nonzero(~inside))
+
+    def _unpack(self, frames):
+        n = len(frames)
+        if n == 0:
+            return self._empty()
+        seq = frames[:, 2].astype(np.uint16) | (frames[:, 3].astype(np.uint16) << 8)
+        payload = np.ascontiguousarray(frames[:, self.header_size:-1])
+        samples = payload.view(SAMPLE_DTYPE).reshape(n, self.n_channels)
+
+        if self.timestamped:
+            self.nodes = frames[:, 5].copy()
+            self.timestamps = np.ascontiguousarray(frames[:, 6:10]).view('<u4').ravel()
+            # Every node numbers its own frames
+            for node in np.unique(self.nodes):
+                self._count_gaps(seq[self.nodes == node], int(node))
+        else:
+            self._count_gaps(seq, 0)
+        self.last_seq = int(seq[-1])
+        self.frames += n
+        return samples, seq
+
+    def _count_gaps(self, seq, node):
+        seq = seq.astype(np.int64)
+        last = self._last_seq_by_node.get(node)
+        if last is not None:
+            seq = np.concatenate(([last], seq))
+        steps = np.diff(seq) % SEQ_MODULO
+        # A step of more than half the range is a frame going backwards (a
+        # corrupt one that slipped through), not tens of thousands missing
+        steps = steps[(steps > 0) & (steps < SEQ_MODULO // 2)]
+        self.seq_gaps += int(np.sum(steps - 1))
+        self._last_seq_by_node[node] = int(seq[-1])
+
+    def _empty(self):
+        if self.timestamped:
+            self.nodes = np.zeros(0, dtype=np.uint8)
+            self.timestamps = np.zeros(0, dtype=np.uint32)
+        return np.empty((0, self.n_channels), dtype=SAMPLE_DTYPE), np.empty(0, dtype=np.uint16)
+
+
+class AsciiLineDecoder:
+    """
+    Legacy "a,b,c\\n" lines from the ESP32 receiver firmware. Same interface
+    as FrameDecoder, sequence numbers are just a running count.
+    """
+    def __init__(self, n_channels):
+        self.n_channels = n_channels
+        self._pending = b''
+        self._seq = 0
+
+        self.frames = 0
+        self.bad_frames = 0
+        self.skipped_bytes = 0
+        self.seq_gaps = 0
+        self.last_seq = None
+
+    def feed(self, data):
+        lines = (self._pending + bytes(data)).split(b'\n')
+        self._pending = lines.pop()
+
+        lines = [line.strip() for line in lines]
+        good = [line for line in lines if line.count(b',') == self.n_channels - 1 and line]
+        self.bad_frames += len(lines) - len(good)
+
+        try:
+            values = np.array(b','.join(good).split(b','), dtype=bytes).astype(np.int32) if good else []
+        except ValueError:
+            values = []
+            for line in good:
+                try:
+                    values.extend(int(v) for v in line.split(b','))
+                except ValueError:
+                    self.bad_frames += 1
+        samples = np.asarray(values, dtype=np.int32).reshape(-1, self.n_channels)
+
+        n = len(samples)
+        seq = ((np.arange(n) + self._seq) % SEQ_MODULO).astype(np.uint16)
+        self._seq += n
+        self.frames += n
+        if n:
+            self.last_seq = int(seq[-1])
+        return samples, seq
+
+
+class FrameReader:
+    """
+    Drains a serial port in one read and decodes everything that arrived.
+    Pass an instrumentation.Stats to time the 'read' and 'decode' stages.
+    """
+    def __init__(self, ser, decoder, stats=None):
+        self.ser = ser
+        self.decoder = decoder
+        self.stats = stats
+
+    def read(self):
+        if self.stats is None:
+            # Blocks for at most the port timeout when nothing is waiting
+            return self.decoder.feed(self.ser.read(self.ser.in_waiting or 1))
+
+        with self.stats.time('read'):
+            data = self.ser.read(self.ser.in_waiting or 1)
+        with self.stats.time('decode'):
+            samples, seq = self.decoder.feed(data)
+        self.stats.count('bytes', len(data))
+        return samples, seq
@@ -0,0 +1,224 @@
+"""
+Append-only session files for recordings.
+
+Layout:
+    4096 byte header: magic + JSON metadata padded with spaces
+    fixed-size records, one per sample:
+        t      float64   timestamp (seconds since epoch)
+        label  int16     label code, see metadata['labels'], UNLABELED (-1)
+                         where nobody said what was going on
+        x      float32   one value per channel
+
+Samples are buffered into a preallocated chunk and appended to the file
+when the chunk fills up or every flush_interval seconds, followed by an
+fsync. After a crash everything up to the last flush is on disk;
+recover_session() trims a half-written record and fixes up the header.
+"""
+import bisect
+import datetime
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+MAGIC = b'EMGFAB01'
+HEADER_SIZE = 4096
+SESSION_EXT = '.emg'
+# Samples recorded without any cue or label, not the same as rest (0)
+UNLABELED = -1
+UNLABELED_NAME = 'unlabeled'
+
+
+def record_dtype(n_channels, sample_dtype='<f4'):
+    return np.dtype([('t', '<f8'), ('label', '<i2'), ('x', sample_dtype, (n_channels,))])
+
+
+def _channel_names(channels):
+    if isinstance(channels, int):
+        return [f"ch{i + 1}" for i in range(channels)]
+    return list(channels)
+
+
+def write_header(f, meta):
+    text = json.dumps(meta).encode('utf-8')
+    if len(MAGIC) + len(text) + 1 > HEADER_SIZE:
+        raise ValueError("session metadata doesn't fit in the header")
+    f.seek(0)
+    f.write(MAGIC + text.ljust(HEADER_SIZE - len(MAGIC) - 1) + b'\n')
+
+
+def read_header(f):
+    f.seek(0)
+    raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE or not raw.startswith(MAGIC):
+        raise ValueError("not an EMG session file")
+    return json.loads(raw[len(MAGIC):].decode('utf-8'))
+
+
+class SessionRecorder:
+    """
+    Streams samples to a session file.
+
+        with SessionRecorder('saves/run.emg', 1000, 8, labels={0: 'rest'}) as rec:
+            rec.write(block)
+
+    Samples are UNLABELED until the first set_label() (or explicit labels
+    passed to write()), a recording without cues isn't taken for rest.
+    write() can be called from the acquisition thread while another thread
+    changes the label or closes the recorder. Writes after close() are
+    ignored so the GUI can stop a recording at any point.
+    """
+    def __init__(self, path, sample_rate, channels, labels=None, metadata=None,
+                 chunk_size=4096, flush_interval=1.0, sample_dtype='<f4'):
+        self.path = path
+        self.channels = _channel_names(channels)
+        self.n_channels = len(self.channels)
+        self.sample_rate = sample_rate
+        self.dtype = record_dtype(self.n_channels, sample_dtype)
+        self.flush_interval = flush_interval
+
+        self.meta = {
+            'format': 'emg-fabric-session',
+            'version': 1,
+            'sample_rate': sample_rate,
+            'channels': self.channels,
+            'sample_dtype': sample_dtype,
+            'labels': {str(UNLABELED): UNLABELED_NAME, **{str(k): v for k, v in (labels or {}).items()}},
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'n_samples': 0,
+            'closed': False,
+        }
+        self.meta.update(metadata or {})
+
+        self.chunk = np.zeros(chunk_size, dtype=self.dtype)
+        self.filled = 0
+        self.n_samples = 0
+        self.label = UNLABELED
+        # Label changes by timestamp, so samples are labelled by when they
+        # were taken rather than when they were written
+        self._label_times = [-np.inf]
+        self._label_values = [UNLABELED]
+        self.closed = False
+        self._lock = threading.Lock()
+        self._last_flush = time.time()
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.file = open(path, 'wb')
+        write_header(self.file, self.meta)
+        self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def set_label(self, label, name=None, at=None):
+        """
+        Label for samples timestamped from `at` (default now) on. Samples
+        from `at` on that were already written but not flushed yet are
+        relabelled, up to the next label change.
+        """
+        at = time.time() if at is None else at
+        with self._lock:
+            self.label = label
+            i = bisect.bisect_right(self._label_times, at)
+            self._label_times.insert(i, at)
+            self._label_values.insert(i, label)
+            until = self._label_times[i + 1] if i + 1 < len(self._label_times) else np.inf
+            rows = self.chunk[:self.filled]
+            rows['label'][(rows['t'] >= at) & (rows['t'] < until)] = label
+            if name is not None:
+                self.meta['labels'][str(label)] = name
+
+    def write(self, samples, timestamps=None, labels=None):
+        """
+        Append an (n_samples, n_channels) block. Without timestamps the block
+        is assumed to end now and be evenly spaced at the sample rate.
+        """
+        samples = np.asarray(samples).reshape(-1, self.n_channels)
+        n = len(samples)
+        if n == 0:
+            return
+        if timestamps is None:
+            timestamps = time.time() - np.arange(n - 1, -1, -1) / self.sample_rate
+
+        with self._lock:
+            if self.closed:
+                return
+            timestamps = np.broadcast_to(timestamps, (n,))
+            if labels is None:
+                changes = np.searchsorted(self._label_times, timestamps, side='right') - 1
+                label = np.asarray(self._label_values)[changes]
+            else:
+                label = np.broadcast_to(labels, (n,))
+            done = 0
+            while done < n:
+                take = min(n - done, len(self.chunk) - self.filled)
+                rows = self.chunk[self.filled:self.filled + take]
+                rows['t'] = timestamps[done:done + take]
+                rows['label'] = label[done:done + take]
+                rows['x'] = samples[done:done + take]
+                self.filled += take
+                done += take
+                if self.filled == len(self.chunk):
+                    self._write_chunk()
+            if time.time() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def _write_chunk(self):
+        if self.filled:
+            self.file.write(memoryview(self.chunk[:self.filled]).cast('B'))
+            self.n_samples += self.filled
+            self.filled = 0
+
+    def _flush(self):
+        self._write_chunk()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self._last_flush = time.time()
+
+    def flush(self):
+        with self._lock:
+            if not self.closed:
+                self._flush()
+
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self._flush()
+            self.meta['n_samples'] = self.n_samples
+            self.meta['closed'] = True
+            write_header(self.file, self.meta)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            self.closed = True
+
+
+def recover_session(path):
+    """
+    Make a session left behind by a crash readable again: drop a partially
+    written last record and store the real sample count in the header.
+    Returns the metadata.
+    """
+    with open(path, 'r+b') as f:
+        meta = read_header(f)
+        dtype = record_dtype(len(meta['channels']), meta['sample_dtype'])
+        size = os.fstat(f.fileno()).st_size
+        n_samples = (size - HEADER_SIZE) // dtype.itemsize
+        f.truncate(HEADER_SIZE + n_samples * dtype.itemsize)
+        meta['n_samples'] = n_samples
+        meta['closed'] = True
+        write_header(f, meta)
+    return meta
+
+
+def new_session_path(folder='saves', suffix=''):
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    return os.path.join(folder, f"{timestamp}{suffix}{SESSION_EXT}")
@@ -0,0 +1,104 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Preallocated multi-channel ring buffer for sliding windows.
+
+    Every sample is written twice (at i and i + capacity), so the latest
+    `capacity` samples are always one contiguous slice of the backing array
+    and windows can be handed out as views instead of copies.
+
+    count is the total number of samples ever written. A new window is
+    "ready" every `hop` samples once the first full window has arrived.
+    """
+    def __init__(self, capacity, n_channels=1, dtype=np.float32, window=None, hop=1, data=None):
+        self.capacity = capacity
+        self.n_channels = n_channels
+        self.window = window or capacity
+        self.hop = hop
+        if self.window > capacity:
+            raise ValueError("window can't be larger than the buffer capacity")
+
+        # data can be passed in to put the buffer somewhere else (e.g. shared memory)
+        if data is None:
+            data = np.zeros((2 * capacity, n_channels), dtype=dtype)
+        elif data.shape != (2 * capacity, n_channels):
+            raise ValueError(f"data must have shape {(2 * capacity, n_channels)}")
+        self.data = data
+        self.count = 0
+        self.next_ready = self.window
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def clear(self):
+        self.count = 0
+        self.next_ready = self.window
+
+    def append(self, sample):
+        pos = self.count % self.capacity
+        self.data[pos] = sample
+        self.data[pos + self.capacity] = sample
+        self.count += 1
+
+    def extend(self, block):
+        """Bulk write of an (n_samples, n_channels) block."""
+        block = np.asarray(block, dtype=self.data.dtype).reshape(-1, self.n_channels)
+        n = len(block)
+        count = self.count
+        if n > self.capacity:
+            # Anything older than one capacity would be overwritten anyway
+            count += n - self.capacity
+            block = block[-self.capacity:]
+            n = self.capacity
+
+        cap = self.capacity
+        pos = count % cap
+        first = min(n, cap - pos)
+        self.data[pos:pos + first] = block[:first]
+        self.data[pos + cap:pos + cap + first] = block[:first]
+        rest = n - first
+        if rest:
+            self.data[:rest] = block[first:]
+            self.data[cap:cap + rest] = block[first:]
+        # count only moves once the samples are in place
+        self.count = count + n
+
+    def latest(self, n=None):
+        """View of the newest n samples (default: everything held), oldest first."""
+        n = len(self) if n is None else min(n, len(self))
+        end = self.count % self.capacity + self.capacity
+        return self.data[end - n:end]
+
+    def get_window(self, end=None):
+        """
+        View of the `window` samples ending at sample number `end`
+        (default: the newest sample). Returns None if that part of the
+        stream has already been overwritten or hasn't arrived yet.
+        """
+        end = self.count if end is None else end
+        if end > self.count or end < self.window or self.count - end + self.window > self.capacity:
+            return None
+        stop = end % self.capacity + self.capacity
+        return self.data[stop - self.window:stop]
+
+    def is_full(self):
+        return self.count >= self.window
+
+    def windows_ready(self):
+        """Number of hop boundaries crossed since the last window was taken."""
+        if self.count < self.next_ready:
+            return 0
+        return (self.count - self.next_ready) // self.hop + 1
+
+    def next_window(self):
+        """
+        Newest window if at least one hop has passed since the last call,
+        otherwise None. Skipped hops are dropped, see windows_ready().
+        """
+        pending = self.windows_ready()
+        if pending == 0:
+            return None
+        self.next_ready += pending * self.hop
+        return self.latest(self.window)
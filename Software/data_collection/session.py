@@ -0,0 +1,108 @@
+"""
+Memory-mapped reader for session files written by recorder.SessionRecorder.
+
+Nothing is loaded up front. Slices and windows are views into the mapped
+file, so only the pages that get touched are read from disk.
+
+    session = Session('saves/2026-01-12_10-00-00.emg')
+    block = session.slice(0, 2000, channels=slice(0, 4))
+    for starts, windows in session.iter_windows(200, 25):
+        ...  # windows is (n_windows, 200, n_channels)
+"""
+import os
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from recorder import HEADER_SIZE, read_header, record_dtype
+
+
+class Session:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.meta = read_header(f)
+        self.channels = self.meta['channels']
+        self.n_channels = len(self.channels)
+        self.sample_rate = self.meta['sample_rate']
+        self.label_names = {int(k): v for k, v in self.meta['labels'].items()}
+
+        dtype = record_dtype(self.n_channels, self.meta['sample_dtype'])
+        # Count from the file size, the header is only updated on close
+        n_samples = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+        if n_samples > 0:
+            self.records = np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(n_samples,))
+        else:
+            self.records = np.zeros(0, dtype=dtype)
+
+        self.samples = self.records['x']
+        self.timestamps = self.records['t']
+        self.labels = self.records['label']
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def duration(self):
+        return len(self) / self.sample_rate
+
+    def channel_index(self, channels):
+        """
+        Turns channel names into indices. Ints and slices are passed through,
+        a list of names becomes a list of indices.
+        """
+        if channels is None:
+            return slice(None)
+        if isinstance(channels, str):
+            return self.channels.index(channels)
+        if isinstance(channels, (int, slice)):
+            return channels
+        return [self.channels.index(c) if isinstance(c, str) else c for c in channels]
+
+    def slice(self, start=0, stop=None, channels=None):
+        """
+        Samples [start, stop) for the given channels. A view into the file
+        unless channels is a list, which numpy has to copy.
+        """
+        return self.samples[start:stop, self.channel_index(channels)]
+
+    def windows(self, window, hop, start=0, stop=None, channels=None):
+        """
+        Strided (n_windows, window, n_channels) view of every window of
+        `window` samples taken every `hop` samples. No data is copied.
+        """
+        data = self.slice(start, stop, channels)
+        if data.ndim == 1:
+            data = data[:, None]
+        if len(data) < window:
+            return np.zeros((0, window, data.shape[1]), dtype=data.dtype)
+        return sliding_window_view(data, window, axis=0)[::hop].transpose(0, 2, 1)
+
+    def window_starts(self, window, hop, start=0, stop=None):
+        stop = len(self) if stop is None else min(stop, len(self))
+        return np.arange(start, stop - window + 1, hop)
+
+    def iter_windows(self, window, hop, batch=4096, channels=None):
+        """
+        Yields (starts, windows) in batches of up to `batch` windows, so
+        feature code can work through a long session a chunk at a time.
+        """
+        starts = self.window_starts(window, hop)
+        for i in range(0, len(starts), batch):
+            first = starts[i:i + batch]
+            stop = int(first[-1]) + window
+            yield first, self.windows(window, hop, int(first[0]), stop, channels)
+
+    def label_spans(self):
+        """[(start, stop, label), ...] for each run of identical labels."""
+        labels = np.asarray(self.labels)
+        if len(labels) == 0:
+            return []
+        changes = np.flatnonzero(np.diff(labels)) + 1
+        starts = np.concatenate(([0], changes))
+        stops = np.concatenate((changes, [len(labels)]))
+        return [(int(a), int(b), int(labels[a])) for a, b in zip(starts, stops)]
+
+    def close(self):
+        # Dropping the memmap closes the mapping
+        self.records = self.samples = self.timestamps = self.labels = None
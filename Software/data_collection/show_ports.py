@@ -1,5 +1,7 @@
-import serial.tools.list_ports
+from transport import KNOWN_VIDS, discover_port, list_ports
 
-ports = serial.tools.list_ports.comports()
-for port in ports:
-    print(port.device, port.description)
+# '*' marks the port SERIAL_PORT = 'auto' would pick
+best = discover_port()
+for port in list_ports():
+    mark = '*' if port.device == best else ' '
+    print(mark, port.device, port.description, KNOWN_VIDS.get(port.vid, ''))
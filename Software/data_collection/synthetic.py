@@ -0,0 +1,113 @@
+"""
+Seeded synthetic EMG for benchmarks and hardware-free testing.
+
+    emg = SyntheticEMG(sample_rate=4000, n_channels=8, seed=1)
+    samples, labels = emg.generate(4000)  # one second, continues on the next call
+    raw = emg.frames(4000, corrupt=0.001)  # same thing as binary frames
+
+The signal is band-limited noise (20-450 Hz by default) gated into bursts.
+Each class activates the channels with its own fixed weights, rest is
+class 0 with only the noise floor. Burst on/offsets are smoothed so they
+look like muscle activation rather than a switch. The same seed always
+gives the same stream, however it is split into calls.
+
+transport.synthetic_transport() serves it like a serial port.
+"""
+import numpy as np
+import scipy.signal as signal
+
+from protocol import encode_frames
+
+
+class SyntheticEMG:
+    def __init__(self, sample_rate=1000, n_channels=1, seed=0, n_classes=2, amplitude=2000.0, noise=50.0,
+                 band=(20.0, 450.0), burst_seconds=(0.5, 1.5), rest_seconds=(0.5, 2.0), onset_ms=30.0):
+        self.sample_rate = sample_rate
+        self.n_channels = n_channels
+        self.n_classes = n_classes
+        self.amplitude = amplitude
+        self.noise = noise
+        self.burst_seconds = burst_seconds
+        self.rest_seconds = rest_seconds
+        # Separate streams so the output doesn't depend on how it is chunked
+        schedule, carrier, noise, corrupt = np.random.SeedSequence(seed).spawn(4)
+        self.schedule_rng = np.random.default_rng(schedule)
+        self.carrier_rng = np.random.default_rng(carrier)
+        self.noise_rng = np.random.default_rng(noise)
+        self.corrupt_rng = np.random.default_rng(corrupt)
+
+        nyquist_f = sample_rate / 2
+        self.band_sos = signal.butter(4, [band[0] / nyquist_f, min(band[1] / nyquist_f, 0.99)],
+                                      btype='bandpass', output='sos')
+        self.band_zi = np.zeros((self.band_sos.shape[0], 2, n_channels))
+
+        # One-pole smoothing of the burst gate
+        self.onset_a = np.exp(-1000.0 / (onset_ms * sample_rate))
+        self.gain = np.zeros(n_channels)
+
+        # Channel weights per class, rest (class 0) activates nothing
+        self.weights = np.vstack((np.zeros(n_channels), self.schedule_rng.uniform(0.2, 1.0, (n_classes - 1, n_channels))))
+
+        self.label = 0
+        self.remaining = self._duration(self.rest_seconds)
+        self.seq = 0
+        self.n_samples = 0
+
+    def _duration(self, seconds):
+        return max(1, int(self.schedule_rng.uniform(*seconds) * self.sample_rate))
+
+    def _schedule(self, n):
+        """Per-sample class labels for the next n samples."""
+        labels = np.empty(n, dtype=np.int16)
+        pos = 0
+        while pos < n:
+            take = min(self.remaining, n - pos)
+            labels[pos:pos + take] = self.label
+            pos += take
+            self.remaining -= take
+            if self.remaining == 0:
+                if self.label == 0:
+                    self.label = int(self.schedule_rng.integers(1, self.n_classes)) if self.n_classes > 1 else 0
+                    self.remaining = self._duration(self.burst_seconds)
+                else:
+                    self.label = 0
+                    self.remaining = self._duration(self.rest_seconds)
+        return labels
+
+    def generate(self, n):
+        """Returns (samples, labels): (n, n_channels) float64 and (n,) int16."""
+        labels = self._schedule(n)
+        carrier = self.carrier_rng.standard_normal((n, self.n_channels))
+        carrier, self.band_zi = signal.sosfilt(self.band_sos, carrier, axis=0, zi=self.band_zi)
+
+        # Smooth the gate so bursts ramp up and down
+        gate = self.weights[labels]
+        gate, zf = signal.lfilter([1 - self.onset_a], [1, -self.onset_a], gate, axis=0,
+                                  zi=(self.onset_a * self.gain)[None])
+        self.gain = zf[0]
+
+        samples = self.amplitude * gate * carrier + self.noise * self.noise_rng.standard_normal((n, self.n_channels))
+        self.n_samples += n
+        return samples, labels
+
+    def frames(self, n, corrupt=0.0):
+        """Next n samples as binary protocol frames, optionally corrupted."""
+        samples, labels = self.generate(n)
+        data = encode_frames(np.round(samples), seq_start=self.seq)
+        self.seq += n
+        if corrupt:
+            data = corrupt_bytes(data, corrupt, self.corrupt_rng)
+        return data
+
+
+def corrupt_bytes(data, rate, rng=None):
+    """
+    Damage roughly `rate` of the bytes: half are flipped to random values,
+    half are dropped, like a noisy or overrun UART.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    buf = np.frombuffer(data, dtype=np.uint8).copy()
+    hit = rng.random(len(buf)) < rate
+    flip = hit & (rng.random(len(buf)) < 0.5)
+    buf[flip] = rng.integers(0, 256, np.count_nonzero(flip), dtype=np.uint8)
+    return buf[~(hit & ~flip)].tobytes()
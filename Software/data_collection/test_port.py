@@ -1,11 +1,12 @@
-import serial
+from transport import open_transport
 
-# Replace with your actual port and baud rate
-PORT = "/dev/cu.SLAB_USBtoUART"  # e.g. "COM3" on Windows, "/dev/ttyUSB0" or "/dev/ttyACM0" on Linux/Mac
+# 'auto' finds the board, or e.g. "COM3" on Windows, "/dev/ttyUSB0" or "/dev/ttyACM0" on Linux/Mac,
+# or "synthetic://?rate=100&channels=3" to check the setup without one
+PORT = "auto"
 BAUD = 9600
 
 # Open serial connection
-ser = serial.Serial(PORT, BAUD, timeout=1)
+ser = open_transport(PORT, BAUD, timeout=1, protocol='ascii')
 
 try:
     while True:
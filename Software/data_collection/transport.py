@@ -0,0 +1,368 @@
+"""
+Byte sources the readers open by name instead of a hard-coded port.
+
+    open_transport('auto', 115200)             first USB serial port that looks like an ESP32
+    open_transport('/dev/ttyUSB0', 115200)     that port, through pyserial
+    open_transport('synthetic://?rate=4000&channels=8&seed=1&corrupt=0.001&realtime=1')
+    open_transport('synthetic://?rate=1000&channels=8&nodes=2&drift=50', protocol='timestamped')
+    open_transport('replay://saves/2025_03_01_Trail_0.emg?speed=10')
+    open_transport('loop://')                  in-process loopback, read() returns what was written
+
+Everything returned has the part of serial.Serial the readers use: read,
+readline, in_waiting, write, reset_input_buffer, close, timeout, is_open
+and the context manager. synthetic:// and replay:// produce binary frames
+(or legacy ascii lines with protocol=ascii, or timestamped frames from
+one or more sender nodes with protocol=timestamped) paced to their sample
+rate times `speed`, or as fast as they are read with realtime=0 / speed=0.
+
+To feed code that only takes a device path (another process, pyserial
+itself), bridge a transport onto a pseudo-terminal:
+
+    python transport.py 'synthetic://?rate=16000&channels=8'
+
+Without arguments it lists the serial ports, marking the one 'auto' picks.
+"""
+import os
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from protocol import encode_frames, encode_lines, frame_size
+from session import Session
+
+# USB-UART bridges used on ESP32 boards, by USB vendor id
+KNOWN_VIDS = {
+    0x10C4: 'CP210x',
+    0x1A86: 'CH340',
+    0x0403: 'FTDI',
+    0x303A: 'Espressif',
+}
+
+
+class BufferedTransport:
+    """Base for the in-process transports, subclasses refill the buffer in _fill()."""
+    def __init__(self, timeout=0.05):
+        self.timeout = timeout
+        self.is_open = True
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+
+    def _fill(self):
+        pass
+
+    def exhausted(self):
+        """True once nothing more will ever arrive."""
+        return False
+
+    def _wait(self, ready):
+        # Like pyserial, block for up to `timeout` until ready() says so
+        deadline = time.perf_counter() + (self.timeout or 0)
+        while True:
+            with self._lock:
+                self._fill()
+                if ready() or self.exhausted():
+                    return
+            if time.perf_counter() >= deadline:
+                return
+            time.sleep(0.0005)
+
+    @property
+    def in_waiting(self):
+        with self._lock:
+            self._fill()
+            return len(self._buffer)
+
+    def read(self, size=1):
+        self._wait(lambda: len(self._buffer) > 0)
+        with self._lock:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
+
+    def readline(self):
+        self._wait(lambda: b'\n' in self._buffer)
+        with self._lock:
+            end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+            data = bytes(self._buffer[:end])
+            del self._buffer[:end]
+        return data
+
+    def write(self, data):
+        return len(data)
+
+    def reset_input_buffer(self):
+        with self._lock:
+            self._buffer.clear()
+
+    def close(self):
+        self.is_open = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LoopbackTransport(BufferedTransport):
+    """Whatever is written comes back out of read()."""
+    def write(self, data):
+        with self._lock:
+            self._buffer += data
+        return len(data)
+
+
+class StreamTransport(BufferedTransport):
+    """
+    Serves the bytes of an iterator of chunks, released at `byte_rate`
+    bytes per second or, with byte_rate=None, a chunk whenever the buffer
+    runs dry.
+    """
+    def __init__(self, chunks, byte_rate=None, timeout=0.05):
+        super().__init__(timeout)
+        self.chunks = iter(chunks)
+        self.byte_rate = byte_rate
+        self.released = 0
+        self._staged = bytearray()
+        self._done = False
+        self._started = time.perf_counter()
+
+    def _next_chunk(self):
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self._done = True
+            return b''
+        return chunk
+
+    def _fill(self):
+        if self.byte_rate is None:
+            if not self._buffer and not self._done:
+                self._buffer += self._next_chunk()
+            return
+        allowed = int((time.perf_counter() - self._started) * self.byte_rate) - self.released
+        while len(self._staged) < allowed and not self._done:
+            self._staged += self._next_chunk()
+        take = min(allowed, len(self._staged))
+        if take > 0:
+            self._buffer += self._staged[:take]
+            del self._staged[:take]
+            self.released += take
+
+    def exhausted(self):
+        return self._done and not self._staged and not self._buffer
+
+
+def _encoder(protocol, sample_rate=1000, clocks=((0, 0, 0.0),)):
+    """
+    encode(samples, first sample index) -> bytes. For timestamped frames the
+    channels are split evenly over `clocks`, (node id, start in us, drift)
+    per sender node.
+    """
+    if protocol == 'binary':
+        return lambda samples, seq: encode_frames(np.round(samples), seq_start=seq)
+    if protocol == 'timestamped':
+        def encode(samples, seq):
+            per_node = samples.shape[1] // len(clocks)
+            elapsed = (seq + np.arange(len(samples))) / sample_rate
+            return b''.join(
+                encode_frames(np.round(samples[:, i * per_node:(i + 1) * per_node]), seq,
+                              timestamps=start + np.round(elapsed * (1 + drift) * 1e6), node=node)
+                for i, (node, start, drift) in enumerate(clocks))
+        return encode
+    return lambda samples, seq: encode_lines(samples)
+
+
+def _clocks(n_nodes, drift_ppm, rng):
+    # Random start times and drifts within +-drift_ppm, like free running node clocks
+    return [(node, int(rng.integers(0, 1 << 32)), float(rng.uniform(-drift_ppm, drift_ppm)) * 1e-6)
+            for node in range(n_nodes)]
+
+
+def synthetic_transport(sample_rate=1000, n_channels=1, seed=0, corrupt=0.0, realtime=True, speed=1.0,
+                        chunk=None, max_samples=None, protocol='binary', nodes=1, drift_ppm=50.0, timeout=0.05,
+                        **emg_kwargs):
+    """
+    StreamTransport over a SyntheticEMG, see synthetic.py for emg_kwargs.
+    Timestamped frames come from `nodes` senders whose clocks drift by up
+    to drift_ppm.
+    """
+    # Imported here, synthetic.py pulls in scipy which a real port doesn't need
+    from synthetic import SyntheticEMG, corrupt_bytes
+
+    emg = SyntheticEMG(sample_rate, n_channels, seed=seed, **emg_kwargs)
+    encode = _encoder(protocol, sample_rate, _clocks(nodes, drift_ppm, np.random.default_rng(seed)))
+    chunk = chunk or max(1, sample_rate // 100)
+
+    def chunks():
+        sent = 0
+        while max_samples is None or sent < max_samples:
+            n = chunk if max_samples is None else min(chunk, max_samples - sent)
+            if protocol == 'binary':
+                yield emg.frames(n, corrupt)
+            else:
+                data = encode(emg.generate(n)[0], sent)
+                yield corrupt_bytes(data, corrupt, emg.corrupt_rng) if corrupt else data
+            sent += n
+
+    return StreamTransport(chunks(), _byte_rate(protocol, n_channels, sample_rate * speed if realtime else 0, nodes),
+                           timeout)
+
+
+def replay_transport(path, speed=1.0, loop=False, corrupt=0.0, chunk=None, protocol='binary', timeout=0.05):
+    """
+    StreamTransport replaying a recorded .emg session as it came off the
+    board, at `speed` times real time (0 for as fast as it is read).
+    """
+    from synthetic import corrupt_bytes
+
+    session = Session(path)
+    encode = _encoder(protocol, session.sample_rate)
+    chunk = chunk or max(1, int(session.sample_rate) // 100)
+    rng = np.random.default_rng(0)
+
+    def chunks():
+        seq = 0
+        while True:
+            for start in range(0, len(session), chunk):
+                data = encode(session.samples[start:start + chunk], seq)
+                seq += min(chunk, len(session) - start)
+                if corrupt:
+                    data = corrupt_bytes(data, corrupt, rng)
+                yield data
+            if not loop:
+                return
+
+    return StreamTransport(chunks(), _byte_rate(protocol, session.n_channels, session.sample_rate * speed), timeout)
+
+
+def _byte_rate(protocol, n_channels, sample_rate, nodes=1):
+    if not sample_rate:
+        return None
+    # Ascii lines vary in length, size them for 6 characters a value
+    if protocol == 'binary':
+        per_sample = frame_size(n_channels)
+    elif protocol == 'timestamped':
+        # One frame per node
+        per_sample = frame_size(n_channels // nodes, timestamped=True) * nodes
+    else:
+        per_sample = 7 * n_channels
+    return sample_rate * per_sample
+
+
+class PtyBridge:
+    """
+    Copies a transport onto the master side of a pseudo-terminal, so
+    anything that opens `name` (pyserial, the acquisition process) reads it
+    like a real port. POSIX only.
+    """
+    def __init__(self, transport):
+        import pty
+        import tty
+
+        self.transport = transport
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.name = os.ttyname(self.slave)
+        self.bytes_written = 0
+        self._running = True
+        self.thread = threading.Thread(target=self._pump, daemon=True)
+        self.thread.start()
+
+    def _pump(self):
+        while self._running:
+            data = self.transport.read(self.transport.in_waiting or 1)
+            if data:
+                # Blocks once the pty buffer is full, i.e. nobody is reading
+                os.write(self.master, data)
+                self.bytes_written += len(data)
+            elif getattr(self.transport, 'exhausted', lambda: False)():
+                break
+
+    def close(self):
+        self._running = False
+        self.thread.join(timeout=1.0)
+        os.close(self.master)
+        os.close(self.slave)
+
+
+def list_ports():
+    import serial.tools.list_ports
+    return list(serial.tools.list_ports.comports())
+
+
+def discover_port():
+    """Device name of the most likely board: a known USB-UART bridge first, then any USB port."""
+    ports = list_ports()
+    known = [p for p in ports if p.vid in KNOWN_VIDS]
+    usb = [p for p in ports if p.vid is not None or 'usb' in (p.description or '').lower()]
+    for candidates in (known, usb):
+        if candidates:
+            return sorted(candidates, key=lambda p: p.device)[0].device
+    return None
+
+
+def _query(spec):
+    parts = urlsplit(spec)
+    return parts, {key: values[-1] for key, values in parse_qs(parts.query).items()}
+
+
+def open_transport(port, baudrate=115200, timeout=0.05, n_channels=1, protocol='binary'):
+    """
+    Open `port` (see the module docstring for the forms it takes). Raises
+    OSError when nothing can be opened, like serial.Serial does.
+    """
+    if port.startswith('synthetic://'):
+        _, q = _query(port)
+        return synthetic_transport(
+            sample_rate=int(q.get('rate', 1000)), n_channels=int(q.get('channels', n_channels)),
+            seed=int(q.get('seed', 0)), corrupt=float(q.get('corrupt', 0.0)),
+            realtime=q.get('realtime', '1') not in ('0', 'false'), speed=float(q.get('speed', 1.0)),
+            protocol=q.get('protocol', protocol), nodes=int(q.get('nodes', 1)),
+            drift_ppm=float(q.get('drift', 50.0)), timeout=timeout)
+    if port.startswith('replay://'):
+        parts, q = _query(port)
+        return replay_transport(parts.netloc + parts.path, speed=float(q.get('speed', 1.0)),
+                                loop=q.get('loop', '0') not in ('0', 'false'), corrupt=float(q.get('corrupt', 0.0)),
+                                protocol=q.get('protocol', protocol), timeout=timeout)
+    if port.startswith('loop://'):
+        return LoopbackTransport(timeout)
+
+    import serial
+
+    if port == 'auto':
+        found = discover_port()
+        if found is None:
+            raise serial.SerialException("no serial port found")
+        print(f"Using serial port {found}")
+        port = found
+    return serial.Serial(port, baudrate, timeout=timeout)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="List serial ports, or serve a transport on a pseudo-terminal.")
+    parser.add_argument('port', nargs='?', help="transport to serve, e.g. synthetic://?rate=4000&channels=8")
+    parser.add_argument('--channels', type=int, default=1)
+    parser.add_argument('--protocol', choices=('binary', 'ascii'), default='binary')
+    args = parser.parse_args()
+
+    if args.port is None:
+        best = discover_port()
+        for p in list_ports():
+            mark = '*' if p.device == best else ' '
+            print(f"{mark} {p.device}  {p.description}  {KNOWN_VIDS.get(p.vid, '')}")
+    else:
+        transport = open_transport(args.port, n_channels=args.channels, protocol=args.protocol)
+        bridge = PtyBridge(transport)
+        print(f"Serving {args.port} on {bridge.name}, Ctrl+C to stop")
+        try:
+            while bridge.thread.is_alive():
+                time.sleep(1.0)
+                print(f"{bridge.bytes_written / 1e6:.2f} MB written")
+        except KeyboardInterrupt:
+            pass
+        bridge.close()
@@ -0,0 +1,370 @@
+"""
+The inference loop as separate asyncio stages.
+
+    source ──► reader ──► processor ──► actuator
+                 │            └───────► telemetry
+                 ├──► recorder   (never drops, slows the reader down instead)
+                 └──► display    (drops the oldest block when it falls behind)
+
+Blocking work (serial reads, actuator commands, disk writes) runs in worker
+threads via asyncio.to_thread, so a slow servo command or a full disk never
+holds up the next decision. The queues between stages are bounded and each
+one has a policy: BLOCK makes the producer wait (backpressure), DROP_OLDEST
+throws the stalest item away so the consumer always gets the newest. The
+actuator queue is drop-oldest too, it only matters what the latest decision
+is.
+
+    pipeline = Pipeline(ring_source(reader), SAMPLE_RATE, N_CHANNELS, runtime=runtime,
+                        actuate=actuate, recorder=recorder)
+    asyncio.run(pipeline.run())
+"""
+import asyncio
+import json
+import socket
+import sys
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+
+from filters import DEFAULT_THRESHOLD, StreamingFilter
+from classifier import ClassifierRuntime, load_model
+from scheduler import InferenceScheduler
+from calibration import AdaptiveCalibrator
+from inference import EMGBuffer, threshold_prediction, control_output
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'data_collection'))
+from acquisition import open_stream
+from instrumentation import Stats, StatsLogger
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+
+# arrival is perf_counter() when the block was read, times are host
+# timestamps (time.time()) of each sample
+Block = namedtuple('Block', 'arrival samples times')
+Decision = namedtuple('Decision', 'arrival motion')
+
+
+class BoundedQueue:
+    """asyncio.Queue with a policy for when it is full. None is end of stream."""
+    def __init__(self, maxsize, policy=BLOCK, name=None):
+        if policy not in (BLOCK, DROP_OLDEST):
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.queue = asyncio.Queue(maxsize)
+        self.policy = policy
+        self.name = name
+        self.dropped = 0
+
+    async def put(self, item):
+        # End of stream waits for room rather than displacing the newest
+        # item, so the last decision still reaches the actuator
+        if self.policy == BLOCK or item is None:
+            await self.queue.put(item)
+            return
+        while self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(item)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def qsize(self):
+        return self.queue.qsize()
+
+
+def ring_source(reader):
+    """
+    Read callable for a RingReader. Returns None (end of stream) once the
+    acquisition process has stopped and everything it wrote has been read.
+    """
+    def read():
+        block = reader.read()
+        if len(block) == 0:
+            return None if not reader.running else (block, None)
+        return block, reader.times(reader.last_start, len(block))
+    return read
+
+
+def frame_source(frame_reader):
+    """
+    Read callable for a protocol.FrameReader, blocks for up to the port
+    timeout. Replay and synthetic transports end the stream when exhausted.
+    """
+    exhausted = getattr(frame_reader.ser, 'exhausted', lambda: False)
+
+    def read():
+        samples, _ = frame_reader.read()
+        if len(samples) == 0 and exhausted():
+            return None
+        return samples, None
+    return read
+
+
+def udp_publisher(host, port):
+    """Telemetry publisher sending each Stats snapshot as one JSON datagram."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+
+    def publish(snapshot):
+        try:
+            sock.sendto(json.dumps(snapshot).encode(), (host, port))
+        except (BlockingIOError, OSError):
+            # Nobody listening or the socket buffer is full, telemetry is best effort
+            pass
+    return publish
+
+
+def print_publisher(stats):
+    def publish(snapshot):
+        decisions = snapshot['counters'].get('decisions', 0)
+        print(f"Decisions: {decisions}  {stats.summary()}")
+    return publish
+
+
+async def _call(func, *args):
+    """Await a coroutine function, run anything else in a worker thread."""
+    if asyncio.iscoroutinefunction(func):
+        return await func(*args)
+    return await asyncio.to_thread(func, *args)
+
+
+class Pipeline:
+    """
+    source: callable returning (samples, times or None), an empty block when
+        nothing arrived yet, or None at the end of the stream. ring_source()
+        and frame_source() wrap the two readers we have, blocking=True runs it
+        in a thread (frame_source), otherwise it is polled every `idle` seconds.
+        None if only step() is used.
+    runtime: ClassifierRuntime, without one the envelope is thresholded.
+    calibrator: calibration.AdaptiveCalibrator fed the envelope, its
+        threshold replaces `threshold`, with normalize=True its gain is
+        applied to the model's windows.
+    actuate: called with each new motion, plain functions run in a thread.
+    publish: called with a Stats snapshot every telemetry_interval seconds.
+    update: called with the Stats just before publishing, e.g. RingReader.update_stats.
+    recorder: SessionRecorder that gets every block, in order.
+    display: called with every Block that made it through the display queue.
+    """
+    def __init__(self, source, sample_rate, n_channels=1, window=100, hop_ms=25, max_batch=8,
+                 runtime=None, threshold=DEFAULT_THRESHOLD, calibrator=None, normalize=False, actuate=None, recorder=None,
+                 display=None, publish=None, update=None, stats=None, logger=None, blocking=False, idle=0.002,
+                 telemetry_interval=1.0, queue_size=64, record_queue_size=1024, display_queue_size=8):
+        self.source = source
+        self.sample_rate = sample_rate
+        self.n_channels = n_channels
+        self.runtime = runtime
+        self.threshold = threshold
+        self.calibrator = calibrator
+        self.normalize = normalize
+        self.actuate = actuate
+        self.recorder = recorder
+        self.display = display
+        self.stats = Stats() if stats is None else stats
+        self.publish = publish or print_publisher(self.stats)
+        self.update = update
+        self.logger = logger
+        self.blocking = blocking
+        self.idle = idle
+        self.telemetry_interval = telemetry_interval
+        self.queue_sizes = (queue_size, record_queue_size, display_queue_size)
+
+        window = (runtime.window if runtime is not None else None) or window
+        hop = max(1, round(sample_rate * hop_ms / 1000))
+        self.scheduler = InferenceScheduler(sample_rate, window, hop, max_batch=max_batch)
+        capacity = self.scheduler.buffer_capacity()
+        self.envelope = EMGBuffer(window, n_channels, hop=hop, capacity=capacity)
+        self.signal = EMGBuffer(window, n_channels, hop=hop, capacity=capacity)
+        self.filter = StreamingFilter(sample_rate, n_channels=n_channels)
+        self.queues = []
+        self.motion = 0
+
+    def _queue(self, maxsize, policy, name):
+        queue = BoundedQueue(maxsize, policy, name)
+        self.queues.append(queue)
+        return queue
+
+    async def run(self):
+        queue_size, record_size, display_size = self.queue_sizes
+        self.queues = []
+        samples = self._queue(queue_size, BLOCK, 'process')
+        actions = self._queue(1, DROP_OLDEST, 'actuate')
+        outputs = [samples]
+        stages = [self._process(samples, actions), self._actuator(actions)]
+        if self.recorder is not None:
+            records = self._queue(record_size, BLOCK, 'record')
+            outputs.append(records)
+            stages.append(self._record(records))
+        if self.display is not None:
+            shown = self._queue(display_size, DROP_OLDEST, 'display')
+            outputs.append(shown)
+            stages.append(self._display(shown))
+
+        telemetry = asyncio.create_task(self._telemetry())
+        try:
+            await asyncio.gather(self._read(outputs), *stages)
+        finally:
+            telemetry.cancel()
+            self._publish()
+
+    async def _read(self, outputs):
+        period = 1.0 / self.sample_rate
+        while True:
+            if self.blocking:
+                item = await asyncio.to_thread(self.source)
+            else:
+                item = self.source()
+            if item is None:
+                break
+            block, times = item
+            if len(block) == 0:
+                if not self.blocking:
+                    await asyncio.sleep(self.idle)
+                continue
+            if times is None:
+                # Taken now, before any queueing, so the recording isn't skewed
+                times = time.time() - (len(block) - 1 - np.arange(len(block))) * period
+            self.stats.count('samples', len(block))
+            item = Block(time.perf_counter(), block, times)
+            for queue in outputs:
+                await queue.put(item)
+        for queue in outputs:
+            await queue.put(None)
+
+    def _classify(self, ends):
+        if self.runtime is not None:
+            windows = self.scheduler.windows(self.signal.buffer, ends)
+            if self.normalize and self.calibrator is not None:
+                windows = self.calibrator.normalize(windows)
+            return self.runtime.predict(windows)
+        threshold = self.threshold if self.calibrator is None else self.calibrator.threshold
+        with self.stats.time('predict'):
+            return [threshold_prediction(w, threshold)
+                    for w in self.scheduler.windows(self.envelope.buffer, ends)]
+
+    def step(self, samples):
+        """
+        Filter a block, update the calibrator and classify every window
+        that came due. Returns (ends, motions): the sample counts the
+        windows end at and their predictions. replay.py drives this
+        directly to run recorded sessions through the same code.
+        """
+        with self.stats.time('filter'):
+            filtered, envelope = self.filter.process_all(samples)
+            self.envelope.extend(envelope)
+            self.signal.extend(filtered)
+        if self.calibrator is not None:
+            with self.stats.time('calibrate'):
+                self.calibrator.update(envelope)
+        ends = self.scheduler.due(self.envelope.buffer)
+        if len(ends) == 0:
+            return ends, []
+        self.stats.count('decisions', len(ends))
+        return ends, self._classify(ends)
+
+    async def _process(self, samples, actions):
+        while (block := await samples.get()) is not None:
+            ends, motions = self.step(block.samples)
+            if len(ends) == 0:
+                continue
+            self.stats.record('decision', time.perf_counter() - block.arrival)
+            await actions.put(Decision(block.arrival, int(motions[-1])))
+        await actions.put(None)
+
+    async def _actuator(self, actions):
+        while (decision := await actions.get()) is not None:
+            if self.actuate is not None and decision.motion != self.motion:
+                with self.stats.time('actuate'):
+                    await _call(self.actuate, decision.motion)
+            self.motion = decision.motion
+            # From the newest samples arriving to acting on them
+            self.stats.record('end_to_end', time.perf_counter() - decision.arrival)
+
+    async def _record(self, records):
+        while (block := await records.get()) is not None:
+            with self.stats.time('record'):
+                await asyncio.to_thread(self.recorder.write, block.samples, block.times)
+
+    async def _display(self, shown):
+        while (block := await shown.get()) is not None:
+            await _call(self.display, block)
+
+    def _publish(self):
+        for queue in self.queues:
+            self.stats.set(f'{queue.name}_queue', queue.qsize())
+            if queue.policy == DROP_OLDEST:
+                self.stats.set(f'{queue.name}_dropped', queue.dropped)
+        self.stats.set('skipped_windows', self.scheduler.skipped)
+        if self.update is not None:
+            self.update(self.stats)
+        self.publish(self.stats.snapshot())
+        if self.logger is not None:
+            self.logger.write()
+        self.stats.reset()
+
+    async def _telemetry(self):
+        while True:
+            await asyncio.sleep(self.telemetry_interval)
+            # Publishing is quick (print, one datagram), the logger append
+            # is the only file I/O and happens once per interval
+            self._publish()
+
+
+def main():
+    # Config, same meaning as in inference.py
+    SERIAL_PORT = 'auto'  # or a device, 'synthetic://...', 'replay://...' (see transport.py)
+    BAUDRATE = 115200
+    SAMPLE_RATE = 100  # Hz
+    N_CHANNELS = 1
+    WINDOW_SIZE = 100
+    HOP_MS = 25
+    MAX_BATCH = 8
+    THRESHOLD = DEFAULT_THRESHOLD
+    PROFILE_PATH = Path(__file__).resolve().parent / 'profiles' / 'default.json'
+    NORMALIZE = False
+    MODEL_PATH = Path(__file__).resolve().parent / 'model.npz'
+    STATS_PATH = None
+    # Telemetry as JSON datagrams instead of the console, e.g. ('127.0.0.1', 9870)
+    TELEMETRY_UDP = None
+
+    acq, reader = open_stream(SERIAL_PORT, BAUDRATE, N_CHANNELS, SAMPLE_RATE)
+    if reader is None:
+        print("Failed to connect to serial port. Exiting.")
+        exit(1)
+
+    stats = Stats()
+    calibrator = AdaptiveCalibrator.from_profile(PROFILE_PATH, SAMPLE_RATE, N_CHANNELS, threshold=THRESHOLD)
+    runtime = None
+    if MODEL_PATH.exists():
+        runtime = ClassifierRuntime(load_model(MODEL_PATH), SAMPLE_RATE, N_CHANNELS, stats=stats)
+        print(f"Loaded {runtime.model.kind} model, classes: {list(runtime.model.classes)}")
+
+    previous_motion = 0
+
+    def actuate(motion):
+        nonlocal previous_motion
+        previous_motion = control_output(motion, previous_motion)
+
+    pipeline = Pipeline(ring_source(reader), SAMPLE_RATE, N_CHANNELS, window=WINDOW_SIZE, hop_ms=HOP_MS,
+                        max_batch=MAX_BATCH, runtime=runtime, calibrator=calibrator,
+                        normalize=NORMALIZE, actuate=actuate,
+                        publish=udp_publisher(*TELEMETRY_UDP) if TELEMETRY_UDP else None,
+                        update=reader.update_stats, stats=stats,
+                        logger=StatsLogger(stats, STATS_PATH) if STATS_PATH else None)
+    try:
+        asyncio.run(pipeline.run())
+    except KeyboardInterrupt:
+        print("\n\nStopping inference...")
+    finally:
+        if calibrator.ready():
+            calibrator.save_profile(PROFILE_PATH)
+        reader.close()
+        if acq is not None:
+            acq.stop()
+        print("Serial connection closed")
+
+
+if __name__ == "__main__":
+    main()
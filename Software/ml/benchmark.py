@@ -0,0 +1,249 @@
+"""
+Benchmarks for the acquisition and inference hot paths, on seeded synthetic
+EMG so no hardware is needed and runs are comparable.
+
+    python benchmark.py                                 # 1 kSPS, 1 channel
+    python benchmark.py --sample-rate 16000 --channels 8 --corrupt 0.001
+    python benchmark.py --out results/base.json
+    python benchmark.py --compare results/base.json     # exit code 1 on regression
+
+Benchmarks:
+    decode      FrameDecoder on a pre-generated byte stream
+    filter      StreamingFilter.process_all in hop-sized blocks
+    features    extract_features on batches of windows, and one at a time
+    predict     Model.predict on feature rows, batched and single
+    end_to_end  synthetic port -> FrameReader -> filter -> ring -> scheduler
+                -> features -> model, as fast as the data can be read
+
+Every benchmark runs --repeats times and keeps the median. Metrics ending in
+'_ms' are latencies (lower is better), everything else is throughput.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from classifier import ClassifierRuntime, Model
+from features import DEFAULT_FEATURES, extract_features
+from filters import StreamingFilter
+from scheduler import InferenceScheduler
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'data_collection'))
+from instrumentation import Stats
+from protocol import FrameDecoder, FrameReader
+from ringbuffer import RingBuffer
+from synthetic import SyntheticEMG
+from transport import synthetic_transport
+
+
+def random_model(n_features, n_classes, seed=0, hidden=32, **config):
+    """Untrained MLP of the right shape, prediction cost is what matters here."""
+    rng = np.random.default_rng(seed)
+    layers = [(rng.standard_normal((n_features, hidden)), np.zeros(hidden)),
+              (rng.standard_normal((hidden, n_classes)), np.zeros(n_classes))]
+    return Model('mlp', np.arange(n_classes), layers, mean=np.zeros(n_features), scale=np.ones(n_features),
+                 config=config)
+
+
+def _timed(fn, repeats):
+    """Median wall time of fn() over `repeats` runs, and its last result."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)), result
+
+
+def bench_decode(args):
+    emg = SyntheticEMG(args.sample_rate, args.channels, seed=args.seed)
+    n = int(args.seconds * args.sample_rate)
+    data = emg.frames(n, corrupt=args.corrupt)
+    read_size = 4096
+
+    def run():
+        decoder = FrameDecoder(args.channels)
+        for i in range(0, len(data), read_size):
+            decoder.feed(data[i:i + read_size])
+        return decoder
+
+    elapsed, decoder = _timed(run, args.repeats)
+    return {
+        'mb_per_s': len(data) / elapsed / 1e6,
+        'samples_per_s': decoder.frames / elapsed,
+        'realtime_factor': decoder.frames / args.sample_rate / elapsed,
+        'bad_frames': decoder.bad_frames,
+    }
+
+
+def bench_filter(args):
+    samples, _ = SyntheticEMG(args.sample_rate, args.channels, seed=args.seed).generate(
+        int(args.seconds * args.sample_rate))
+    block = args.hop
+
+    def run():
+        emg_filter = StreamingFilter(args.sample_rate, n_channels=args.channels)
+        for i in range(0, len(samples), block):
+            emg_filter.process_all(samples[i:i + block])
+
+    elapsed, _ = _timed(run, args.repeats)
+    return {
+        'samples_per_s': len(samples) / elapsed,
+        'realtime_factor': len(samples) / args.sample_rate / elapsed,
+        'block_ms': elapsed / -(-len(samples) // block) * 1000,
+    }
+
+
+def _windows(args, n_windows):
+    samples, _ = SyntheticEMG(args.sample_rate, args.channels, seed=args.seed).generate(
+        args.window + args.hop * (n_windows - 1))
+    return sliding_window_view(samples, args.window, axis=0)[::args.hop].transpose(0, 2, 1)
+
+
+def bench_features(args):
+    windows = _windows(args, args.batch)
+    batch_time, _ = _timed(lambda: extract_features(windows, args.sample_rate, DEFAULT_FEATURES), args.repeats)
+    single = windows[:min(len(windows), 200)]
+    single_time, _ = _timed(lambda: [extract_features(w, args.sample_rate, DEFAULT_FEATURES) for w in single],
+                            args.repeats)
+    return {
+        'windows_per_s': len(windows) / batch_time,
+        'single_ms': single_time / len(single) * 1000,
+    }
+
+
+def bench_predict(args):
+    X, names = extract_features(_windows(args, args.batch), args.sample_rate, DEFAULT_FEATURES)
+    model = random_model(X.shape[1], args.classes, args.seed)
+    batch_time, _ = _timed(lambda: model.predict(X), args.repeats)
+    single = X[:min(len(X), 500)]
+    single_time, _ = _timed(lambda: [model.predict(x) for x in single], args.repeats)
+    return {
+        'predictions_per_s': len(X) / batch_time,
+        'single_ms': single_time / len(single) * 1000,
+    }
+
+
+def bench_end_to_end(args):
+    n_features = extract_features(np.zeros((args.window, args.channels)), args.sample_rate, DEFAULT_FEATURES)[0].shape[1]
+    model = random_model(n_features, args.classes, args.seed, window=args.window, sample_rate=args.sample_rate)
+    n = int(args.seconds * args.sample_rate)
+
+    def run():
+        stats = Stats()
+        port = synthetic_transport(args.sample_rate, args.channels, seed=args.seed, corrupt=args.corrupt,
+                                   realtime=False, chunk=args.hop, max_samples=n)
+        reader = FrameReader(port, FrameDecoder(args.channels), stats)
+        runtime = ClassifierRuntime(model, args.sample_rate, args.channels, stats=stats)
+        scheduler = InferenceScheduler(args.sample_rate, args.window, args.hop, max_batch=args.max_batch)
+        ring = RingBuffer(scheduler.buffer_capacity(), args.channels, window=args.window, hop=args.hop)
+        emg_filter = StreamingFilter(args.sample_rate, n_channels=args.channels)
+
+        while port.in_waiting:
+            start = time.perf_counter()
+            block, _ = reader.read()
+            with stats.time('filter'):
+                filtered, envelope = emg_filter.process_all(block)
+                ring.extend(filtered)
+            ends = scheduler.due(ring)
+            if len(ends):
+                runtime.predict(scheduler.windows(ring, ends))
+                stats.record('end_to_end', time.perf_counter() - start)
+        return stats, scheduler
+
+    elapsed, (stats, scheduler) = _timed(run, args.repeats)
+    latency = stats.stages['end_to_end'].snapshot()
+    return {
+        'samples_per_s': n / elapsed,
+        'realtime_factor': n / args.sample_rate / elapsed,
+        'decisions_per_s': scheduler.decisions / elapsed,
+        'p50_ms': latency['p50_ms'],
+        'p99_ms': latency['p99_ms'],
+    }
+
+
+BENCHMARKS = {
+    'decode': bench_decode,
+    'filter': bench_filter,
+    'features': bench_features,
+    'predict': bench_predict,
+    'end_to_end': bench_end_to_end,
+}
+# Counts that describe the input rather than the speed, not compared
+INFORMATIONAL = {'bad_frames'}
+
+
+def compare(results, baseline, tolerance):
+    """Print the change against a saved run, returns the regressed metrics."""
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            before = baseline.get(name, {}).get(metric)
+            if before is None or metric in INFORMATIONAL or before == 0:
+                continue
+            change = value / before - 1
+            worse = change > tolerance if metric.endswith('_ms') else change < -tolerance
+            flag = '  REGRESSION' if worse else ''
+            print(f"{name:>12} {metric:<18} {before:12.4g} -> {value:12.4g}  {change:+7.1%}{flag}")
+            if worse:
+                regressions.append(f"{name}.{metric}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sample-rate', type=int, default=1000)
+    parser.add_argument('--channels', type=int, default=1)
+    parser.add_argument('--seconds', type=float, default=10.0, help="signal length per benchmark")
+    parser.add_argument('--window', type=int, default=None, help="samples, default 200 ms")
+    parser.add_argument('--hop', type=int, default=None, help="samples, default 25 ms")
+    parser.add_argument('--batch', type=int, default=256, help="windows per features/predict batch")
+    parser.add_argument('--max-batch', type=int, default=8)
+    parser.add_argument('--classes', type=int, default=3)
+    parser.add_argument('--corrupt', type=float, default=0.0, help="fraction of damaged bytes")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--out', type=Path, help="save the results as JSON")
+    parser.add_argument('--compare', type=Path, help="JSON from an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args()
+    args.window = args.window or max(2, round(args.sample_rate * 0.2))
+    args.hop = args.hop or max(1, round(args.sample_rate * 0.025))
+
+    results = {}
+    for name in args.only:
+        results[name] = BENCHMARKS[name](args)
+        print(f"{name:>12}  " + "  ".join(f"{k} {v:.4g}" for k, v in results[name].items()))
+
+    config = {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()
+              if k not in ('out', 'compare', 'only')}
+    run = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': config,
+        'machine': {'python': platform.python_version(), 'numpy': np.__version__,
+                    'platform': platform.platform(), 'processor': platform.processor()},
+        'results': results,
+    }
+    if args.out:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps(run, indent=2))
+        print(f"Saved {args.out}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        if baseline['config'] != config:
+            print("Warning: baseline was run with a different config")
+        regressions = compare(results, baseline['results'], args.tolerance)
+        if regressions:
+            print(f"Regressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+"""
+Builds training feature matrices from session files on all cores, with a
+cache so only new or changed sessions are computed again.
+
+    python build_features.py saves --window 200 --hop 25 --out features.npz
+    python build_features.py saves/alice saves/bob --features mav rms wl --no-filter
+
+Every session channel is one job in a process pool: the channel is run
+through the causal StreamingFilter (the same bandpass the live loop
+classifies), cut into windows and turned into features. The channels of a
+session are then put back together in extract_features() column order and
+stored in the cache folder as one .npz, named by a hash of the session's
+contents plus every parameter that affects the result. Changing the window
+or feature set only recomputes for the new parameters, the old entries stay
+for when the sweep comes back to them.
+
+The output has X (windows, features), y (label at the last sample of each
+window, the decision the live loop would make there, recorder.UNLABELED
+for sessions without labels), groups (session number, for grouped
+cross-validation), starts, names and the session paths.
+From the notebook, build() returns the same per session without writing
+anything but the cache.
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from cache import HASHES_NAME, HashMemo, file_hash, make_key
+from features import DEFAULT_BANDS, DEFAULT_FEATURES, extract_features
+from filters import StreamingFilter
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'data_collection'))
+from recorder import SESSION_EXT
+from session import Session
+
+# Bump when the feature code changes in a way the parameters don't capture
+CACHE_VERSION = 1
+CACHE_DIR = Path(__file__).resolve().parent / 'feature_cache'
+BATCH = 4096
+
+
+def feature_params(window=200, hop=25, features=DEFAULT_FEATURES, bands=DEFAULT_BANDS, channels=None,
+                   filter=True, band=(20.0, 450.0), order=4, zc_threshold=0.0, ssc_threshold=0.0,
+                   wamp_threshold=0.0):
+    """Every setting that changes the features, in the form the cache key is made from."""
+    return {
+        'window': int(window), 'hop': int(hop), 'features': list(features),
+        'bands': [list(b) for b in bands], 'channels': None if channels is None else list(channels),
+        'filter': bool(filter), 'band': list(band), 'order': int(order),
+        'zc_threshold': zc_threshold, 'ssc_threshold': ssc_threshold, 'wamp_threshold': wamp_threshold,
+    }
+
+
+def file_hashes(paths, cache_dir, jobs=None):
+    """
+    {path: sha256} for every session. Hashes are remembered in the cache
+    folder and reused while a file's size and mtime haven't changed.
+    """
+    memo = HashMemo(os.path.join(cache_dir, HASHES_NAME))
+    hashes = {path: memo.get(path) for path in paths}
+    stale = [path for path, digest in hashes.items() if digest is None]
+    if stale:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            for path, digest in zip(stale, pool.map(file_hash, stale)):
+                memo.set(path, digest)
+                hashes[path] = digest
+        memo.save()
+    return hashes
+
+
+def cache_key(digest, params):
+    return make_key('features', CACHE_VERSION, digest, params)
+
+
+def _channels(session, channels):
+    """Channel indices to use for a session, in order."""
+    return [int(c) for c in np.arange(session.n_channels)[session.channel_index(channels)].reshape(-1)]
+
+
+def channel_features(path, channel, params):
+    """(starts, matrix, names) for one channel of a session, names end in _ch1."""
+    session = Session(path)
+    try:
+        x = np.asarray(session.samples[:, channel], dtype=np.float64)
+        if params['filter'] and len(x):
+            emg_filter = StreamingFilter(session.sample_rate, band=params['band'], order=params['order'])
+            x = emg_filter.bandpass(x[:, None])[:, 0]
+        window, hop = params['window'], params['hop']
+        kwargs = {k: params[k] for k in ('bands', 'zc_threshold', 'ssc_threshold', 'wamp_threshold')}
+        if len(x) < window:
+            _, names = extract_features(np.zeros((1, window, 1)), session.sample_rate, params['features'], **kwargs)
+            return np.zeros(0, dtype=np.int64), np.zeros((0, len(names))), names
+
+        windows = sliding_window_view(x, window)[::hop]
+        starts = np.arange(len(windows), dtype=np.int64) * hop
+        blocks = []
+        for i in range(0, len(windows), BATCH):
+            matrix, names = extract_features(windows[i:i + BATCH, :, None], session.sample_rate,
+                                             params['features'], **kwargs)
+            blocks.append(matrix)
+        return starts, np.concatenate(blocks), names
+    finally:
+        session.close()
+
+
+def _channel_job(job):
+    path, channel, params = job
+    try:
+        return path, channel, channel_features(path, channel, params), None
+    except Exception as e:
+        return path, channel, None, str(e)
+
+
+def _merge(parts, channels):
+    """
+    Per-channel results back into one matrix, grouped by feature then
+    channel like extract_features() does for a multi-channel window.
+    """
+    starts, _, base_names = parts[channels[0]]
+    columns, names = [], []
+    for i, name in enumerate(base_names):
+        base = name.rsplit('_ch', 1)[0]
+        for c in channels:
+            columns.append(parts[c][1][:, i])
+            names.append(f"{base}_ch{c + 1}")
+    matrix = np.column_stack(columns) if columns else np.zeros((len(starts), 0))
+    return starts, matrix, names
+
+
+def _window_labels(path, starts, window):
+    session = Session(path)
+    try:
+        return np.asarray(session.labels[starts + window - 1], dtype=np.int16)
+    finally:
+        session.close()
+
+
+def _save(cache_path, result):
+    tmp = cache_path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez(f, starts=result['starts'], X=result['X'], y=result['y'],
+                 names=np.array(json.dumps(result['names'])))
+    # Never leave a half written entry behind for the next run to trust
+    os.replace(tmp, cache_path)
+
+
+def _load(cache_path, path):
+    with np.load(cache_path, allow_pickle=False) as f:
+        return {'path': path, 'starts': f['starts'], 'X': f['X'], 'y': f['y'],
+                'names': json.loads(str(f['names']))}
+
+
+def build(paths, params, cache_dir=CACHE_DIR, jobs=None, force=False, verbose=True):
+    """
+    Features for each session, computing only those without a cache entry.
+    Returns a list of {'path', 'starts', 'X', 'y', 'names'} in `paths` order.
+    """
+    cache_dir = str(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    paths = [str(p) for p in paths]
+    hashes = file_hashes(paths, cache_dir, jobs)
+    cache_paths = {path: os.path.join(cache_dir, cache_key(hashes[path], params) + '.npz') for path in paths}
+
+    todo = [path for path in paths if force or not os.path.exists(cache_paths[path])]
+    work, channels = [], {}
+    for path in todo:
+        session = Session(path)
+        channels[path] = _channels(session, params['channels'])
+        session.close()
+        work += [(path, c, params) for c in channels[path]]
+
+    failed = set()
+    if work:
+        parts = {path: {} for path in todo}
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            for future in as_completed([pool.submit(_channel_job, job) for job in work]):
+                path, channel, result, error = future.result()
+                if error:
+                    print(f"Failed {path} channel {channel}: {error}")
+                    failed.add(path)
+                    continue
+                parts[path][channel] = result
+                if path in failed or len(parts[path]) < len(channels[path]):
+                    continue
+                # Every channel of this session is done
+                starts, X, names = _merge(parts.pop(path), channels[path])
+                y = _window_labels(path, starts, params['window'])
+                _save(cache_paths[path], {'starts': starts, 'X': X, 'y': y, 'names': names})
+
+    results = [_load(cache_paths[path], path) for path in paths if path not in failed]
+    if verbose:
+        print(f"{len(results)} sessions: {len(paths) - len(todo)} cached, {len(todo) - len(failed)} computed"
+              + (f", {len(failed)} failed" if failed else ""))
+    return results
+
+
+def stack(results):
+    """One dataset from build()'s per-session results."""
+    names = results[0]['names'] if results else []
+    for result in results:
+        if result['names'] != names:
+            raise ValueError(f"{result['path']} has different features, select matching --channels")
+    return {
+        'X': np.concatenate([r['X'] for r in results]) if results else np.zeros((0, 0)),
+        'y': np.concatenate([r['y'] for r in results]) if results else np.zeros(0, dtype=np.int16),
+        'groups': np.concatenate([np.full(len(r['X']), i) for i, r in enumerate(results)]) if results else np.zeros(0, dtype=int),
+        'starts': np.concatenate([r['starts'] for r in results]) if results else np.zeros(0, dtype=np.int64),
+        'names': names,
+        'sessions': [r['path'] for r in results],
+    }
+
+
+def find_sessions(inputs):
+    """Session files given directly or found under the given folders."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                paths += [os.path.join(root, name) for name in sorted(files) if name.lower().endswith(SESSION_EXT)]
+        else:
+            paths.append(item)
+    return sorted(dict.fromkeys(paths))
+
+
+def _channel_arg(value):
+    return int(value) if value.isdigit() else value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build cached feature matrices from session files")
+    parser.add_argument('inputs', nargs='+', help="session files or folders to search")
+    parser.add_argument('--window', type=int, default=200, help="samples per window")
+    parser.add_argument('--hop', type=int, default=25, help="samples between windows")
+    parser.add_argument('--features', nargs='+', default=DEFAULT_FEATURES)
+    parser.add_argument('--channels', nargs='+', type=_channel_arg, default=None,
+                        help="channel names or indices (default: all)")
+    parser.add_argument('--no-filter', action='store_true', help="features of the raw signal")
+    parser.add_argument('--band', type=float, nargs=2, default=(20.0, 450.0))
+    parser.add_argument('--cache', default=str(CACHE_DIR), help="cache folder")
+    parser.add_argument('--jobs', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--force', action='store_true', help="recompute even if cached")
+    parser.add_argument('--out', help="write the stacked dataset to this .npz")
+    args = parser.parse_args()
+
+    paths = find_sessions(args.inputs)
+    if not paths:
+        parser.error("no session files found")
+    params = feature_params(args.window, args.hop, args.features, channels=args.channels,
+                            filter=not args.no_filter, band=args.band)
+    dataset = stack(build(paths, params, args.cache, args.jobs, args.force))
+    print(f"{dataset['X'].shape[0]} windows x {dataset['X'].shape[1]} features")
+    if args.out:
+        np.savez(args.out, X=dataset['X'], y=dataset['y'], groups=dataset['groups'], starts=dataset['starts'],
+                 names=np.array(dataset['names']), sessions=np.array(dataset['sessions']),
+                 params=np.array(json.dumps(params)))
+        print(f"Saved {args.out}")
@@ -0,0 +1,192 @@
+"""
+On-disk cache for preprocessing results, so offline analysis doesn't filter
+the same session again every time a notebook cell is rerun.
+
+Entries are .npy files named by a hash of what went into them (the input
+file's contents plus the parameters), so a changed recording or setting is
+simply a different entry. The folder is kept under max_bytes by deleting
+the least recently used entries, a hit marks an entry used by touching its
+mtime (atime isn't reliable, many disks are mounted noatime). Hits come
+back memory-mapped, nothing is read until it is used.
+
+    cache = DiskCache('filtered_cache', max_bytes=2 << 30)
+    bandpassed, envelope = filtered_session('saves/run.emg', cache)
+
+Filter coefficient designs are cached in memory by filters.butter_sos().
+"""
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from filters import StreamingFilter
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'data_collection'))
+from session import Session
+
+CACHE_DIR = Path(__file__).resolve().parent / 'filtered_cache'
+MAX_BYTES = 2 << 30
+HASHES_NAME = 'hashes.json'
+HASH_CHUNK = 1 << 20
+# Bump when the filtering changes in a way the parameters don't capture
+FILTER_VERSION = 1
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_key(*parts):
+    """Short hex key for any JSON-able parts, e.g. make_key('filtered', digest, params)."""
+    blob = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()[:32]
+
+
+class HashMemo:
+    """
+    File content hashes remembered in a JSON file and reused while the
+    file's size and mtime haven't changed, so a big session is only read
+    once to hash it.
+    """
+    def __init__(self, path):
+        self.path = str(path)
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        self.dirty = False
+
+    def get(self, path):
+        stat = os.stat(path)
+        entry = self.entries.get(str(path))
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime:
+            return entry[2]
+        return None
+
+    def set(self, path, digest):
+        stat = os.stat(path)
+        self.entries[str(path)] = [stat.st_size, stat.st_mtime, digest]
+        self.dirty = True
+
+    def hash(self, path):
+        digest = self.get(path)
+        if digest is None:
+            digest = file_hash(path)
+            self.set(path, digest)
+            self.save()
+        return digest
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+class DiskCache:
+    """Bounded, least-recently-used folder of .npy arrays."""
+    def __init__(self, folder=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.folder = str(folder)
+        self.max_bytes = max_bytes
+        os.makedirs(self.folder, exist_ok=True)
+        self.hashes = HashMemo(os.path.join(self.folder, HASHES_NAME))
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        return os.path.join(self.folder, key + '.npy')
+
+    def get(self, key):
+        """The cached array (read-only memmap) or None."""
+        path = self.path(key)
+        try:
+            array = np.load(path, mmap_mode='r')
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            # Missing, or cut short by a crash before os.replace (shouldn't happen)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return array
+
+    def put(self, key, array):
+        path = self.path(key)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.save(f, np.asarray(array))
+        os.replace(tmp, path)
+        self.evict(keep=path)
+
+    def get_or_compute(self, key, compute):
+        array = self.get(key)
+        if array is None:
+            array = compute()
+            self.put(key, array)
+        return array
+
+    def entries(self):
+        """[(mtime, size, path), ...] oldest use first."""
+        entries = []
+        for name in os.listdir(self.folder):
+            if name.endswith('.npy'):
+                path = os.path.join(self.folder, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        """Delete least recently used entries until the folder fits in max_bytes."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
+
+
+def filtered_session(path, cache=None, band=(20.0, 450.0), envelope_cutoff=5.0, order=4):
+    """
+    (bandpassed, envelope) of a whole session through StreamingFilter, both
+    (n_samples, n_channels). Cached by file contents and filter settings.
+    """
+    cache = DiskCache() if cache is None else cache
+    session = Session(str(path))
+    try:
+        key = make_key('filtered', FILTER_VERSION, cache.hashes.hash(str(path)),
+                       list(band), envelope_cutoff, order)
+
+        def compute():
+            emg_filter = StreamingFilter(session.sample_rate, session.n_channels, band, envelope_cutoff, order)
+            bandpassed, envelope = emg_filter.process_all(np.asarray(session.samples, dtype=np.float64))
+            return np.stack((bandpassed, envelope))
+
+        result = cache.get_or_compute(key, compute)
+    finally:
+        session.close()
+    return result[0], result[1]
@@ -0,0 +1,307 @@
+"""
+Online calibration for the inference loop, in place of stopping for a
+relax / contract routine.
+
+Every envelope block goes through AdaptiveCalibrator.update(). Samples
+within the noise floor (rest median + min_sigma * rest spread) count as
+rest, the others as activity, and each side keeps its own statistics per
+channel:
+
+    rest      QuantileSketch for a robust level and spread (median, p16)
+              plus RunningStats (mean / variance)
+    active    RunningStats
+
+RunningStats is Welford's algorithm merged a block at a time, with
+exponential forgetting counted in the samples it was given, so a level
+follows electrode drift and fatigue but doesn't move while that side gets
+no samples. A long rest doesn't pull the activity level down and the
+threshold doesn't decay over a session.
+
+    threshold = max(noise floor, rest median + fraction * (active mean - rest median))
+
+gain() scales each channel back to the activity level of the stored
+profile, so the model sees amplitudes like the ones it was trained on as
+the signal drifts. Profiles are JSON, one per user, and seed the
+statistics with a limited weight so they give way to the live signal.
+
+    calibrator = AdaptiveCalibrator.from_profile('profiles/alice.json', SAMPLE_RATE, N_CHANNELS)
+    calibrator.update(envelope)
+    threshold_prediction(window, calibrator.threshold)
+    calibrator.save_profile('profiles/alice.json')
+"""
+import datetime
+import json
+import os
+
+import numpy as np
+
+PROFILE_VERSION = 1
+
+
+class RunningStats:
+    """
+    Per-channel mean and variance, Welford / Chan block merges. half_life
+    (in samples) makes older samples count less, None keeps everything.
+    """
+    def __init__(self, n_channels=1, half_life=None):
+        self.n_channels = n_channels
+        self.decay = 0.5 ** (1.0 / half_life) if half_life else 1.0
+        self.n = np.zeros(n_channels)
+        self.mean = np.zeros(n_channels)
+        self.m2 = np.zeros(n_channels)
+
+    def update(self, block, mask=None):
+        """block (n_samples, n_channels), mask picks the samples that count per channel."""
+        x = np.asarray(block, dtype=np.float64).reshape(-1, self.n_channels)
+        mask = np.ones(x.shape, dtype=bool) if mask is None else np.broadcast_to(mask, x.shape)
+        n_b = mask.sum(axis=0).astype(np.float64)
+        seen = n_b > 0
+        if not seen.any():
+            return
+        mean_b = np.where(seen, np.where(mask, x, 0.0).sum(axis=0) / np.maximum(n_b, 1), 0.0)
+        m2_b = np.where(mask, (x - mean_b) ** 2, 0.0).sum(axis=0)
+
+        # Forget in proportion to how many new samples each channel got
+        keep = self.decay ** n_b
+        n_a, m2_a = self.n * keep, self.m2 * keep
+        n = n_a + n_b
+        delta = mean_b - self.mean
+        safe_n = np.where(seen, n, 1.0)
+        self.mean = np.where(seen, self.mean + delta * n_b / safe_n, self.mean)
+        self.m2 = np.where(seen, m2_a + m2_b + delta ** 2 * n_a * n_b / safe_n, self.m2)
+        self.n = np.where(seen, n, self.n)
+
+    @property
+    def var(self):
+        return np.where(self.n > 1, self.m2 / np.maximum(self.n - 1, 1), 0.0)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    def seed(self, mean, std, weight):
+        self.mean = np.broadcast_to(np.asarray(mean, dtype=np.float64), (self.n_channels,)).copy()
+        self.n = np.full(self.n_channels, float(weight))
+        self.m2 = np.asarray(std, dtype=np.float64) ** 2 * max(weight - 1, 0)
+        self.m2 = np.broadcast_to(self.m2, (self.n_channels,)).copy()
+
+    def state(self):
+        return {'n': self.n.tolist(), 'mean': self.mean.tolist(), 'std': self.std.tolist()}
+
+
+class QuantileSketch:
+    """
+    Fixed-size per-channel sample of the recent signal for robust
+    percentiles: every `stride`-th sample a channel gets goes into a ring of
+    `size`, so it covers the last size * stride samples in constant memory.
+    """
+    def __init__(self, n_channels=1, size=1024, stride=1):
+        self.n_channels = n_channels
+        self.size = size
+        self.stride = stride
+        self.values = np.zeros((size, n_channels))
+        self.filled = np.zeros(n_channels, dtype=np.int64)
+        self.pos = np.zeros(n_channels, dtype=np.int64)
+        self.skip = np.zeros(n_channels, dtype=np.int64)
+
+    def update(self, block, mask=None):
+        x = np.asarray(block, dtype=np.float64).reshape(-1, self.n_channels)
+        for c in range(self.n_channels):
+            values = x[:, c] if mask is None else x[np.broadcast_to(mask, x.shape)[:, c], c]
+            # Carry the decimation phase over from the last block
+            taken = values[self.skip[c]::self.stride][-self.size:]
+            self.skip[c] = (self.skip[c] - len(values)) % self.stride
+            if len(taken) == 0:
+                continue
+            idx = (self.pos[c] + np.arange(len(taken))) % self.size
+            self.values[idx, c] = taken
+            self.pos[c] = (self.pos[c] + len(taken)) % self.size
+            self.filled[c] = min(self.filled[c] + len(taken), self.size)
+
+    def percentile(self, q):
+        """
+        (n_channels,) q-th percentile, (len(q), n_channels) for a list of
+        them, nan for channels with no samples yet.
+        """
+        q = np.asarray(q, dtype=np.float64)
+        out = np.full(q.shape + (self.n_channels,), np.nan)
+        filled = self.filled
+        if filled.min() == filled.max():
+            # Usually the case once the ring is full, one call for every channel
+            if filled[0]:
+                out[...] = np.percentile(self.values[:filled[0]], q, axis=0)
+            return out
+        for c in range(self.n_channels):
+            if filled[c]:
+                out[..., c] = np.percentile(self.values[:filled[c], c], q)
+        return out
+
+    @property
+    def count(self):
+        return self.filled
+
+
+class AdaptiveCalibrator:
+    """
+    half_life: seconds of rest (or activity) after which old samples count
+        half, also how far back the rest sketch reaches.
+    warmup: seconds of rest before the rest statistics take over. Until
+        then (without a profile) the threshold comes from the median and
+        spread of everything seen so far, `threshold` is only the start
+        (default filters.DEFAULT_THRESHOLD).
+    """
+    def __init__(self, sample_rate, n_channels=1, threshold=300.0, fraction=0.5, min_sigma=4.0,
+                 half_life=30.0, warmup=2.0, sketch_size=1024, gain_limits=(0.25, 4.0)):
+        self.sample_rate = sample_rate
+        self.n_channels = n_channels
+        self.default_threshold = np.broadcast_to(np.asarray(threshold, dtype=np.float64), (n_channels,)).copy()
+        self.fraction = fraction
+        self.min_sigma = min_sigma
+        self.warmup = int(warmup * sample_rate)
+        self.gain_limits = gain_limits
+        half_life_samples = half_life * sample_rate
+        self.rest = RunningStats(n_channels, half_life_samples)
+        self.active = RunningStats(n_channels, half_life_samples)
+        stride = max(1, int(half_life_samples // sketch_size))
+        self.sketch = QuantileSketch(n_channels, sketch_size, stride)
+        # Everything, rest or not, only used until the first warmup is over
+        self.recent = QuantileSketch(n_channels, sketch_size, stride)
+        # Activity level the model / profile was calibrated at, gain() maps back to it
+        self.reference = None
+        self.seeded = False
+        self._threshold = self.default_threshold.copy()
+        # Envelope below this is rest (noise floor), above it activity
+        self._gate = self.default_threshold.copy()
+
+    def update(self, envelope, labels=None):
+        """
+        envelope (n_samples, n_channels). With labels (e.g. from the cue
+        engine, 0 = rest) those decide rest / active instead of the threshold.
+        """
+        x = np.asarray(envelope, dtype=np.float64).reshape(-1, self.n_channels)
+        if len(x) == 0:
+            return self._threshold
+        if labels is None:
+            if not self.ready():
+                # Nothing to go on yet, take the noise floor from the median
+                # and spread of everything so far, people start out resting
+                self.recent.update(x)
+                level, low = self.recent.percentile([50, 16])
+                sigma = level - low
+                self._gate = np.where(np.isfinite(level), level + self.min_sigma * sigma, self._gate)
+            # Only what is clearly noise counts as rest, weak activity below
+            # the threshold would otherwise widen the rest spread and push
+            # the threshold up as the muscle tires
+            active = x > self._gate
+        else:
+            active = np.broadcast_to((np.asarray(labels) != 0).reshape(-1, 1), x.shape)
+        self.rest.update(x, ~active)
+        self.sketch.update(x, ~active)
+        self.active.update(x, active)
+        if self.ready():
+            self._estimate()
+        else:
+            self._threshold = np.maximum(self._gate, self._threshold)
+        return self._threshold
+
+    def ready(self):
+        """True once there is enough rest (or a profile) to go by."""
+        return self.seeded or bool(np.all(self.sketch.count * self.sketch.stride >= self.warmup))
+
+    def rest_level(self):
+        """
+        (median, robust sigma) of the resting envelope. The spread comes
+        from the lower half only, activity that slipped in as rest sits in
+        the upper tail and would otherwise widen it.
+        """
+        median, low = self.sketch.percentile([50, 16])
+        sigma = median - low
+        # Before the sketch has anything, fall back to the seeded statistics
+        return np.where(np.isnan(median), self.rest.mean, median), np.where(np.isnan(sigma), self.rest.std, sigma)
+
+    def _estimate(self):
+        level, sigma = self.rest_level()
+        gate = level + self.min_sigma * sigma
+        threshold = np.maximum(gate, level + self.fraction * (self.active.mean - level))
+        self._gate = np.where(np.isfinite(gate), gate, self._gate)
+        self._threshold = np.where(np.isfinite(threshold), threshold, self._threshold)
+
+    @property
+    def threshold(self):
+        """(n_channels,) current activation threshold on the envelope."""
+        return self._threshold
+
+    def gain(self):
+        """Per-channel factor that brings the signal back to the reference activity level."""
+        if self.reference is None:
+            return np.ones(self.n_channels)
+        level, _ = self.rest_level()
+        current = self.active.mean - level
+        # Channels without a reference (nan) or without activity yet stay as they are
+        usable = (current > 0) & np.isfinite(self.reference)
+        gain = np.where(usable, (self.reference - level) / np.where(usable, current, 1.0), 1.0)
+        return np.clip(gain, *self.gain_limits)
+
+    def normalize(self, samples):
+        """Samples (n, n_channels) or windows (..., n_channels) scaled by gain()."""
+        return np.asarray(samples) * self.gain()
+
+    def profile(self, user=None):
+        level, sigma = self.rest_level()
+        return {
+            'version': PROFILE_VERSION,
+            'user': user,
+            'updated': datetime.datetime.now().isoformat(timespec='seconds'),
+            'sample_rate': self.sample_rate,
+            'n_channels': self.n_channels,
+            'threshold': self._threshold.tolist(),
+            'rest': {'level': level.tolist(), 'sigma': sigma.tolist(), **self.rest.state()},
+            'active': self.active.state(),
+            'reference': [None if not np.isfinite(r) else float(r) for r in self._reference()],
+        }
+
+    def _reference(self):
+        """Reference activity level per channel, nan where no activity was ever seen."""
+        if self.reference is not None:
+            return self.reference
+        return np.where(self.active.n > 0, self.active.mean, np.nan)
+
+    def seed(self, profile, weight=None):
+        """
+        Start from a stored profile. It counts as `weight` samples (default
+        the warmup length), so the live signal takes over within seconds.
+        """
+        if profile['n_channels'] != self.n_channels:
+            raise ValueError(f"profile is for {profile['n_channels']} channels, not {self.n_channels}")
+        weight = weight or max(self.warmup, 1)
+        rest, active = profile['rest'], profile['active']
+        self.rest.seed(rest['level'], rest['sigma'], weight)
+        if max(active['n']) > 0:
+            self.active.seed(active['mean'], active['std'], weight)
+        # Profiles saved before any activity have no reference (null), and
+        # a zero one would shrink the signal to the lowest gain
+        reference = np.array([np.nan if r is None else r for r in profile.get('reference') or [None] * self.n_channels],
+                             dtype=np.float64)
+        reference = np.where(reference > 0, reference, np.nan)
+        self.reference = reference if np.isfinite(reference).any() else None
+        self._threshold = np.asarray(profile['threshold'], dtype=np.float64)
+        level = np.asarray(rest['level'], dtype=np.float64)
+        self._gate = level + self.min_sigma * np.asarray(rest['sigma'], dtype=np.float64)
+        self.seeded = True
+
+    def save_profile(self, path, user=None):
+        """Write profile() to `path`. Callers only save once ready(), see inference.py."""
+        folder = os.path.dirname(str(path))
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.profile(user), f, indent=1)
+
+    @classmethod
+    def from_profile(cls, path, sample_rate, n_channels=1, **kwargs):
+        """A calibrator seeded from `path` if it exists, otherwise a fresh one."""
+        calibrator = cls(sample_rate, n_channels, **kwargs)
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                calibrator.seed(json.load(f))
+        return calibrator
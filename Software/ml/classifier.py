@@ -0,0 +1,159 @@
+"""
+NumPy-only classifier runtime for the inference loop.
+
+Models trained in EMG_Models.ipynb are exported to an .npz file with
+export_sklearn() (or export_model() for anything hand-rolled) and loaded
+once at startup with load_model(). Prediction is plain matrix math, so the
+live loop needs neither sklearn nor the notebook.
+
+Supported kinds:
+    linear  LDA / logistic regression / linear SVM: scores = X @ coef.T + intercept
+    mlp     small fully connected net, relu/tanh/logistic hidden layers
+
+Every file also stores the feature scaling (mean, scale), the class labels,
+the feature names and the window settings the model was trained with.
+"""
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from features import DEFAULT_FEATURES, extract_features
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'data_collection'))
+from instrumentation import Stats
+
+ACTIVATIONS = {
+    'identity': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'tanh': np.tanh,
+    'logistic': lambda x: 1.0 / (1.0 + np.exp(-x)),
+}
+
+
+def _softmax(scores):
+    scores = scores - scores.max(axis=1, keepdims=True)
+    e = np.exp(scores)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+class Model:
+    def __init__(self, kind, classes, layers, mean=None, scale=None, activation='relu',
+                 feature_names=None, config=None):
+        self.kind = kind
+        self.classes = np.asarray(classes)
+        # [(weights (n_in, n_out), bias (n_out,)), ...], a linear model is one layer
+        self.layers = [(np.asarray(w, dtype=np.float64), np.asarray(b, dtype=np.float64)) for w, b in layers]
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float64)
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float64)
+        self.activation = ACTIVATIONS[activation]
+        self.activation_name = activation
+        self.feature_names = feature_names
+        self.config = config or {}
+
+    @property
+    def n_features(self):
+        return self.layers[0][0].shape[0]
+
+    def scores(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[None]
+        if self.mean is not None:
+            X = X - self.mean
+        if self.scale is not None:
+            X = X / self.scale
+
+        for w, b in self.layers[:-1]:
+            X = self.activation(X @ w + b)
+        w, b = self.layers[-1]
+        scores = X @ w + b
+        if scores.shape[1] == 1:
+            # Binary models only store the positive class score
+            scores = np.hstack((np.zeros_like(scores), scores))
+        return scores
+
+    def predict(self, X):
+        return self.classes[np.argmax(self.scores(X), axis=1)]
+
+    def predict_proba(self, X):
+        return _softmax(self.scores(X))
+
+
+def export_model(path, kind, classes, layers, mean=None, scale=None, activation='relu',
+                 feature_names=None, **config):
+    arrays = {'classes': np.asarray(classes)}
+    for i, (w, b) in enumerate(layers):
+        arrays[f'w{i}'] = np.asarray(w)
+        arrays[f'b{i}'] = np.asarray(b)
+    if mean is not None:
+        arrays['mean'] = np.asarray(mean)
+    if scale is not None:
+        arrays['scale'] = np.asarray(scale)
+    info = {
+        'kind': kind,
+        'n_layers': len(layers),
+        'activation': activation,
+        'feature_names': list(feature_names) if feature_names is not None else None,
+        'config': config,
+    }
+    np.savez(path, info=np.array(json.dumps(info)), **arrays)
+
+
+def export_sklearn(model, path, feature_names=None, scaler=None, **config):
+    """
+    Export a fitted LinearDiscriminantAnalysis, LogisticRegression,
+    LinearSVC or MLPClassifier. scaler is an optional fitted StandardScaler.
+    config is stored as is, e.g. window=200, hop=25, sample_rate=1000.
+    """
+    mean = getattr(scaler, 'mean_', None)
+    scale = getattr(scaler, 'scale_', None)
+    if hasattr(model, 'coefs_'):
+        layers = list(zip(model.coefs_, model.intercepts_))
+        export_model(path, 'mlp', model.classes_, layers, mean, scale, model.activation, feature_names, **config)
+    else:
+        layers = [(np.asarray(model.coef_).T, np.atleast_1d(model.intercept_))]
+        export_model(path, 'linear', model.classes_, layers, mean, scale, 'identity', feature_names, **config)
+
+
+def load_model(path):
+    with np.load(path, allow_pickle=False) as f:
+        info = json.loads(str(f['info']))
+        layers = [(f[f'w{i}'], f[f'b{i}']) for i in range(info['n_layers'])]
+        mean = f['mean'] if 'mean' in f else None
+        scale = f['scale'] if 'scale' in f else None
+        classes = f['classes']
+    return Model(info['kind'], classes, layers, mean, scale, info['activation'],
+                 info['feature_names'], info['config'])
+
+
+class ClassifierRuntime:
+    """
+    Feature extraction + prediction for windows from the inference loop.
+    The 'feature' and 'predict' stages are timed into `stats`.
+    """
+    def __init__(self, model, sample_rate, n_channels=1, stats=None):
+        self.model = model
+        self.sample_rate = model.config.get('sample_rate', sample_rate)
+        self.features = model.config.get('features', DEFAULT_FEATURES)
+        self.feature_kwargs = {k: model.config[k] for k in ('bands', 'zc_threshold', 'ssc_threshold', 'wamp_threshold')
+                               if k in model.config}
+        self.window = model.config.get('window')
+        self.stats = Stats() if stats is None else stats
+
+        # Warm up and make sure the features line up with what was trained
+        window = self.window or 100
+        X, names = extract_features(np.zeros((window, n_channels)), self.sample_rate, self.features, **self.feature_kwargs)
+        if X.shape[1] != model.n_features:
+            raise ValueError(f"model expects {model.n_features} features, the runtime makes {X.shape[1]}")
+        if model.feature_names is not None and list(model.feature_names) != names:
+            raise ValueError("feature names don't match the ones the model was trained on")
+        model.predict(X)
+
+    def predict(self, windows):
+        """windows: (window, n_channels) or a batch (n_windows, window, n_channels)."""
+        with self.stats.time('feature'):
+            X, names = extract_features(windows, self.sample_rate, self.features, **self.feature_kwargs)
+        with self.stats.time('predict'):
+            return self.model.predict(X)
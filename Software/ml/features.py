@@ -0,0 +1,192 @@
+"""
+EMG feature extraction.
+
+extract_features() works on a whole stack of windows at once, e.g. the
+strided view from Session.windows(), so there is no Python loop over
+windows. RunningFeatures keeps the time-domain features of the newest
+window up to date as samples arrive, without recomputing the window.
+
+Time domain: MAV, RMS, WL (waveform length), ZC (zero crossings),
+SSC (slope sign changes), WAMP (Willison amplitude)
+Frequency domain: MNF (mean frequency), MDF (median frequency), band powers
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'data_collection'))
+from ringbuffer import RingBuffer
+
+TIME_FEATURES = ['mav', 'rms', 'wl', 'zc', 'ssc', 'wamp']
+FREQ_FEATURES = ['mnf', 'mdf']
+DEFAULT_FEATURES = TIME_FEATURES + FREQ_FEATURES + ['bandpower']
+DEFAULT_BANDS = [(20, 50), (50, 100), (100, 200), (200, 450)]
+
+
+def _zc(x, dx, zc_threshold):
+    return np.count_nonzero((x[:, :-1] * x[:, 1:] < 0) & (np.abs(dx) >= zc_threshold), axis=1)
+
+
+def _ssc(dx, ssc_threshold):
+    return np.count_nonzero(-dx[:, :-1] * dx[:, 1:] > ssc_threshold, axis=1)
+
+
+def extract_features(windows, sample_rate, features=DEFAULT_FEATURES, bands=DEFAULT_BANDS,
+                     zc_threshold=0.0, ssc_threshold=0.0, wamp_threshold=0.0):
+    """
+    windows: (n_windows, window, n_channels) or (window, n_channels)
+    Returns (matrix, names). matrix is (n_windows, n_features * n_channels)
+    float64, grouped by feature then channel, names matches its columns
+    (e.g. 'rms_ch2', 'bp_50_100_ch1').
+    """
+    x = np.asarray(windows, dtype=np.float64)
+    if x.ndim == 2:
+        x = x[None]
+    n_windows, window, n_channels = x.shape
+
+    columns, names = [], []
+
+    def add(name, values):
+        columns.append(values)
+        names.extend(f"{name}_ch{c + 1}" for c in range(n_channels))
+
+    dx = np.diff(x, axis=1)
+    for name in features:
+        if name == 'mav':
+            add(name, np.mean(np.abs(x), axis=1))
+        elif name == 'rms':
+            add(name, np.sqrt(np.mean(x * x, axis=1)))
+        elif name == 'wl':
+            add(name, np.sum(np.abs(dx), axis=1))
+        elif name == 'zc':
+            add(name, _zc(x, dx, zc_threshold))
+        elif name == 'ssc':
+            add(name, _ssc(dx, ssc_threshold))
+        elif name == 'wamp':
+            add(name, np.count_nonzero(np.abs(dx) > wamp_threshold, axis=1))
+
+    spectral = [name for name in features if name in FREQ_FEATURES or name == 'bandpower']
+    if spectral:
+        # Demeaned power spectrum of every window and channel in one rfft
+        spectrum = np.abs(np.fft.rfft(x - x.mean(axis=1, keepdims=True), axis=1)) ** 2
+        freqs = np.fft.rfftfreq(window, 1.0 / sample_rate)
+        total = spectrum.sum(axis=1)
+        safe_total = np.where(total > 0, total, 1.0)
+        for name in spectral:
+            if name == 'mnf':
+                add(name, np.tensordot(freqs, spectrum, axes=(0, 1)) / safe_total)
+            elif name == 'mdf':
+                cumulative = np.cumsum(spectrum, axis=1)
+                idx = np.argmax(cumulative >= total[:, None, :] / 2, axis=1)
+                add(name, freqs[idx])
+            elif name == 'bandpower':
+                nyquist = sample_rate / 2
+                for low, high in bands:
+                    if low >= nyquist:
+                        continue
+                    mask = (freqs >= low) & (freqs < high)
+                    add(f"bp_{low}_{high}", spectrum[:, mask, :].sum(axis=1) / window)
+
+    if not columns:
+        return np.zeros((n_windows, 0)), names
+    return np.concatenate(columns, axis=1).astype(np.float64), names
+
+
+def session_features(session, window, hop, features=DEFAULT_FEATURES, channels=None, batch=4096, **kwargs):
+    """
+    Features for every window of a Session, computed a batch of windows at a
+    time. Returns (starts, matrix, names).
+    """
+    starts, blocks, names = [], [], []
+    for first, windows in session.iter_windows(window, hop, batch=batch, channels=channels):
+        matrix, names = extract_features(windows, session.sample_rate, features, **kwargs)
+        starts.append(first)
+        blocks.append(matrix)
+    if not blocks:
+        return np.zeros(0, dtype=int), np.zeros((0, 0)), names
+    return np.concatenate(starts), np.concatenate(blocks), names
+
+
+class RunningFeatures:
+    """
+    Time-domain features of the newest `window` samples, updated in O(new
+    samples) per call. Each sample's contribution to every feature is kept
+    in a ring buffer so it can be subtracted again when it leaves the
+    window. Matches extract_features() for the same window.
+
+    Spectral features need the whole window, use extract_features() on the
+    EMGBuffer window for those.
+    """
+    N_TERMS = 6  # |x|, x^2, |dx|, zc, wamp, ssc
+
+    def __init__(self, window, n_channels=1, zc_threshold=0.0, ssc_threshold=0.0, wamp_threshold=0.0):
+        self.window = window
+        self.n_channels = n_channels
+        self.zc_threshold = zc_threshold
+        self.ssc_threshold = ssc_threshold
+        self.wamp_threshold = wamp_threshold
+
+        self.terms = RingBuffer(window, n_channels * self.N_TERMS, dtype=np.float64)
+        self.sums = np.zeros((self.N_TERMS, n_channels))
+        # Last two raw samples, needed for the differences of the next block
+        self.tail = np.zeros((0, n_channels))
+
+    def _contributions(self, block):
+        x = np.concatenate((self.tail, block))
+        dx = np.diff(x, axis=0)
+        n = len(block)
+        terms = np.zeros((n, self.N_TERMS, self.n_channels))
+        terms[:, 0] = np.abs(block)
+        terms[:, 1] = block * block
+
+        # Differences ending at each new sample, the very first sample has none
+        d = dx[-n:] if len(dx) >= n else np.concatenate((np.zeros((n - len(dx), self.n_channels)), dx))
+        has_prev = np.arange(n) >= n - len(dx)
+        terms[:, 2] = np.abs(d)
+        prev = x[-n - 1:-1] if len(x) > n else np.concatenate((np.zeros((1, self.n_channels)), x[:-1]))
+        terms[:, 3] = has_prev[:, None] & (prev * block < 0) & (np.abs(d) >= self.zc_threshold)
+        terms[:, 4] = has_prev[:, None] & (np.abs(d) > self.wamp_threshold)
+
+        # Slope sign change at the previous sample, counted when this one arrives
+        if len(dx) >= 2:
+            ssc = -dx[:-1] * dx[1:] > self.ssc_threshold
+            terms[n - min(n, len(ssc)):, 5] = ssc[-n:]
+
+        self.tail = x[-2:]
+        return terms
+
+    def update(self, block):
+        block = np.asarray(block, dtype=np.float64).reshape(-1, self.n_channels)
+        if len(block) == 0:
+            return self.features()
+        terms = self._contributions(block)
+
+        n = len(block)
+        if n >= self.window or self.terms.count < self.window:
+            self.terms.extend(terms.reshape(n, -1))
+            self.sums = self.terms.latest(self.window).sum(axis=0).reshape(self.N_TERMS, self.n_channels)
+        else:
+            leaving = self.terms.latest(self.window)[:n].sum(axis=0).reshape(self.N_TERMS, self.n_channels)
+            self.terms.extend(terms.reshape(n, -1))
+            self.sums += terms.sum(axis=0) - leaving
+            if self.terms.count % self.window < n:
+                # Once per lap, stop rounding error from building up
+                self.sums = self.terms.latest(self.window).sum(axis=0).reshape(self.N_TERMS, self.n_channels)
+        return self.features()
+
+    def features(self):
+        """(6, n_channels) array in TIME_FEATURES order for the newest window."""
+        n = min(self.terms.count, self.window)
+        if n == 0:
+            return np.zeros((self.N_TERMS, self.n_channels))
+        sums = self.sums.copy()
+        # The oldest sample's difference (and the two oldest slope changes)
+        # reach outside the window, extract_features doesn't count them
+        held = self.terms.latest(n).reshape(n, self.N_TERMS, self.n_channels)
+        sums[2:5] -= held[0, 2:5]
+        sums[5] -= held[:2, 5].sum(axis=0)
+
+        mav = sums[0] / n
+        rms = np.sqrt(sums[1] / n)
+        return np.stack([mav, rms, sums[2], sums[3], sums[5], sums[4]])
@@ -0,0 +1,286 @@
+"""
+Recording, live inference and replay from the command line, for unattended
+collection on boards without a display.
+
+    python headless.py record /dev/ttyUSB0 --channels 8 --rate 1000 --minutes 30
+    python headless.py record 'synthetic://?rate=1000&channels=4' --seconds 10 --out saves
+    python headless.py infer auto --rate 100 --model model.npz --record saves
+    python headless.py replay saves/2025-03-01_12-00-00.emg --speed 0
+    python headless.py ports
+
+Nothing but the standard library is imported until a command runs, and
+then only what it needs: `record` takes NumPy and the port (pyserial for a
+real device) and reads it in this process rather than starting the
+shared-memory acquisition process, so samples are going to disk a fraction
+of a second after launch. `infer` and `replay` add SciPy for the filters
+and run the async_pipeline stages. Ctrl-C or SIGTERM (e.g. from systemd)
+stops cleanly and closes the session file.
+"""
+import argparse
+import signal
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'data_collection'))
+
+PROFILE_PATH = Path(__file__).resolve().parent / 'profiles' / 'default.json'
+# filters.DEFAULT_THRESHOLD, not imported here to keep SciPy out of startup
+DEFAULT_THRESHOLD = 300.0
+
+
+class PortSource:
+    """
+    Reads and decodes a port in the calling thread. Called like the
+    async_pipeline sources: (samples, times or None), an empty block when
+    nothing arrived within the port timeout, None once a replay or
+    synthetic transport is exhausted.
+    """
+    def __init__(self, port, baudrate=115200, n_channels=1, sample_rate=1000, protocol='binary',
+                 nodes=None, stats=None):
+        from acquisition import make_decoder
+        from protocol import FrameReader
+        from transport import open_transport
+
+        self.sample_rate = sample_rate
+        self.ser = open_transport(port, baudrate, timeout=0.05, n_channels=n_channels, protocol=protocol)
+        self.decoder, self.aligned = make_decoder(protocol, n_channels, sample_rate, nodes)
+        self.reader = FrameReader(self.ser, self.decoder, stats)
+        self._exhausted = getattr(self.ser, 'exhausted', lambda: False)
+        self._first_time = None
+        self._count = 0
+
+    def __call__(self):
+        import numpy as np
+
+        samples, _ = self.reader.read()
+        times = None
+        if self.aligned is not None and len(samples):
+            first, samples = self.aligned.process(samples)
+            if self._first_time is None and first is not None:
+                self._first_time = first
+            if len(samples):
+                # Device clock, sample n is n periods after the first one
+                times = self._first_time + (self._count + np.arange(len(samples))) / self.sample_rate
+        if len(samples) == 0 and self._exhausted():
+            return None
+        self._count += len(samples)
+        return samples, times
+
+    def update_stats(self, stats):
+        """Decoder counters into a Stats as gauges, like RingReader.update_stats()."""
+        stats.set('frames', self.decoder.frames)
+        stats.set('bad_frames', self.decoder.bad_frames)
+        stats.set('seq_gaps', self.decoder.seq_gaps)
+        stats.set('skipped_bytes', self.decoder.skipped_bytes)
+        if self.aligned is not None:
+            stats.set('align_gaps', self.aligned.aligner.gaps)
+
+    def close(self):
+        self.ser.close()
+
+
+def _interrupt(signum, frame):
+    # SIGTERM ends the run the same way Ctrl-C does. Re-raised as SIGINT
+    # rather than KeyboardInterrupt so asyncio.run() gets to cancel its tasks
+    signal.raise_signal(signal.SIGINT)
+
+
+def _duration(args):
+    if args.minutes is not None:
+        return args.minutes * 60
+    return args.seconds
+
+
+def record(args):
+    import numpy as np
+
+    from instrumentation import Stats
+    from recorder import SessionRecorder, new_session_path
+
+    stats = Stats()
+    try:
+        source = PortSource(args.port, args.baud, args.channels, args.rate, args.protocol, args.nodes, stats)
+    except Exception as e:
+        print(f"Error connecting to serial port: {e}")
+        return 1
+
+    path = new_session_path(args.out, args.suffix)
+    duration = _duration(args)
+    period = 1.0 / args.rate
+    written = 0
+    with SessionRecorder(path, args.rate, args.names or args.channels) as recorder:
+        print(f"Recording to {path}" + (f" for {duration:g} s" if duration else ", Ctrl-C to stop"))
+        start = last_status = time.monotonic()
+        try:
+            while duration is None or time.monotonic() - start < duration:
+                item = source()
+                if item is None:
+                    break
+                samples, times = item
+                if len(samples) == 0:
+                    continue
+                if times is None:
+                    times = time.time() - (len(samples) - 1 - np.arange(len(samples))) * period
+                recorder.write(samples, times)
+                written += len(samples)
+                now = time.monotonic()
+                if not args.quiet and now - last_status >= args.status:
+                    source.update_stats(stats)
+                    print(f"{written} samples ({written / (now - start):.0f}/s)  {stats.summary()}")
+                    stats.reset()
+                    last_status = now
+        except KeyboardInterrupt:
+            pass
+        finally:
+            source.close()
+    print(f"Saved {written} samples ({written * period:.1f} s) to {path}")
+    return 0
+
+
+def infer(args, save_profile=True):
+    import asyncio
+
+    from async_pipeline import Pipeline, udp_publisher
+    from calibration import AdaptiveCalibrator
+    from classifier import ClassifierRuntime, load_model
+    from inference import control_output
+    from instrumentation import Stats, StatsLogger
+
+    stats = Stats()
+    try:
+        source = PortSource(args.port, args.baud, args.channels, args.rate, args.protocol, args.nodes, stats)
+    except Exception as e:
+        print(f"Error connecting to serial port: {e}")
+        return 1
+
+    calibrator = AdaptiveCalibrator.from_profile(args.profile, args.rate, args.channels, threshold=args.threshold)
+    runtime = None
+    if args.model:
+        runtime = ClassifierRuntime(load_model(args.model), args.rate, args.channels, stats=stats)
+        print(f"Loaded {runtime.model.kind} model, classes: {list(runtime.model.classes)}")
+
+    recorder = None
+    if args.record:
+        from recorder import SessionRecorder, new_session_path
+
+        recorder = SessionRecorder(new_session_path(args.record, args.suffix), args.rate, args.names or args.channels)
+        print(f"Recording to {recorder.path}")
+
+    previous_motion = 0
+
+    def actuate(motion):
+        nonlocal previous_motion
+        previous_motion = control_output(motion, previous_motion)
+
+    if args.quiet:
+        publish = lambda snapshot: None
+    elif args.udp:
+        host, port = args.udp.rsplit(':', 1)
+        publish = udp_publisher(host, int(port))
+    else:
+        publish = None
+    pipeline = Pipeline(source, args.rate, args.channels, window=args.window, hop_ms=args.hop_ms,
+                        runtime=runtime, threshold=args.threshold, calibrator=calibrator,
+                        normalize=args.normalize, actuate=actuate, recorder=recorder, publish=publish,
+                        update=source.update_stats, stats=stats, blocking=True,
+                        telemetry_interval=args.status,
+                        logger=StatsLogger(stats, args.stats) if args.stats else None)
+    try:
+        asyncio.run(pipeline.run())
+    except KeyboardInterrupt:
+        print("\nStopping inference...")
+    finally:
+        source.close()
+        if recorder is not None:
+            recorder.close()
+            print(f"Saved {recorder.n_samples} samples to {recorder.path}")
+        if save_profile and args.profile and calibrator.ready():
+            calibrator.save_profile(args.profile)
+    return 0
+
+
+def replay(args):
+    from session import Session
+
+    session = Session(args.session)
+    args.rate, args.channels = session.sample_rate, session.n_channels
+    args.names = session.channels
+    session.close()
+    args.port = f"replay://{args.session}?speed={args.speed:g}"
+    args.baud, args.protocol, args.nodes = 115200, 'binary', None
+    # A replay shouldn't move the live profile
+    return infer(args, save_profile=False)
+
+
+def ports(args):
+    from transport import KNOWN_VIDS, discover_port, list_ports
+
+    best = discover_port()
+    for p in list_ports():
+        mark = '*' if p.device == best else ' '
+        print(f"{mark} {p.device}  {p.description}  {KNOWN_VIDS.get(p.vid, '')}")
+    return 0
+
+
+def _add_port_args(parser, default_rate):
+    parser.add_argument('port', help="device, 'auto', synthetic://... or replay://... (see transport.py)")
+    parser.add_argument('--channels', type=int, default=1)
+    parser.add_argument('--rate', type=int, default=default_rate, help="sample rate (Hz)")
+    parser.add_argument('--baud', type=int, default=115200)
+    parser.add_argument('--protocol', choices=('binary', 'ascii', 'timestamped'), default='binary')
+    parser.add_argument('--nodes', type=int, nargs='+', default=None,
+                        help="sender node ids for --protocol timestamped")
+    parser.add_argument('--names', nargs='+', default=None, help="channel names for the session file")
+
+
+def _add_infer_args(parser):
+    parser.add_argument('--model', help="exported model (.npz), without one the envelope is thresholded")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="starting threshold before calibration")
+    parser.add_argument('--profile', default=str(PROFILE_PATH), help="calibration profile, '' for none")
+    parser.add_argument('--normalize', action='store_true', help="scale the model's input by the calibrator gain")
+    parser.add_argument('--window', type=int, default=100, help="samples per window without a model")
+    parser.add_argument('--hop-ms', type=int, default=25, help="time between decisions")
+    parser.add_argument('--record', metavar='DIR', help="also record the session into DIR")
+    parser.add_argument('--suffix', default='')
+    parser.add_argument('--udp', metavar='HOST:PORT', help="send telemetry as JSON datagrams instead of printing")
+    parser.add_argument('--stats', metavar='PATH', help="append telemetry to this JSON lines file")
+    parser.add_argument('--status', type=float, default=1.0, help="seconds between status lines")
+    parser.add_argument('--quiet', action='store_true')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record, run inference or replay without a GUI")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('record', help="record a port to a session file")
+    _add_port_args(p, 1000)
+    p.add_argument('--out', default='saves', help="folder for the session file")
+    p.add_argument('--suffix', default='')
+    p.add_argument('--seconds', type=float, default=None)
+    p.add_argument('--minutes', type=float, default=None)
+    p.add_argument('--status', type=float, default=5.0, help="seconds between status lines")
+    p.add_argument('--quiet', action='store_true')
+    p.set_defaults(run=record)
+
+    p = commands.add_parser('infer', help="live inference on a port")
+    _add_port_args(p, 100)
+    _add_infer_args(p)
+    p.set_defaults(run=infer)
+
+    p = commands.add_parser('replay', help="inference over a recorded session")
+    p.add_argument('session')
+    p.add_argument('--speed', type=float, default=1.0, help="times real time, 0 for as fast as possible")
+    _add_infer_args(p)
+    p.set_defaults(run=replay)
+
+    p = commands.add_parser('ports', help="list serial ports, * marks the one 'auto' picks")
+    p.set_defaults(run=ports)
+
+    args = parser.parse_args(argv)
+    signal.signal(signal.SIGTERM, _interrupt)
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
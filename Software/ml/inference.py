@@ -1,54 +1,49 @@
+import sys
 import time
 import scipy.signal as signal
 from pathlib import Path
 import numpy as np
-import serial
-import struct
-from collections import deque
+from filters import DEFAULT_THRESHOLD, butter_ba
+from classifier import ClassifierRuntime, load_model
+from calibration import AdaptiveCalibrator
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'data_collection'))
+from ringbuffer import RingBuffer
+from acquisition import open_stream
+from instrumentation import Stats, StatsLogger
 
 class EMGBuffer:
-    def __init__(self, window_size=100):
+    def __init__(self, window_size=100, n_channels=1, hop=1, capacity=None):
         self.window_size = window_size
-        self.buffer = deque(maxlen=window_size)
+        self.buffer = RingBuffer(capacity or window_size, n_channels, window=window_size, hop=hop)
     
     def add(self, value):
         self.buffer.append(value)
+
+    def extend(self, block):
+        self.buffer.extend(block)
     
     def get_data(self):
-        return np.array(list(self.buffer))
+        # View into the ring buffer, not a copy
+        data = self.buffer.latest(self.window_size)
+        return data[:, 0] if self.buffer.n_channels == 1 else data
     
     def is_full(self):
-        return len(self.buffer) == self.window_size
+        return self.buffer.is_full()
 
-def connect_serial(port='/dev/ttyUSB0', baudrate=115200):
+def read_emg_packet(reader):
     try:
-        ser = serial.Serial(port, baudrate, timeout=1)
-        print(f"Connected to {port} at {baudrate} baud")
-        return ser
-    except serial.SerialException as e:
-        print(f"Error connecting to serial port: {e}")
-        return None
-
-def read_emg_packet(ser):
-    try:
-        if ser.in_waiting > 0:
-            # Read raw bytes
-            data = ser.read(ser.in_waiting)
-            values = list(data)
-        
-            if len(values) > 0:
-                return np.mean(values)
+        # Everything the acquisition process published since the last call,
+        # (n_samples, n_channels)
+        samples = reader.read()
+        if len(samples) > 0:
+            return samples
             
         return None
     except Exception as e:
         print(f"Error reading serial: {e}")
         return None
 
-def preprocess_data(data):
-    data = data - np.mean(data)
-    data = np.abs(data)
-    return data
-
 def filter_data(data, s_rate=100):
     """
     Apply bandpass filter to EMG data
@@ -60,32 +55,27 @@ def filter_data(data, s_rate=100):
     if len(data) < 10:
         return data
     
-    nyquist_f = s_rate / 2
-    
-    # Bandpass filter: 20-450 Hz
-    high = 20.0 / nyquist_f
-    low = min(450.0 / nyquist_f, 0.99)  
-    
     try:
-        b, a = signal.butter(4, [high, low], btype='bandpass')
+        # Bandpass filter: 20-450 Hz, designs are cached per rate
+        b, a = butter_ba(4, (20.0, 450.0), s_rate, 'bandpass')
         emg_filtered = signal.filtfilt(b, a, data)
         
         # Rectify
         emg_rectified = np.abs(emg_filtered)
         
         # Envelope detection with low-pass filter at 5 Hz
-        low_pass = 5.0 / nyquist_f
-        b2, a2 = signal.butter(4, low_pass, btype='lowpass')
+        b2, a2 = butter_ba(4, 5.0, s_rate, 'lowpass')
         emg_envelope = signal.filtfilt(b2, a2, emg_rectified)
         
         return emg_envelope
     except Exception as e:
         return data
 
-def threshold_prediction(data, threshold=100):
-    max_value = np.max(data)
+def threshold_prediction(data, threshold=DEFAULT_THRESHOLD):
+    # Per channel, threshold can be one value or one per channel
+    max_value = np.max(data, axis=0)
     
-    if max_value > threshold:
+    if np.any(max_value > threshold):
         return 1  # Active/Grab
     else:
         return 0  # Relaxed/Release
@@ -106,65 +96,54 @@ def control_output(motion, previous_motion):
     
     return motion
 
-def calibrate_threshold(ser, duration=5):
-    print(f"Keep muscle RELAXED for {duration} seconds...")
-    time.sleep(2)
-    
-    baseline_buffer = []
-    start = time.time()
-    while time.time() - start < duration:
-        value = read_emg_packet(ser)
-        if value is not None:
-            baseline_buffer.append(value)
-        time.sleep(0.01)
-    
-    baseline_mean = np.mean(baseline_buffer)
-    baseline_std = np.std(baseline_buffer)
-    
-    # print(f"Baseline: {baseline_mean:.2f} ± {baseline_std:.2f}")
-    print(f"\nNow CONTRACT muscle for {duration} seconds...")
-    time.sleep(2)
-    
-    active_buffer = []
-    start = time.time()
-    while time.time() - start < duration:
-        value = read_emg_packet(ser)
-        if value is not None:
-            active_buffer.append(value)
-        time.sleep(0.01)
-    
-    active_mean = np.mean(active_buffer)
-    active_max = np.max(active_buffer)
-    
-    # print(f"Active: {active_mean:.2f}, Max: {active_max:.2f}")
-    
-    threshold = baseline_mean + (active_mean - baseline_mean) * 0.5
-    return threshold
-
-
 if __name__ == "__main__":
+    # Imported here, async_pipeline imports this module for the helpers above
+    from async_pipeline import Pipeline
+
     # Config
-    SERIAL_PORT = '/dev/ttyUSB0'  
+    SERIAL_PORT = 'auto'  # or a device, 'synthetic://...', 'replay://...' (see transport.py)
     BAUDRATE = 115200
     SAMPLE_RATE = 100  # Hz
+    N_CHANNELS = 1
     WINDOW_SIZE = 100  # Number of samples in sliding window
-    THRESHOLD = 100  
-    
-    ser = connect_serial(SERIAL_PORT, BAUDRATE)
-    if ser is None:
+    HOP_MS = 25  # Classify this often
+    MAX_BATCH = 8  # Windows classified together when the loop falls behind
+    THRESHOLD = DEFAULT_THRESHOLD  # Starting point until the calibrator has seen some rest
+    # Per-user calibration, updated on exit. Scale the signal back to the
+    # profile's activity level before the model with NORMALIZE
+    PROFILE_PATH = Path(__file__).resolve().parent / 'profiles' / 'default.json'
+    NORMALIZE = False
+    # Exported from EMG_Models.ipynb with classifier.export_sklearn, the
+    # threshold is used when there is no model
+    MODEL_PATH = Path(__file__).resolve().parent / 'model.npz'
+    # Per-second JSON lines of stage latencies and counters, None to disable
+    STATS_PATH = None
+    
+    # The port is owned by a separate acquisition process, we only read
+    # from its shared memory ring
+    acq, reader = open_stream(SERIAL_PORT, BAUDRATE, N_CHANNELS, SAMPLE_RATE)
+    if reader is None:
         print("Failed to connect to serial port. Exiting.")
         exit(1)
     
-    try:
-        response = input("Run calibration? (y/n): ").lower()
-        if response == 'y':
-            THRESHOLD = calibrate_threshold(ser, duration=3)
-        else:
-            print(f"Using default threshold: {THRESHOLD}")
-    except KeyboardInterrupt:
-        print("\nCalibration skipped")
+    # Calibrates itself while the loop runs, seeded from the last session
+    calibrator = AdaptiveCalibrator.from_profile(PROFILE_PATH, SAMPLE_RATE, N_CHANNELS, threshold=THRESHOLD)
+    print(f"Threshold from {'profile' if calibrator.seeded else 'live signal'}: {np.round(calibrator.threshold, 1)}")
     
-    emg_buffer = EMGBuffer(window_size=WINDOW_SIZE)
+    stats = Stats()
+    logger = StatsLogger(stats, STATS_PATH) if STATS_PATH else None
+
+    runtime = None
+    if MODEL_PATH.exists():
+        runtime = ClassifierRuntime(load_model(MODEL_PATH), SAMPLE_RATE, N_CHANNELS, stats=stats)
+        print(f"Loaded {runtime.model.kind} model, classes: {list(runtime.model.classes)}")
+
+    # Filter, calibrate, schedule and classify exactly like async_pipeline
+    # and replay.py do, only the reading and pacing are this loop's own
+    pipeline = Pipeline(None, SAMPLE_RATE, N_CHANNELS, window=WINDOW_SIZE, hop_ms=HOP_MS, max_batch=MAX_BATCH,
+                        runtime=runtime, threshold=THRESHOLD, calibrator=calibrator, normalize=NORMALIZE,
+                        stats=stats)
+    scheduler = pipeline.scheduler
 
     previous_motion = 0
     frame_count = 0
@@ -173,32 +152,46 @@ if __name__ == "__main__":
     # Main Loop
     try:
         while True:
-            raw_value = read_emg_packet(ser)
+            with stats.time('read'):
+                block = read_emg_packet(reader)
             
-            if raw_value is not None:
-                emg_buffer.add(raw_value)
-                if emg_buffer.is_full():
-                    data = emg_buffer.get_data()
-                    data = preprocess_data(data)
-                    data = filter_data(data, SAMPLE_RATE)
-                    motion = threshold_prediction(data, THRESHOLD)
-                    previous_motion = control_output(motion, previous_motion)
-                    
-                    frame_count += 1
-                    
-                    # Print stats every second
-                    if frame_count % 10 == 0:
-                        elapsed = time.time() - start_time
-                        fps = frame_count / elapsed
-                        print(f"FPS: {fps:.1f}")
+            if block is not None:
+                block_time = time.perf_counter()
+                stats.count('samples', len(block))
+                # Every window whose hop came up since last time, in one batch
+                ends, motions = pipeline.step(block)
+                if len(ends):
+                    with stats.time('actuate'):
+                        for motion in motions:
+                            previous_motion = control_output(motion, previous_motion)
+                    # From the newest samples arriving to acting on them
+                    stats.record('end_to_end', time.perf_counter() - block_time)
+                    frame_count += len(ends)
+
+            # Print stats every second
+            elapsed = time.time() - start_time
+            if elapsed >= 1.0:
+                reader.update_stats(stats)
+                stats.set('skipped_windows', scheduler.skipped)
+                stats.set('late_hops', scheduler.late)
+                print(f"Decisions/s: {frame_count / elapsed:.1f}  {stats.summary()}")
+                if logger is not None:
+                    logger.write()
+                stats.reset()
+                frame_count = 0
+                start_time = time.time()
             
-            # Control loop rate
-            time.sleep(1.0 / SAMPLE_RATE)
+            # Sleep until the next hop, minus the time spent above
+            scheduler.wait()
     
     except KeyboardInterrupt:
         print("\n\nStopping inference...")
     
     finally:
-        if ser and ser.is_open:
-            ser.close()
+        # An early exit hasn't seen enough rest to be worth keeping
+        if calibrator.ready():
+            calibrator.save_profile(PROFILE_PATH)
+        reader.close()
+        if acq is not None:
+            acq.stop()
         print("Serial connection closed")
@@ -0,0 +1,272 @@
+"""
+Runs recorded sessions through the live inference pipeline and scores the
+decisions against the labels that were recorded with them.
+
+    python replay.py saves/2025-03-01_12-00-00.emg            # as fast as possible
+    python replay.py saves --speed 1                          # paced like the board
+    python replay.py saves --model model.npz --trace traces --out report.json
+
+Every session is cut into blocks of --block-ms, the size the board delivers,
+and each block goes through async_pipeline.Pipeline.step(): the same
+StreamingFilter, AdaptiveCalibrator, InferenceScheduler and threshold or
+ClassifierRuntime as a live run, with the same window, hop and batching.
+--speed paces the blocks at that many times real time, 0 feeds them as
+fast as they are processed. Actuation isn't replayed; control_output()
+would act whenever the motion changes, and the trace marks those windows.
+
+The decision trace has one row per window:
+
+    end         sample count the window ends at
+    time        seconds into the session
+    motion      prediction
+    label       recorded label at the window's last sample
+    actuated    the motion changed, control_output() would act here
+    latency_ms  from the block being handed over to its decisions
+
+Without a model predictions are 0 / 1 and compared with label != 0.
+Windows labelled UNLABELED (converted saves that never had labels, or
+recordings made without cues) are left out of the scores. The report has
+accuracy, balanced accuracy, the confusion matrix, transition counts, how
+long after a labelled onset the first active decision came, and the
+per-window latency, per session and for the whole archive.
+Sessions are replayed in parallel (--jobs) unless they are paced.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+from async_pipeline import Pipeline
+from build_features import find_sessions
+from calibration import AdaptiveCalibrator
+from classifier import ClassifierRuntime, load_model
+from filters import DEFAULT_THRESHOLD
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'data_collection'))
+from instrumentation import Stats
+from recorder import UNLABELED
+from session import Session
+
+TRACE_FIELDS = ('end', 'time', 'motion', 'label', 'actuated', 'latency_ms')
+
+
+def replay_config(window=100, hop_ms=25, max_batch=8, threshold=DEFAULT_THRESHOLD, block_ms=10, model=None,
+                  profile=None, normalize=False):
+    """Pipeline settings, same meaning as the config at the top of inference.py."""
+    return {
+        'window': int(window), 'hop_ms': hop_ms, 'max_batch': int(max_batch), 'threshold': threshold,
+        'block_ms': block_ms, 'model': None if model is None else str(model),
+        'profile': None if profile is None else str(profile), 'normalize': bool(normalize),
+    }
+
+
+def make_pipeline(config, sample_rate, n_channels, stats=None):
+    stats = Stats() if stats is None else stats
+    calibrator = AdaptiveCalibrator.from_profile(config['profile'], sample_rate, n_channels,
+                                                 threshold=config['threshold'])
+    runtime = None
+    if config['model']:
+        runtime = ClassifierRuntime(load_model(config['model']), sample_rate, n_channels, stats=stats)
+    return Pipeline(None, sample_rate, n_channels, window=config['window'], hop_ms=config['hop_ms'],
+                    max_batch=config['max_batch'], runtime=runtime, threshold=config['threshold'],
+                    calibrator=calibrator, normalize=config['normalize'], stats=stats)
+
+
+def replay_session(path, config, speed=0.0):
+    """
+    Decision trace for one session, a dict of TRACE_FIELDS arrays plus
+    'path', 'duration' (s of signal), 'wall' (s it took) and 'stats'.
+    """
+    session = Session(str(path))
+    try:
+        rate = session.sample_rate
+        stats = Stats()
+        pipeline = make_pipeline(config, rate, session.n_channels, stats)
+        block = max(1, round(rate * config['block_ms'] / 1000))
+        ends, motions, latency = [], [], []
+        start = time.perf_counter()
+        for pos in range(0, len(session), block):
+            samples = np.array(session.samples[pos:pos + block])
+            if speed > 0:
+                # The block is complete once its last sample would have arrived
+                delay = start + (pos + len(samples)) / rate / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            arrival = time.perf_counter()
+            block_ends, block_motions = pipeline.step(samples)
+            if len(block_ends):
+                ends.append(block_ends)
+                motions.append(np.asarray(block_motions))
+                latency.append(np.full(len(block_ends), (time.perf_counter() - arrival) * 1000))
+        wall = time.perf_counter() - start
+
+        ends = np.concatenate(ends) if ends else np.zeros(0, dtype=np.int64)
+        motions = np.concatenate(motions) if motions else np.zeros(0, dtype=np.int64)
+        # Same change detection as control_output(), starting from rest
+        previous = np.concatenate(([0], motions[:-1])) if len(motions) else motions
+        return {
+            'path': str(path),
+            'end': ends,
+            'time': ends / rate,
+            'motion': motions,
+            'label': np.asarray(session.labels[ends - 1], dtype=np.int64) if len(ends) else np.zeros(0, dtype=np.int64),
+            'actuated': motions != previous,
+            'latency_ms': np.concatenate(latency) if latency else np.zeros(0),
+            'duration': len(session) / rate,
+            'wall': wall,
+            'stats': stats.snapshot()['stages'],
+        }
+    finally:
+        session.close()
+
+
+def _truth(trace, config):
+    # The threshold only knows rest / active
+    return trace['label'] if config['model'] else (trace['label'] != 0).astype(np.int64)
+
+
+def _onsets(truth):
+    """Indices where a labelled activity starts (rest -> anything else)."""
+    active = truth != 0
+    return np.flatnonzero(active[1:] & ~active[:-1]) + 1
+
+
+def evaluate(trace, config):
+    """Scores for one trace (or several concatenated with merge_traces)."""
+    labelled = trace['label'] != UNLABELED
+    trace = {field: trace[field][labelled] for field in TRACE_FIELDS}
+    truth, motion = _truth(trace, config), trace['motion']
+    n = len(truth)
+    if n == 0:
+        return {'windows': 0}
+    classes = np.union1d(truth, motion)
+    index = {c: i for i, c in enumerate(classes)}
+    confusion = np.zeros((len(classes), len(classes)), dtype=np.int64)
+    np.add.at(confusion, ([index[c] for c in truth], [index[c] for c in motion]), 1)
+    support = confusion.sum(axis=1)
+    recall = np.diag(confusion)[support > 0] / support[support > 0]
+
+    # For each labelled onset, time until the first non-rest decision
+    # before the activity ends
+    delays, missed = [], 0
+    for start in _onsets(truth):
+        stop = start + np.argmax(truth[start:] == 0) if np.any(truth[start:] == 0) else n
+        hits = np.flatnonzero(motion[start:stop] != 0)
+        if len(hits):
+            delays.append((trace['time'][start + hits[0]] - trace['time'][start]) * 1000)
+        else:
+            missed += 1
+    latency = trace['latency_ms']
+    return {
+        'windows': int(n),
+        'accuracy': float(np.mean(truth == motion)),
+        'balanced_accuracy': float(np.mean(recall)),
+        'classes': classes.tolist(),
+        'confusion': confusion.tolist(),
+        'transitions': {'predicted': int(np.sum(trace['actuated'])),
+                        'labelled': int(np.sum(truth[1:] != truth[:-1]))},
+        'onsets': {'count': len(delays) + missed, 'missed': missed,
+                   'delay_p50_ms': float(np.median(delays)) if delays else None},
+        'latency_ms': {'p50': float(np.percentile(latency, 50)), 'p99': float(np.percentile(latency, 99)),
+                       'max': float(latency.max())},
+    }
+
+
+def merge_traces(traces):
+    """One trace from several, for archive-wide scores."""
+    merged = {field: np.concatenate([t[field] for t in traces]) for field in TRACE_FIELDS}
+    merged['duration'] = sum(t['duration'] for t in traces)
+    merged['wall'] = sum(t['wall'] for t in traces)
+    return merged
+
+
+def save_trace(path, trace):
+    np.savez(path, **{field: trace[field] for field in TRACE_FIELDS}, session=np.array(trace['path']))
+
+
+def _replay_job(job):
+    path, config, speed = job
+    try:
+        return path, replay_session(path, config, speed), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def replay_archive(paths, config, speed=0.0, jobs=None, verbose=True):
+    """{path: trace} for every session that replayed, in `paths` order."""
+    work = [(str(path), config, speed) for path in paths]
+    traces = {}
+
+    def collect(path, trace, error):
+        if error:
+            print(f"Failed {path}: {error}")
+            return
+        traces[path] = trace
+        if verbose:
+            scores = evaluate(trace, config)
+            scored = f"accuracy {scores['accuracy']:.3f}" if scores['windows'] else "no labelled windows"
+            print(f"{path}: {scores['windows']} windows, {scored}, "
+                  f"{trace['duration'] / max(trace['wall'], 1e-9):.0f}x real time")
+
+    if jobs == 1 or len(work) == 1:
+        for job in work:
+            collect(*_replay_job(job))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            for future in as_completed([pool.submit(_replay_job, job) for job in work]):
+                collect(*future.result())
+    return {path: traces[path] for path, _, _ in work if path in traces}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded sessions through the inference pipeline")
+    parser.add_argument('inputs', nargs='+', help="session files or folders to search")
+    parser.add_argument('--speed', type=float, default=0.0, help="times real time, 0 for as fast as possible")
+    parser.add_argument('--model', help="exported model (.npz), without one the envelope is thresholded")
+    parser.add_argument('--profile', help="calibration profile to start from (default: calibrate from the session)")
+    parser.add_argument('--normalize', action='store_true', help="scale the model's input by the calibrator gain")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="starting threshold before calibration")
+    parser.add_argument('--window', type=int, default=100, help="samples per window without a model")
+    parser.add_argument('--hop-ms', type=float, default=25)
+    parser.add_argument('--max-batch', type=int, default=8)
+    parser.add_argument('--block-ms', type=float, default=10, help="samples handed over at once, in ms")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help="worker processes (default: all cores, 1 when paced)")
+    parser.add_argument('--trace', metavar='DIR', help="write each session's decision trace here as .npz")
+    parser.add_argument('--out', help="write the scores to this JSON file")
+    args = parser.parse_args()
+
+    paths = find_sessions(args.inputs)
+    if not paths:
+        parser.error("no session files found")
+    config = replay_config(args.window, args.hop_ms, args.max_batch, args.threshold, args.block_ms,
+                           args.model, args.profile, args.normalize)
+    jobs = args.jobs or (1 if args.speed > 0 else None)
+    traces = replay_archive(paths, config, args.speed, jobs)
+
+    if args.trace:
+        os.makedirs(args.trace, exist_ok=True)
+        for path, trace in traces.items():
+            save_trace(os.path.join(args.trace, Path(path).stem + '_trace.npz'), trace)
+    report = {'config': config, 'sessions': {path: evaluate(trace, config) for path, trace in traces.items()}}
+    merged = merge_traces(list(traces.values())) if traces else None
+    overall = evaluate(merged, config) if merged is not None else {'windows': 0}
+    if merged is not None:
+        report['overall'] = overall
+    if overall['windows'] == 0:
+        # Legacy saves never had labels, there is nothing to score them against
+        print(f"{len(traces)} sessions, no labelled windows")
+    else:
+        print(f"{len(traces)} sessions, {overall['windows']} windows: accuracy {overall['accuracy']:.3f}, "
+              f"balanced {overall['balanced_accuracy']:.3f}, onset delay p50 {overall['onsets']['delay_p50_ms']} ms, "
+              f"latency p50/p99 {overall['latency_ms']['p50']:.2f}/{overall['latency_ms']['p99']:.2f} ms, "
+              f"{merged['duration']:.0f} s of signal in {merged['wall']:.1f} s")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=1)
+        print(f"Saved {args.out}")
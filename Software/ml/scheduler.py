@@ -0,0 +1,81 @@
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class InferenceScheduler:
+    """
+    Classify every `hop` samples over a `window`-sample window instead of on
+    every sample.
+
+    due() returns the end positions (sample counts) of the windows whose hop
+    has come up since the last call. If the loop fell behind there can be
+    several, they are handed back together so they can be classified in one
+    batched call. At most max_batch are kept, anything older is skipped and
+    counted.
+
+    wait() sleeps until the next hop is due, measured from when the previous
+    one was due, so time spent processing isn't added on top of the period.
+    """
+    def __init__(self, sample_rate, window, hop, max_batch=8):
+        self.sample_rate = sample_rate
+        self.window = window
+        self.hop = hop
+        self.max_batch = max_batch
+        self.period = hop / sample_rate
+
+        self.next_deadline = None
+        self.decisions = 0
+        self.skipped = 0
+        self.late = 0
+
+    @classmethod
+    def from_ms(cls, sample_rate, window_ms, hop_ms, max_batch=8):
+        window = max(1, round(sample_rate * window_ms / 1000))
+        hop = max(1, round(sample_rate * hop_ms / 1000))
+        return cls(sample_rate, window, hop, max_batch)
+
+    def buffer_capacity(self):
+        """Ring buffer size needed to still hold a full backlog of windows."""
+        return self.window + self.hop * self.max_batch
+
+    def due(self, ring):
+        """Ends of the windows that are due in `ring` (a RingBuffer), oldest first."""
+        if ring.count < ring.next_ready:
+            return np.zeros(0, dtype=np.int64)
+        pending = (ring.count - ring.next_ready) // self.hop + 1
+        ends = ring.next_ready + self.hop * np.arange(pending, dtype=np.int64)
+        ring.next_ready += pending * self.hop
+
+        # Windows that have already been overwritten can't be classified
+        oldest = ring.count - ring.capacity + self.window
+        ends = ends[ends >= oldest][-self.max_batch:]
+        self.skipped += pending - len(ends)
+        self.decisions += len(ends)
+        return ends
+
+    def windows(self, ring, ends):
+        """
+        (len(ends), window, n_channels) view of the windows ending at `ends`
+        in `ring`. Works for any ring fed in lockstep with the one passed to
+        due(), e.g. the envelope and the bandpassed signal.
+        """
+        first = int(ends[0]) - self.window
+        span = int(ends[-1]) - first
+        region = ring.latest(ring.count - first)[:span]
+        return sliding_window_view(region, self.window, axis=0)[::self.hop].transpose(0, 2, 1)
+
+    def wait(self):
+        now = time.perf_counter()
+        if self.next_deadline is None:
+            self.next_deadline = now
+        self.next_deadline += self.period
+        delay = self.next_deadline - now
+        if delay > 0:
+            time.sleep(delay)
+        elif -delay > self.period:
+            # More than a whole hop behind, due() will batch up the backlog,
+            # don't try to win the time back by skipping sleeps forever
+            self.late += 1
+            self.next_deadline = now
@@ -0,0 +1,6 @@
+"""The modules import each other by name, like the scripts do when run from their folder."""
+import sys
+from pathlib import Path
+
+SOFTWARE = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(SOFTWARE / 'data_collection'), str(SOFTWARE / 'ml')]
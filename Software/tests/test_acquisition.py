@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+import pytest
+
+from acquisition import RUNNING, AcquisitionProcess, RingReader, ring_running
+
+
+@pytest.fixture
+def name():
+    return f'emg_test_{os.getpid()}'
+
+
+def test_running_ring_is_not_reclaimed(name):
+    owner = AcquisitionProcess('synthetic://', n_channels=2, capacity=64, name=name)
+    try:
+        owner.header[RUNNING] = 1
+        assert ring_running(name)
+        with pytest.raises(FileExistsError):
+            AcquisitionProcess('synthetic://', n_channels=2, capacity=64, name=name)
+        # Still the same block, still readable
+        reader = RingReader(name)
+        assert reader.capacity == 64
+        reader.close()
+    finally:
+        owner.header[RUNNING] = -1
+        owner.stop()
+
+
+def test_stale_ring_is_reclaimed(name):
+    old = AcquisitionProcess('synthetic://', n_channels=1, capacity=32, name=name)
+    old.header[RUNNING] = -1
+    # Left behind as if the owner died without unlinking it
+    old.shm.close()
+    new = AcquisitionProcess('synthetic://', n_channels=3, capacity=16, name=name)
+    try:
+        assert int(new.header[RUNNING]) == 0
+        np.testing.assert_array_equal(new.reader().data.shape, (32, 3))
+    finally:
+        new.stop()
@@ -0,0 +1,98 @@
+import numpy as np
+
+from alignment import NodeClock, StreamAligner, Unwrapper
+from protocol import SEQ_MODULO, TIMESTAMP_MODULO
+
+RATE = 1000
+
+
+def test_unwrap_across_calls():
+    unwrapper = Unwrapper(SEQ_MODULO)
+    counts = np.arange(65000, 66000 + SEQ_MODULO) % SEQ_MODULO
+    out = np.concatenate([unwrapper.unwrap(block) for block in np.array_split(counts, 7)])
+    np.testing.assert_array_equal(out, np.arange(65000, 66000 + SEQ_MODULO))
+    # A small step back is reordering, not another lap
+    assert unwrapper.unwrap([counts[-1] - 3])[0] == out[-1] - 3
+
+
+def test_clock_fit_finds_offset_and_drift():
+    rng = np.random.default_rng(12)
+    node_time = np.arange(0, 60, 0.01)
+    skew = -50e-6
+    # Arrivals are late by a random radio delay, never early
+    host_time = 1000.0 + (1 + skew) * node_time + rng.exponential(0.003, len(node_time))
+    clock = NodeClock(interval=1.0)
+    for block in np.array_split(np.arange(len(node_time)), 60):
+        clock.update(node_time[block], host_time[block])
+    assert abs(clock.drift_ppm - skew * 1e6) < 5
+    expected = 1000.0 + (1 + skew) * node_time[-1]
+    assert abs(clock.to_host(node_time[-1]) - expected) < 0.001
+
+
+def node_blocks(signal, start_us, skew=0.0, block=20):
+    """(node timestamps as sent, host arrival) per block of a node sampling at RATE."""
+    n = len(signal)
+    node_us = (start_us + np.arange(n) * 1e6 / RATE * (1 + skew)).astype(np.int64) % TIMESTAMP_MODULO
+    true_time = np.arange(n) / RATE
+    for i in range(0, n, block):
+        # Each block arrives 2 ms after its last sample was taken
+        yield signal[i:i + block], node_us[i:i + block].astype(np.uint32), true_time[min(i + block, n) - 1] + 0.002
+
+
+def test_two_nodes_on_one_timeline():
+    t = np.arange(4 * RATE) / RATE
+    a = np.column_stack((np.sin(2 * np.pi * 3 * t), np.cos(2 * np.pi * 3 * t)))
+    b = np.sin(2 * np.pi * 3 * t)[:, None] * 2
+    aligner = StreamAligner(RATE, {1: 2, 2: 1})
+    # Node 2's clock starts near the wrap and runs 100 ppm fast
+    blocks = zip(node_blocks(a, 5_000_000), node_blocks(b, TIMESTAMP_MODULO - 1_000_000, skew=100e-6))
+    times, out = [], []
+    for (sa, ta, ha), (sb, tb, hb) in blocks:
+        aligner.push(1, sa, ha, timestamps=ta)
+        aligner.push(2, sb, hb, timestamps=tb)
+        grid, block = aligner.pull()
+        times.append(grid)
+        out.append(block)
+    times, out = np.concatenate(times), np.concatenate(out)
+
+    assert out.shape[1] == 3
+    np.testing.assert_allclose(np.diff(times), 1 / RATE, rtol=1e-6)
+    assert aligner.gaps == 0
+    # Same instant on every row: node 2 is twice node 1's first channel
+    settled = len(out) // 2
+    np.testing.assert_allclose(out[settled:, 2], 2 * out[settled:, 0], atol=0.05)
+    assert abs(aligner.relative_drift_ppm() - 100) < 20
+
+
+def test_sequence_numbers_as_the_clock():
+    aligner = StreamAligner(RATE, {1: 1, 2: 1})
+    ramp = np.arange(500, dtype=np.float64)
+    for i in range(0, 500, 50):
+        seq = (np.arange(i, i + 50) + 65500) % SEQ_MODULO
+        host = (i + 50) / RATE
+        aligner.push(1, ramp[i:i + 50], host, seq=seq)
+        aligner.push(2, -ramp[i:i + 50], host, seq=seq)
+    _, out = aligner.pull()
+    assert len(out) > 400
+    np.testing.assert_allclose(out[:, 0], -out[:, 1])
+    np.testing.assert_allclose(np.diff(out[:, 0]), 1.0)
+
+
+def test_silent_node_does_not_hold_the_others_back():
+    aligner = StreamAligner(RATE, {1: 1, 2: 1}, max_gap=0.05, max_backlog=0.5)
+    signal = np.ones((2 * RATE, 1))
+    total = 0
+    for samples, stamps, host in node_blocks(signal, 0):
+        aligner.push(1, samples, host, timestamps=stamps)
+        _, out = aligner.pull()
+        total += len(out)
+        if len(out):
+            # Never heard from, node 2 reads 0
+            np.testing.assert_array_equal(out[:, 1], 0)
+    assert total > 1.9 * RATE
+    assert aligner.gaps == 1
+    # The backlog of a node nobody pulls from stays bounded
+    stalled = StreamAligner(RATE, {1: 1, 2: 1}, max_gap=10.0, max_backlog=0.5)
+    for samples, stamps, host in node_blocks(signal, 0):
+        stalled.push(1, samples, host, timestamps=stamps)
+    assert len(stalled.nodes[1].times) <= 500
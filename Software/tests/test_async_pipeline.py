@@ -0,0 +1,83 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from async_pipeline import BLOCK, DROP_OLDEST, BoundedQueue, Pipeline
+from recorder import SessionRecorder
+from session import Session
+from synthetic import SyntheticEMG
+
+
+def test_block_waits_for_room():
+    async def main():
+        queue = BoundedQueue(2, BLOCK)
+        await queue.put(1)
+        await queue.put(2)
+        put = asyncio.create_task(queue.put(3))
+        await asyncio.sleep(0.01)
+        assert not put.done()
+        assert await queue.get() == 1
+        await put
+        return [await queue.get(), await queue.get()], queue.dropped
+
+    assert asyncio.run(main()) == ([2, 3], 0)
+
+
+def test_drop_oldest_keeps_the_newest():
+    async def main():
+        queue = BoundedQueue(2, DROP_OLDEST)
+        for item in range(5):
+            await queue.put(item)
+        return [await queue.get(), await queue.get()], queue.dropped
+
+    assert asyncio.run(main()) == ([3, 4], 3)
+
+
+def test_end_of_stream_is_never_dropped():
+    async def main():
+        queue = BoundedQueue(1, DROP_OLDEST)
+        await queue.put('last')
+        end = asyncio.create_task(queue.put(None))
+        await asyncio.sleep(0.01)
+        assert not end.done()
+        assert await queue.get() == 'last'
+        await end
+        return await queue.get(), queue.dropped
+
+    assert asyncio.run(main()) == (None, 0)
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        BoundedQueue(1, 'newest')
+
+
+def test_run_delivers_the_last_decision_and_every_block(tmp_path):
+    rate = 1000
+    samples, _ = SyntheticEMG(rate, 2, seed=3).generate(4000)
+    blocks = np.array_split(samples, 100)
+
+    # What step() decides for the same blocks, without the queues
+    offline = Pipeline(None, rate, 2)
+    motions = [m for block in blocks for m in offline.step(block)[1]]
+
+    pending = iter(blocks)
+
+    def source():
+        block = next(pending, None)
+        return None if block is None else (block, None)
+
+    actuated = []
+    path = str(tmp_path / 'run.emg')
+    with SessionRecorder(path, rate, 2) as recorder:
+        pipeline = Pipeline(source, rate, 2,
+                            actuate=actuated.append, recorder=recorder,
+                            publish=lambda snapshot: None, queue_size=4, record_queue_size=2)
+        asyncio.run(pipeline.run())
+
+    assert pipeline.motion == motions[-1]
+    assert actuated[-1] == motions[-1]
+    session = Session(path)
+    np.testing.assert_array_equal(session.samples, samples.astype(session.samples.dtype))
+    session.close()
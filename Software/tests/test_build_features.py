@@ -0,0 +1,45 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from build_features import build, feature_params, stack
+from features import extract_features
+from filters import StreamingFilter
+from recorder import SessionRecorder
+from synthetic import SyntheticEMG
+
+
+def record(path, seed, n=2000):
+    samples, labels = SyntheticEMG(1000, 2, seed=seed).generate(n)
+    with SessionRecorder(str(path), 1000, 2) as rec:
+        rec.write(samples, timestamps=np.arange(n) / 1000, labels=labels)
+    return samples.astype(np.float32).astype(np.float64), labels
+
+
+def test_build_matches_extract_features_and_caches(tmp_path, capsys):
+    samples, labels = record(tmp_path / 'a.emg', 1)
+    record(tmp_path / 'b.emg', 2, n=1500)
+    paths = [str(tmp_path / 'a.emg'), str(tmp_path / 'b.emg')]
+    params = feature_params(window=200, hop=50)
+    cache = tmp_path / 'cache'
+
+    results = build(paths, params, cache, jobs=1)
+    first = results[0]
+    bandpassed = StreamingFilter(1000, 2).bandpass(samples)
+    windows = sliding_window_view(bandpassed, 200, axis=0)[::50].transpose(0, 2, 1)
+    expected, names = extract_features(windows, 1000)
+    assert first['names'] == names
+    np.testing.assert_allclose(first['X'], expected, rtol=1e-9, atol=1e-9)
+    np.testing.assert_array_equal(first['y'], labels[first['starts'] + 199])
+
+    dataset = stack(results)
+    assert dataset['X'].shape == (len(first['X']) + len(results[1]['X']), len(names))
+    np.testing.assert_array_equal(np.unique(dataset['groups']), [0, 1])
+
+    capsys.readouterr()
+    again = build(paths, params, cache, jobs=1)
+    assert "2 cached, 0 computed" in capsys.readouterr().out
+    np.testing.assert_array_equal(again[0]['X'], first['X'])
+
+    # New parameters are new entries, one channel only
+    one = build(paths[:1], feature_params(window=200, hop=50, channels=['ch2']), cache, jobs=1)[0]
+    np.testing.assert_allclose(one['X'], expected[:, [n.endswith('_ch2') for n in names]], rtol=1e-9, atol=1e-9)
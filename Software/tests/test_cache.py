@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+
+from cache import DiskCache, filtered_session, make_key
+from filters import StreamingFilter
+from recorder import SessionRecorder
+from synthetic import SyntheticEMG
+
+
+def test_get_or_compute_only_computes_once(tmp_path):
+    cache = DiskCache(tmp_path)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return np.arange(10.0)
+
+    key = make_key('test', 1, {'a': 2})
+    first = cache.get_or_compute(key, compute)
+    second = cache.get_or_compute(key, compute)
+    np.testing.assert_array_equal(first, second)
+    assert len(calls) == 1
+    assert isinstance(second, np.memmap)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert key != make_key('test', 1, {'a': 3})
+
+
+def test_least_recently_used_entries_go_first(tmp_path):
+    block = np.zeros(1000)
+    size = block.nbytes + 128
+    cache = DiskCache(tmp_path, max_bytes=int(2.5 * size))
+    cache.put('a', block)
+    cache.put('b', block)
+    os.utime(cache.path('a'), (1, 1))
+    os.utime(cache.path('b'), (2, 2))
+    # A hit makes 'a' the most recent
+    assert cache.get('a') is not None
+    cache.put('c', block)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.size() <= cache.max_bytes
+
+
+def test_filtered_session(tmp_path):
+    samples, _ = SyntheticEMG(1000, 2, seed=8).generate(3000)
+    path = str(tmp_path / 'run.emg')
+    with SessionRecorder(path, 1000, 2) as rec:
+        rec.write(samples, timestamps=np.arange(len(samples)) / 1000)
+    cache = DiskCache(tmp_path / 'cache')
+
+    bandpassed, envelope = filtered_session(path, cache)
+    expected = StreamingFilter(1000, 2).process_all(samples.astype(np.float32).astype(np.float64))
+    np.testing.assert_allclose(bandpassed, expected[0])
+    np.testing.assert_allclose(envelope, expected[1])
+    filtered_session(path, cache)
+    assert cache.hits == 1
+
+    # Other settings are another entry
+    filtered_session(path, cache, order=2)
+    assert cache.misses == 2
+    assert len(cache.entries()) == 2
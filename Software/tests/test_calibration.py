@@ -0,0 +1,98 @@
+import json
+
+import numpy as np
+
+from calibration import AdaptiveCalibrator
+
+RATE = 100
+
+
+def envelope(seconds, level, rng, n_channels=2):
+    return level + rng.normal(0, 1, (int(seconds * RATE), n_channels))
+
+
+def calibrated(rng, active_level=None):
+    calibrator = AdaptiveCalibrator(RATE, 2, threshold=1000)
+    calibrator.update(envelope(5, 10, rng))
+    if active_level is not None:
+        for _ in range(3):
+            calibrator.update(envelope(1, active_level, rng))
+            calibrator.update(envelope(1, 10, rng))
+    assert calibrator.ready()
+    return calibrator
+
+
+def _reject(constant):
+    raise AssertionError(f"{constant} in profile")
+
+
+def strict_json(path):
+    # json.load takes NaN, a profile must be plain JSON
+    with open(path) as f:
+        return json.loads(f.read(), parse_constant=_reject)
+
+
+def test_profile_round_trip(tmp_path):
+    rng = np.random.default_rng(5)
+    calibrator = calibrated(rng, active_level=100)
+    path = tmp_path / 'profiles' / 'alice.json'
+    calibrator.save_profile(path, user='alice')
+    profile = strict_json(path)
+    assert profile['user'] == 'alice'
+    np.testing.assert_allclose(profile['reference'], 100, rtol=0.05)
+
+    restored = AdaptiveCalibrator.from_profile(path, RATE, 2, threshold=1000)
+    assert restored.ready()
+    np.testing.assert_allclose(restored.threshold, calibrator.threshold)
+    np.testing.assert_allclose(restored.gain(), 1.0, rtol=1e-6)
+    np.testing.assert_allclose(restored.reference, profile['reference'])
+    # Below the gate is rest from the first block on
+    gate = np.asarray(profile['rest']['level']) + restored.min_sigma * np.asarray(profile['rest']['sigma'])
+    np.testing.assert_allclose(restored._gate, gate)
+
+    # The signal comes back at half the amplitude, gain makes up for it
+    for _ in range(20):
+        restored.update(envelope(1, 10, rng))
+        restored.update(envelope(1, 55, rng))
+    np.testing.assert_allclose(restored.gain(), 2.0, rtol=0.1)
+
+
+def test_profile_without_activity_has_no_reference(tmp_path):
+    rng = np.random.default_rng(6)
+    calibrator = calibrated(rng)
+    path = tmp_path / 'rest_only.json'
+    calibrator.save_profile(path)
+    assert strict_json(path)['reference'] == [None, None]
+
+    restored = AdaptiveCalibrator.from_profile(path, RATE, 2, threshold=1000)
+    assert restored.reference is None
+    for _ in range(5):
+        restored.update(envelope(1, 100, rng))
+        restored.update(envelope(1, 10, rng))
+    np.testing.assert_array_equal(restored.gain(), 1.0)
+
+
+def test_zero_reference_is_ignored(tmp_path):
+    # What profiles saved before any activity used to hold
+    rng = np.random.default_rng(7)
+    profile = calibrated(rng, active_level=100).profile()
+    profile['reference'] = [0.0, 80.0]
+    restored = AdaptiveCalibrator(RATE, 2)
+    restored.seed(profile)
+    assert np.isnan(restored.reference[0])
+    for _ in range(5):
+        restored.update(envelope(1, 100, rng))
+        restored.update(envelope(1, 10, rng))
+    gain = restored.gain()
+    assert gain[0] == 1.0
+    assert gain[1] < 1.0
+
+    profile['reference'] = [0.0, 0.0]
+    restored.seed(profile)
+    assert restored.reference is None
+
+
+def test_missing_profile_starts_fresh(tmp_path):
+    calibrator = AdaptiveCalibrator.from_profile(tmp_path / 'nobody.json', RATE, 2)
+    assert not calibrator.ready()
+    assert calibrator.reference is None
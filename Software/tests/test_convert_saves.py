@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+import pytest
+
+from convert_saves import build_index, convert, convert_folder, detect_layout, guess_subject
+from recorder import UNLABELED, SessionRecorder
+from session import Session
+
+
+def write_lines(path, lines):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+@pytest.fixture
+def saves(tmp_path):
+    folder = tmp_path / 'saves'
+    # main.py, 3graphGUI.py and graphGUI.py layouts
+    write_lines(str(folder / '2024-10-06_02-13-34_Trail_0.csv'), ['12.0; 0', '15.0; 0', '900.0; 1', '950.0; 1'])
+    write_lines(str(folder / '2024-10-07_10-00-00.csv'), ['1,2,3', '4,5,6', '7,8,9'])
+    write_lines(str(folder / 'alice.csv'), ['10', '20', '30', '40', '50'])
+    write_lines(str(folder / 'bob' / 'recorded_data.csv'), ['1', '2'])
+    return str(folder)
+
+
+def test_detect_layout(saves):
+    assert detect_layout(os.path.join(saves, '2024-10-06_02-13-34_Trail_0.csv')) == ('main', ';')
+    assert detect_layout(os.path.join(saves, '2024-10-07_10-00-00.csv')) == ('multichannel', ',')
+    assert detect_layout(os.path.join(saves, 'alice.csv')) == ('single', None)
+
+
+def test_guess_subject():
+    assert guess_subject(os.path.join('bob', 'recorded_data.csv')) == 'bob'
+    assert guess_subject('alice.csv') == 'alice'
+    assert guess_subject('2024-10-06_02-13-34_Trail_0.csv') is None
+    assert guess_subject('recorded_data.csv') is None
+
+
+def test_convert_keeps_labels_only_where_there_were_some(saves, tmp_path):
+    out = str(tmp_path / 'main.emg')
+    convert(os.path.join(saves, '2024-10-06_02-13-34_Trail_0.csv'), out, 100)
+    session = Session(out)
+    np.testing.assert_array_equal(session.samples[:, 0], [12, 15, 900, 950])
+    np.testing.assert_array_equal(session.labels, [0, 0, 1, 1])
+    assert session.meta['labelled']
+    assert session.label_names[1] == 'contract'
+    np.testing.assert_allclose(np.diff(session.timestamps), 0.01, rtol=1e-5)
+    session.close()
+
+    out = str(tmp_path / 'multi.emg')
+    convert(os.path.join(saves, '2024-10-07_10-00-00.csv'), out, 100)
+    session = Session(out)
+    assert session.n_channels == 3
+    np.testing.assert_array_equal(session.slice(1, 2), [[4, 5, 6]])
+    # Not a session of rest
+    np.testing.assert_array_equal(session.labels, UNLABELED)
+    assert not session.meta['labelled']
+    assert session.label_names[UNLABELED] == 'unlabeled'
+    session.close()
+
+
+def test_convert_folder_and_index(saves):
+    convert_folder(saves, jobs=1)
+    entries = {os.path.relpath(e['path'], saves): e for e in build_index(saves, jobs=1)}
+    assert set(entries) == {'2024-10-06_02-13-34_Trail_0.emg', '2024-10-07_10-00-00.emg', 'alice.emg',
+                            os.path.join('bob', 'recorded_data.emg')}
+    assert entries['alice.emg']['subject'] == 'alice'
+    assert not entries['alice.emg']['labelled']
+    assert entries['alice.emg']['n_samples'] == 5
+    assert entries[os.path.join('bob', 'recorded_data.emg')]['subject'] == 'bob'
+    main = entries['2024-10-06_02-13-34_Trail_0.emg']
+    assert main['subject'] is None
+    assert main['label_spans'] == [[0, 2, 'relax'], [2, 4, 'contract']]
+    assert main['date'] == '2024-10-06T02:13:34'
+
+    # Unchanged files are taken from the index, not reopened
+    again = build_index(saves, jobs=1)
+    assert [e['path'] for e in again] == sorted(e['path'] for e in entries.values())
+
+
+def test_recordings_without_cues_are_unlabeled(tmp_path):
+    path = str(tmp_path / 'plain.emg')
+    with SessionRecorder(path, 100, 1) as rec:
+        rec.write(np.arange(10), timestamps=np.arange(10) * 0.01)
+        rec.set_label(0, 'rest', at=0.1)
+        rec.write(np.arange(10), timestamps=0.1 + np.arange(10) * 0.01)
+    session = Session(path)
+    np.testing.assert_array_equal(session.labels, [UNLABELED] * 10 + [0] * 10)
+    assert session.label_names == {UNLABELED: 'unlabeled', 0: 'rest'}
+    session.close()
+
+    entry = build_index(str(tmp_path), jobs=1)[0]
+    assert entry['labelled']
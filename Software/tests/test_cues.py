@@ -0,0 +1,52 @@
+from cues import DEFAULT_MOTIONS, MODES, REST, CueEngine, Phase, cue_text, cycle_protocol, labels_for
+
+
+def test_every_motion_has_its_own_label():
+    motions = [m for pair in MODES.values() for m in pair] + list(DEFAULT_MOTIONS)
+    labels = [label for _, label, _ in motions]
+    assert len(set(labels)) == len(labels)
+    assert REST not in labels
+
+
+def test_cycle_protocol():
+    phases = cycle_protocol("Supination/Pronation", 2, num_cycles=2, num_sets=2, rest_time=5)
+    assert [p.name for p in phases] == ['lead_in'] + ['supinate', 'pronate'] * 2 + ['rest'] + \
+        ['supinate', 'pronate'] * 2
+    assert labels_for(phases) == {REST: 'rest', 3: 'supinate', 4: 'pronate'}
+    # Unknown modes fall back to the default motions
+    fallback = cycle_protocol("Something else", 1, 1, 1, 0, lead_in=0)
+    assert labels_for(fallback) == {5: 'action_1', 6: 'action_2'}
+
+
+def test_events_carry_their_scheduled_time():
+    engine = CueEngine([Phase('open', 1, 2, "Open {}"), Phase('close', 2, 2, "Close {}")])
+    seen = []
+    engine.listeners.append(seen.append)
+    events = engine.start(now=100.0)
+    assert [(e.t, e.kind, e.phase.name) for e in events] == [(100.0, 'phase', 'open')]
+    assert cue_text(events[0]) == "Open 2"
+
+    # A late poll still reports every change at the time it was due
+    events = engine.poll(now=103.2)
+    assert [(e.t, e.kind) for e in events] == [(102.0, 'phase'), (103.0, 'tick')]
+    assert engine.label == 2
+    assert cue_text(events[-1]) == "Close 1"
+
+    events = engine.poll(now=104.5)
+    assert [(e.t, e.kind) for e in events] == [(104.0, 'done')]
+    assert not engine.running
+    assert engine.label == REST
+    assert seen[-1].kind == 'done'
+    assert engine.poll(now=110) == []
+
+
+def test_loop_until_stopped():
+    engine = CueEngine([Phase('relax', 0, 1, "{}"), Phase('contract', 1, 1, "{}")],
+                       lead_in=Phase('relax', 0, 3, "Begin in {}"), loop=True)
+    engine.start(now=0.0)
+    events = engine.poll(now=7.5)
+    phases = [(e.t, e.phase.name) for e in events if e.kind == 'phase']
+    assert phases == [(3.0, 'relax'), (4.0, 'contract'), (5.0, 'relax'), (6.0, 'contract'), (7.0, 'relax')]
+    stopped = engine.stop(now=7.6)
+    assert stopped[0].kind == 'stopped'
+    assert engine.stop() == []
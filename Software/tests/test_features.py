@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from features import TIME_FEATURES, RunningFeatures, extract_features
+from synthetic import SyntheticEMG
+
+THRESHOLDS = {'zc_threshold': 5.0, 'ssc_threshold': 10.0, 'wamp_threshold': 20.0}
+
+
+@pytest.mark.parametrize('thresholds', [{}, THRESHOLDS])
+def test_running_features_match_extract_features(thresholds):
+    samples, _ = SyntheticEMG(1000, 3, seed=3).generate(3000)
+    window = 128
+    running = RunningFeatures(window, 3, **thresholds)
+    rng = np.random.default_rng(3)
+    pos = 0
+    # Blocks smaller and larger than the window, and across several laps
+    while pos < len(samples):
+        size = int(rng.choice([1, 3, 17, 64, 127, 128, 300]))
+        got = running.update(samples[pos:pos + size])
+        pos = min(pos + size, len(samples))
+        if pos < 2:
+            continue
+        matrix, _ = extract_features(samples[max(0, pos - window):pos], 1000, TIME_FEATURES, **thresholds)
+        np.testing.assert_allclose(got, matrix.reshape(len(TIME_FEATURES), 3), rtol=1e-9, atol=1e-6)
+
+
+def test_extract_features_batch_matches_single_windows():
+    samples, _ = SyntheticEMG(1000, 2, seed=4).generate(1000)
+    windows = np.lib.stride_tricks.sliding_window_view(samples, 200, axis=0)[::50].transpose(0, 2, 1)
+    matrix, names = extract_features(windows, 1000)
+    assert matrix.shape == (len(windows), len(names))
+    for i, window in enumerate(windows):
+        single, _ = extract_features(window, 1000)
+        np.testing.assert_allclose(matrix[i], single[0])
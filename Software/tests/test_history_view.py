@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('pyqtgraph')
+import history_view
+from history_view import MinMaxPyramid
+
+
+def assert_same_levels(a, b):
+    assert len(a.levels) == len(b.levels)
+    for (mins_a, maxs_a), (mins_b, maxs_b) in zip(a.levels, b.levels):
+        np.testing.assert_array_equal(mins_a, mins_b)
+        np.testing.assert_array_equal(maxs_a, maxs_b)
+
+
+def test_levels_hold_block_min_max():
+    rng = np.random.default_rng(9)
+    samples = rng.normal(size=(1000, 2)).astype(np.float32)
+    pyramid = MinMaxPyramid(samples, factor=4)
+    for level, (mins, maxs) in enumerate(pyramid.levels):
+        size = pyramid.block_size(level)
+        assert len(mins) == -(-1000 // size)
+        for i in (0, len(mins) - 1):
+            block = samples[i * size:(i + 1) * size]
+            np.testing.assert_array_equal(mins[i], block.min(axis=0))
+            np.testing.assert_array_equal(maxs[i], block.max(axis=0))
+    assert len(pyramid.levels[-1][0]) == 1
+
+
+def test_extend_matches_a_fresh_build(monkeypatch):
+    # Small chunks so the chunked first level is exercised too
+    monkeypatch.setattr(history_view, 'BUILD_CHUNK', 64)
+    rng = np.random.default_rng(10)
+    samples = rng.normal(size=(5000, 3)).astype(np.float32)
+    pyramid = MinMaxPyramid(samples[:0], factor=8)
+    n = 0
+    for step in (1, 7, 8, 63, 64, 500, 1, 2000, 1357):
+        n += step
+        pyramid.extend(samples[:n])
+        assert_same_levels(pyramid, MinMaxPyramid(samples[:n], factor=8))
+        assert pyramid.n_samples == n
+    with pytest.raises(ValueError):
+        pyramid.extend(samples[:10])
+
+
+def test_query_keeps_spikes():
+    samples = np.zeros((100000, 1), dtype=np.float32)
+    samples[12345] = 50
+    samples[77777] = -20
+    pyramid = MinMaxPyramid(samples)
+    x, y = pyramid.query(0, len(samples), 800)
+    assert len(x) <= 2 * 800 * 8
+    assert y.max() == 50 and y.min() == -20
+    # Zoomed in far enough the raw samples come back
+    x, y = pyramid.query(12340, 12350, 800)
+    np.testing.assert_array_equal(x, np.arange(12340, 12350))
+    np.testing.assert_array_equal(y[:, 0], samples[12340:12350, 0])
@@ -0,0 +1,36 @@
+import threading
+
+from instrumentation import Stats
+
+
+def test_reset_starts_a_new_interval():
+    stats = Stats()
+    stats.count('samples', 100)
+    stats.set('bad_frames', 3)
+    with stats.time('filter'):
+        pass
+    stats.reset()
+    stats.count('samples', 7)
+    snapshot = stats.snapshot()
+    assert snapshot['counters'] == {'samples': 7}
+    # Gauges are totals the producer keeps, they stay until set again
+    assert snapshot['gauges'] == {'bad_frames': 3}
+    assert snapshot['stages']['filter']['count'] == 0
+
+
+def test_shared_between_threads():
+    stats = Stats()
+
+    def work():
+        for _ in range(2000):
+            stats.record('read', 1e-4)
+            stats.count('samples')
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    snapshot = stats.snapshot()
+    assert snapshot['counters']['samples'] == 8000
+    assert snapshot['stages']['read']['count'] == 8000
@@ -0,0 +1,70 @@
+import numpy as np
+
+from protocol import FrameDecoder, SYNC, encode_frames
+from synthetic import SyntheticEMG, corrupt_bytes
+
+
+def feed_in_chunks(decoder, data, rng):
+    samples, seqs = [], []
+    pos = 0
+    while pos < len(data):
+        step = int(rng.integers(1, 200))
+        block, seq = decoder.feed(data[pos:pos + step])
+        samples.append(block)
+        seqs.append(seq)
+        pos += step
+    return np.concatenate(samples), np.concatenate(seqs)
+
+
+def test_round_trip_any_chunking():
+    rng = np.random.default_rng(1)
+    source = SyntheticEMG(1000, 4, seed=1)
+    expected = []
+    data = b''
+    for _ in range(5):
+        samples, _ = source.generate(500)
+        data += encode_frames(np.round(samples), seq_start=len(expected) * 500)
+        expected.append(np.round(samples))
+    expected = np.concatenate(expected)
+
+    decoder = FrameDecoder(4)
+    samples, seq = feed_in_chunks(decoder, data, rng)
+    np.testing.assert_array_equal(samples, expected)
+    np.testing.assert_array_equal(seq, np.arange(len(expected)) % 65536)
+    assert decoder.frames == len(expected)
+    assert decoder.bad_frames == 0
+    assert decoder.seq_gaps == 0
+    assert decoder.skipped_bytes == 0
+
+
+def test_sync_pattern_in_payload_is_not_a_bad_frame():
+    # Every payload carries the sync bytes, the candidates inside accepted
+    # frames are just data
+    value = SYNC[0] | (SYNC[1] << 8)
+    samples = np.full((1000, 2), value)
+    decoder = FrameDecoder(2)
+    decoded, _ = decoder.feed(encode_frames(samples))
+    np.testing.assert_array_equal(decoded, samples)
+    assert decoder.bad_frames == 0
+
+
+def test_resync_after_corruption():
+    source = SyntheticEMG(1000, 4, seed=2)
+    clean = source.frames(5000)
+    rng = np.random.default_rng(2)
+    damaged = corrupt_bytes(clean, 0.001, rng)
+
+    decoder = FrameDecoder(4)
+    samples, seq = feed_in_chunks(decoder, damaged, rng)
+    # Roughly one frame in 50 is hit, the rest must come through intact
+    assert 0.9 * 5000 < len(samples) < 5000
+    assert decoder.bad_frames > 0
+    assert decoder.skipped_bytes > 0
+    assert decoder.seq_gaps > 0
+
+    # A damaged frame can still pass the checksum now and then, but almost
+    # every sample must land back where it was sent
+    reference, _ = FrameDecoder(4).feed(clean)
+    known = seq < len(reference)
+    matches = np.all(samples[known] == reference[seq[known]], axis=1)
+    assert matches.mean() > 0.99
@@ -0,0 +1,74 @@
+import os
+
+import numpy as np
+
+from recorder import HEADER_SIZE, SessionRecorder, read_header, record_dtype, recover_session
+
+
+def test_round_trip_in_chunks(tmp_path):
+    path = str(tmp_path / 'run.emg')
+    samples = np.arange(3000, dtype=np.float32).reshape(-1, 3)
+    with SessionRecorder(path, 500, ['a', 'b', 'c'], labels={0: 'rest'}, chunk_size=64,
+                         metadata={'subject': 'x'}) as rec:
+        for block in np.array_split(samples, 13):
+            rec.write(block, timestamps=np.zeros(len(block)), labels=0)
+        # Whole chunks are already on disk before close()
+        assert rec.n_samples == 960
+
+    with open(path, 'rb') as f:
+        meta = read_header(f)
+    assert meta['n_samples'] == 1000 and meta['closed']
+    assert meta['channels'] == ['a', 'b', 'c'] and meta['subject'] == 'x'
+    records = np.fromfile(path, dtype=record_dtype(3), offset=HEADER_SIZE)
+    np.testing.assert_array_equal(records['x'], samples)
+    np.testing.assert_array_equal(records['label'], 0)
+
+
+def test_labels_follow_sample_time(tmp_path):
+    path = str(tmp_path / 'cued.emg')
+    with SessionRecorder(path, 100, 1) as rec:
+        # Out of order, each one counts from its own `at`
+        rec.set_label(2, 'close', at=2.0)
+        rec.set_label(1, 'open', at=1.0)
+        rec.set_label(0, 'rest', at=0.5)
+        rec.write(np.zeros(300), timestamps=np.arange(300) / 100)
+    records = np.fromfile(path, dtype=record_dtype(1), offset=HEADER_SIZE)
+    labels = records['label']
+    assert (labels[:50] == -1).all() and (labels[50:100] == 0).all()
+    assert (labels[100:200] == 1).all() and (labels[200:] == 2).all()
+
+
+def test_late_label_relabels_unflushed_samples(tmp_path):
+    path = str(tmp_path / 'late.emg')
+    with SessionRecorder(path, 100, 1, flush_interval=60) as rec:
+        rec.set_label(1, 'open', at=1.5)
+        rec.write(np.zeros(300), timestamps=np.arange(300) / 100)
+        # The cue timer fired after the samples were already written
+        rec.set_label(0, 'rest', at=0.5)
+    labels = np.fromfile(path, dtype=record_dtype(1), offset=HEADER_SIZE)['label']
+    assert (labels[:50] == -1).all() and (labels[50:150] == 0).all()
+    assert (labels[150:] == 1).all()
+
+
+def test_writes_after_close_are_ignored(tmp_path):
+    rec = SessionRecorder(str(tmp_path / 'x.emg'), 100, 1)
+    rec.write([1.0, 2.0])
+    rec.close()
+    rec.write([3.0])
+    rec.close()
+    assert rec.n_samples == 2
+
+
+def test_recover_after_crash(tmp_path):
+    path = str(tmp_path / 'crashed.emg')
+    rec = SessionRecorder(path, 100, 2, flush_interval=0)
+    rec.write(np.ones((10, 2)))
+    rec.flush()
+    # Half a record written when the process died, header never updated
+    with open(path, 'ab') as f:
+        f.write(b'\0' * 7)
+    rec.file.close()
+
+    meta = recover_session(path)
+    assert meta['n_samples'] == 10 and meta['closed']
+    assert os.path.getsize(path) == HEADER_SIZE + 10 * record_dtype(2).itemsize
@@ -0,0 +1,58 @@
+import numpy as np
+
+from recorder import UNLABELED, SessionRecorder
+from replay import TRACE_FIELDS, evaluate, merge_traces, replay_config, replay_session
+from synthetic import SyntheticEMG
+
+
+def trace(labels, motions, rate=100):
+    n = len(labels)
+    ends = np.arange(1, n + 1) * 10
+    motions = np.asarray(motions)
+    previous = np.concatenate(([0], motions[:-1]))
+    return {'end': ends, 'time': ends / rate, 'motion': motions, 'label': np.asarray(labels),
+            'actuated': motions != previous, 'latency_ms': np.ones(n), 'duration': n / 10, 'wall': 0.1}
+
+
+def test_scores_against_the_labels():
+    config = replay_config()
+    scores = evaluate(trace([0, 0, 1, 1, 1, 0, 0, 1, 1, 0], [0, 0, 0, 1, 1, 0, 0, 0, 0, 0]), config)
+    assert scores['windows'] == 10
+    assert scores['accuracy'] == 0.7
+    assert scores['confusion'] == [[5, 0], [3, 2]]
+    assert scores['balanced_accuracy'] == (1.0 + 0.4) / 2
+    # The first onset was caught one window late, the second not at all
+    assert (scores['onsets']['count'], scores['onsets']['missed']) == (2, 1)
+    assert np.isclose(scores['onsets']['delay_p50_ms'], 100.0)
+    assert scores['transitions'] == {'predicted': 2, 'labelled': 4}
+
+
+def test_unlabelled_windows_are_not_scored():
+    config = replay_config()
+    assert evaluate(trace([UNLABELED] * 5, [0, 1, 1, 0, 0]), config) == {'windows': 0}
+    mixed = merge_traces([trace([UNLABELED] * 5, [1] * 5), trace([0, 1], [0, 1])])
+    assert set(TRACE_FIELDS) <= set(mixed)
+    scores = evaluate(mixed, config)
+    assert scores['windows'] == 2
+    assert scores['accuracy'] == 1.0
+
+
+def test_replay_session(tmp_path):
+    rate = 1000
+    samples, labels = SyntheticEMG(rate, 1, seed=11).generate(20 * rate)
+    labelled, plain = str(tmp_path / 'cued.emg'), str(tmp_path / 'plain.emg')
+    with SessionRecorder(labelled, rate, 1) as rec:
+        rec.write(samples, timestamps=np.arange(len(samples)) / rate, labels=labels)
+    with SessionRecorder(plain, rate, 1) as rec:
+        rec.write(samples, timestamps=np.arange(len(samples)) / rate)
+
+    config = replay_config(window=200, hop_ms=25)
+    result = replay_session(labelled, config)
+    # A decision every 25 ms once the first window is full
+    np.testing.assert_array_equal(np.diff(result['end']), 25)
+    np.testing.assert_array_equal(result['label'], labels[result['end'] - 1])
+    assert evaluate(result, config)['accuracy'] > 0.8
+
+    result = replay_session(plain, config)
+    assert len(result['end']) > 0
+    assert evaluate(result, config) == {'windows': 0}
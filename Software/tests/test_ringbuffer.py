@@ -0,0 +1,97 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from acquisition import CAPACITY, HEADER_SIZE, HEADER_SLOTS, N_CHANNELS, SAMPLE_RATE, RingReader, SharedRing
+from ringbuffer import RingBuffer
+
+
+def stream(n, n_channels):
+    return np.arange(n * n_channels, dtype=np.float32).reshape(n, n_channels)
+
+
+def write_in_blocks(ring, data, sizes):
+    pos = 0
+    for size in sizes:
+        ring.extend(data[pos:pos + size])
+        pos += size
+    return pos
+
+
+def test_append_and_extend_wrap_around():
+    data = stream(1000, 3)
+    by_block = RingBuffer(64, 3, window=16)
+    by_sample = RingBuffer(64, 3, window=16)
+    n = write_in_blocks(by_block, data, [1, 7, 63, 64, 5, 200, 30, 100])
+    for sample in data[:n]:
+        by_sample.append(sample)
+
+    for ring in (by_block, by_sample):
+        assert ring.count == n
+        assert len(ring) == 64
+        np.testing.assert_array_equal(ring.latest(), data[n - 64:n])
+        np.testing.assert_array_equal(ring.latest(10), data[n - 10:n])
+        np.testing.assert_array_equal(ring.get_window(), data[n - 16:n])
+        np.testing.assert_array_equal(ring.get_window(n - 40), data[n - 56:n - 40])
+        # Overwritten already, or not there yet
+        assert ring.get_window(n - 60) is None
+        assert ring.get_window(n + 1) is None
+        # Both copies agree, so every view is contiguous
+        np.testing.assert_array_equal(ring.data[:64], ring.data[64:])
+
+
+def test_windows_by_hop():
+    ring = RingBuffer(32, 1, window=8, hop=4)
+    data = stream(40, 1)
+    ring.extend(data[:7])
+    assert ring.next_window() is None
+    ring.extend(data[7:8])
+    np.testing.assert_array_equal(ring.next_window(), data[:8])
+    assert ring.next_window() is None
+    # Skipped hops are dropped, only the newest window comes out
+    ring.extend(data[8:20])
+    assert ring.windows_ready() == 3
+    np.testing.assert_array_equal(ring.next_window(), data[12:20])
+    assert ring.windows_ready() == 0
+
+
+@pytest.fixture
+def shm():
+    capacity, n_channels = 64, 2
+    size = HEADER_SIZE + 2 * capacity * n_channels * 4
+    block = shared_memory.SharedMemory(create=True, size=size)
+    header = np.ndarray((HEADER_SLOTS,), dtype=np.int64, buffer=block.buf)
+    header[:] = 0
+    header[CAPACITY] = capacity
+    header[N_CHANNELS] = n_channels
+    header[SAMPLE_RATE] = 1000
+    yield block
+    del header
+    block.close()
+    block.unlink()
+
+
+def test_shared_ring_wrap_around(shm):
+    ring = SharedRing(shm)
+    reader = RingReader(shm=shm)
+    data = stream(600, 2)
+    pos = 0
+    for size in [5, 60, 64, 1, 33, 63, 3]:
+        ring.extend(data[pos:pos + size])
+        np.testing.assert_array_equal(reader.read(), data[pos:pos + size])
+        pos += size
+    assert reader.dropped == 0
+
+    # A reader that falls a lap behind gets the newest capacity samples
+    ring.extend(data[pos:pos + 100])
+    pos += 100
+    np.testing.assert_array_equal(reader.read(), data[pos - 64:pos])
+    assert reader.dropped == 36
+    assert reader.last_start == pos - 64
+
+    assert reader.count == ring.count == pos
+    np.testing.assert_array_equal(reader.latest(20), data[pos - 20:pos])
+    np.testing.assert_array_equal(ring.latest(), data[pos - 64:pos])
+    np.testing.assert_array_equal(ring.data[:64], ring.data[64:])
+    del ring, reader
@@ -0,0 +1,71 @@
+import time
+
+import numpy as np
+
+from ringbuffer import RingBuffer
+from scheduler import InferenceScheduler
+
+
+def make(window=10, hop=4, max_batch=3):
+    scheduler = InferenceScheduler(100, window, hop, max_batch=max_batch)
+    ring = RingBuffer(scheduler.buffer_capacity(), 1, window=window, hop=hop)
+    return scheduler, ring
+
+
+def test_due_every_hop_once_the_window_is_full():
+    scheduler, ring = make()
+    data = np.arange(40, dtype=np.float32)
+    ring.extend(data[:9])
+    assert len(scheduler.due(ring)) == 0
+    ring.extend(data[9:10])
+    np.testing.assert_array_equal(scheduler.due(ring), [10])
+    ring.extend(data[10:13])
+    assert len(scheduler.due(ring)) == 0
+    ring.extend(data[13:14])
+    np.testing.assert_array_equal(scheduler.due(ring), [14])
+    assert scheduler.decisions == 2
+
+
+def test_backlog_comes_back_as_one_batch():
+    scheduler, ring = make()
+    data = np.arange(200, dtype=np.float32)
+    ring.extend(data[:10])
+    scheduler.due(ring)
+    ring.extend(data[10:22])
+    ends = scheduler.due(ring)
+    np.testing.assert_array_equal(ends, [14, 18, 22])
+    windows = scheduler.windows(ring, ends)
+    assert windows.shape == (3, 10, 1)
+    for end, window in zip(ends, windows):
+        np.testing.assert_array_equal(window[:, 0], data[end - 10:end])
+
+
+def test_older_windows_than_max_batch_are_skipped():
+    scheduler, ring = make(max_batch=3)
+    data = np.arange(200, dtype=np.float32)
+    ring.extend(data[:10])
+    scheduler.due(ring)
+    # Six hops at once, only the newest three are kept
+    ring.extend(data[10:34])
+    ends = scheduler.due(ring)
+    np.testing.assert_array_equal(ends, [26, 30, 34])
+    assert scheduler.skipped == 3
+    np.testing.assert_array_equal(scheduler.windows(ring, ends)[0][:, 0], data[16:26])
+
+
+def test_wait_paces_by_deadline():
+    scheduler = InferenceScheduler.from_ms(1000, window_ms=100, hop_ms=10)
+    assert (scheduler.window, scheduler.hop) == (100, 10)
+    scheduler.wait()
+    start = time.perf_counter()
+    for _ in range(5):
+        # Work done between waits comes out of the sleep, not on top of it
+        time.sleep(0.004)
+        scheduler.wait()
+    elapsed = time.perf_counter() - start
+    assert 0.045 < elapsed < 0.15
+    assert scheduler.late == 0
+
+    time.sleep(0.05)
+    scheduler.wait()
+    assert scheduler.late == 1
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from recorder import SessionRecorder
+from session import Session
+
+
+@pytest.fixture
+def recording(tmp_path):
+    path = str(tmp_path / 'run.emg')
+    samples = np.arange(3000, dtype=np.float32).reshape(-1, 3)
+    labels = np.repeat([0, 1, 0, 2], [200, 300, 100, 400]).astype(np.int16)
+    with SessionRecorder(path, 1000, ['flexor', 'extensor', 'thumb'], labels={0: 'rest', 1: 'open', 2: 'close'}) as rec:
+        rec.write(samples, timestamps=np.arange(1000) / 1000, labels=labels)
+    return path, samples, labels
+
+
+def test_reads_what_was_recorded(recording):
+    path, samples, labels = recording
+    session = Session(path)
+    assert len(session) == 1000 and session.duration == 1.0
+    assert session.label_names == {-1: 'unlabeled', 0: 'rest', 1: 'open', 2: 'close'}
+    np.testing.assert_array_equal(session.slice(10, 20, 'extensor'), samples[10:20, 1])
+    np.testing.assert_array_equal(session.slice(channels=['thumb', 0]), samples[:, [2, 0]])
+    assert session.label_spans() == [(0, 200, 0), (200, 500, 1), (500, 600, 0), (600, 1000, 2)]
+    session.close()
+
+
+def test_windows_are_views(recording):
+    path, samples, _ = recording
+    session = Session(path)
+    windows = session.windows(100, 25, channels=slice(0, 2))
+    assert windows.shape == (37, 100, 2)
+    assert not windows.flags.owndata
+    np.testing.assert_array_equal(windows[3], samples[75:175, :2])
+    np.testing.assert_array_equal(session.window_starts(100, 25)[[0, -1]], [0, 900])
+
+    batches = list(session.iter_windows(100, 25, batch=10))
+    assert [len(starts) for starts, _ in batches] == [10, 10, 10, 7]
+    starts, last = batches[-1]
+    np.testing.assert_array_equal(last[-1], samples[starts[-1]:starts[-1] + 100])
+    assert session.windows(2000, 25).shape == (0, 2000, 3)
+    session.close()
+
+
+def test_reads_a_session_still_being_written(tmp_path):
+    path = str(tmp_path / 'live.emg')
+    rec = SessionRecorder(path, 100, 1, flush_interval=0)
+    rec.write(np.arange(50))
+    session = Session(path)
+    # Counted from the file size, the header still says 0
+    assert len(session) == 50
+    np.testing.assert_array_equal(session.samples[:, 0], np.arange(50))
+    session.close()
+    rec.close()